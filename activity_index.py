@@ -0,0 +1,89 @@
+import math
+import time
+import array
+from bisect import bisect_left, bisect_right
+from itertools import filterfalse, islice
+from typing import Container, List, Optional, Tuple
+from conversation_table import ConversationTable
+
+DAY = 86400
+# Upper bounds (in days since the last message) of the activity histogram buckets
+HISTOGRAM_DAYS = (1, 7, 30, 90, 180, 365)
+
+
+class ActivityIndex:
+    """Conversations sorted by last_message_date for range counts in O(log n).
+
+    `dates` is ascending and `ids` is aligned with it, so the peers whose last
+    message falls in [min_days, max_days] ago are one contiguous slice found
+    with two bisects. Build it once per sync (or whenever `generation` no
+    longer matches the store's) and reuse it for previews and for selecting
+    the campaign's recipients.
+    """
+
+    def __init__(self, ids: array.array, dates: array.array, generation: Optional[int] = None):
+        self.ids = ids
+        self.dates = dates
+        self.generation = generation
+
+    @classmethod
+    def from_table(cls, table: ConversationTable) -> "ActivityIndex":
+        # Tables from the store are already newest first, which timsort handles in linear time
+        order = sorted(range(len(table)), key=table.dates.__getitem__)
+        return cls(
+            array.array("q", map(table.ids.__getitem__, order)),
+            array.array("q", map(table.dates.__getitem__, order)),
+            table.generation
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def bounds(
+        self, min_days: Optional[float] = None, max_days: Optional[float] = None, now: Optional[float] = None
+    ) -> Tuple[int, int]:
+        """Slice [lo, hi) of peers last active between min_days and max_days ago (None = unbounded).
+
+        Rounds the same way as conversation_table.date_range, so counts match filter_users.
+        """
+        now = time.time() if now is None else now
+        lo = 0 if max_days is None else bisect_left(self.dates, math.ceil(now - max_days * DAY))
+        hi = len(self.dates) if min_days is None else bisect_right(self.dates, math.floor(now - min_days * DAY))
+        return lo, max(lo, hi)
+
+    def count(
+        self, min_days: Optional[float] = None, max_days: Optional[float] = None, now: Optional[float] = None
+    ) -> int:
+        lo, hi = self.bounds(min_days, max_days, now)
+        return hi - lo
+
+    def select(
+        self,
+        min_days: Optional[float] = None,
+        max_days: Optional[float] = None,
+        limit: int = 0,
+        exclude: Optional[Container[int]] = None,
+        now: Optional[float] = None
+    ) -> List[int]:
+        """Ids in the range, most recently active first, skipping `exclude`."""
+        lo, hi = self.bounds(min_days, max_days, now)
+        ids = reversed(self.ids[lo:hi])
+        if exclude is not None and len(exclude):
+            ids = filterfalse(exclude.__contains__, ids)
+        if limit > 0:
+            ids = islice(ids, limit)
+        return list(ids)
+
+    def histogram(self, days: Tuple[int, ...] = HISTOGRAM_DAYS, now: Optional[float] = None) -> List[int]:
+        """Peer counts per age bucket: [0, days[0]), [days[0], days[1]), ..., [days[-1], ∞)."""
+        now = time.time() if now is None else now
+        total = len(self.dates)
+        counts = []
+        previous = 0
+        for bound in days:
+            # Younger than `bound` days: date > now - bound days
+            younger = total - bisect_right(self.dates, now - bound * DAY)
+            counts.append(younger - previous)
+            previous = younger
+        counts.append(total - previous)
+        return counts
@@ -0,0 +1,234 @@
+"""Throughput benchmarks for VKManager against the local fake VK server.
+
+    python benchmark.py --conversations 1000000 --recipients 50000 --output bench.json
+    python benchmark.py --compare bench.json
+
+Prints one JSON document: throughput, p50/p99 latency and peak traced memory
+for fetch_conversations, filter_users, upload_photo and mailing_loop.
+With --compare, benchmarks whose throughput dropped by more than
+--tolerance against the baseline file are listed on stderr and the exit
+code is 1.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from fake_vk_server import FakeVkServer, parse_error_rates
+from vk_logic import VKManager
+from conversation_table import ConversationTable
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class LatencyRecorder:
+    """Wraps AsyncVkApi.method to time every API call, keyed by method name."""
+
+    def __init__(self, api):
+        self.samples: Dict[str, List[float]] = {}
+        self.method = api.method
+        api.method = self.timed
+
+    async def timed(self, method: str, values: Optional[Dict[str, Any]] = None, raw: bool = False):
+        started = time.perf_counter()
+        try:
+            return await self.method(method, values, raw)
+        finally:
+            self.samples.setdefault(method, []).append(time.perf_counter() - started)
+
+    def take(self, *methods: str) -> List[float]:
+        """Samples of `methods` recorded so far; clears them."""
+        return [s for method in methods for s in self.samples.pop(method, [])]
+
+
+async def measure(
+    name: str,
+    run: Callable[[], Awaitable[int]],
+    latencies: Callable[[], List[float]],
+    trace_memory: bool = True
+) -> Dict[str, Any]:
+    """Runs one benchmark; `run` returns the number of items processed."""
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    items = await run()
+    elapsed = time.perf_counter() - started
+    peak = 0
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    samples = latencies()
+    result = {
+        'items': items,
+        'seconds': round(elapsed, 4),
+        'throughput': round(items / elapsed, 2) if elapsed > 0 else 0.0,
+        'calls': len(samples),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'peak_memory_bytes': peak,
+    }
+    print(f"{name}: {result['throughput']} items/s, p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms", file=sys.stderr)
+    return result
+
+
+async def run_benchmarks(args: argparse.Namespace) -> Dict[str, Any]:
+    server = None
+    api_url = args.url
+    if not api_url:
+        server = FakeVkServer(
+            conversations=args.conversations,
+            latency=args.latency,
+            jitter=args.jitter,
+            error_rates=parse_error_rates(args.error),
+            seed=args.seed
+        )
+        await server.start()
+        api_url = server.api_url
+
+    manager = VKManager("benchmark", 1, rps=args.rps, burst=args.burst, api_url=api_url)
+    recorder = LatencyRecorder(manager.api)
+    results: Dict[str, Any] = {}
+    state: Dict[str, Any] = {}
+    try:
+        async def fetch():
+            state['conversations'] = await manager.fetch_conversations(batched=True, parallel=args.parallel)
+            return len(state['conversations'])
+        results['fetch_conversations'] = await measure(
+            'fetch_conversations', fetch, lambda: recorder.take('execute'), args.memory
+        )
+
+        filter_times: List[float] = []
+        # The app filters the columnar table loaded from the conversation store
+        table = ConversationTable.from_dicts(state['conversations'])
+
+        async def filter_runs():
+            for _ in range(args.filter_runs):
+                started = time.perf_counter()
+                state['recipients'] = await manager.filter_users(table, "activity", min_days=0, max_days=365)
+                filter_times.append(time.perf_counter() - started)
+            return len(table) * args.filter_runs
+        results['filter_users'] = await measure('filter_users', filter_runs, lambda: filter_times, args.memory)
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for n in range(args.uploads):
+                path = os.path.join(directory, f"{n}.jpg")
+                with open(path, "wb") as f:
+                    f.write(n.to_bytes(4, "big") * (args.upload_size // 4))
+                paths.append(path)
+            upload_times: List[float] = []
+
+            async def upload():
+                semaphore = asyncio.Semaphore(args.concurrency)
+
+                async def one(path):
+                    async with semaphore:
+                        started = time.perf_counter()
+                        attachment = await manager.upload_photo(path)
+                        upload_times.append(time.perf_counter() - started)
+                        return attachment
+                return sum(1 for a in await asyncio.gather(*(one(p) for p in paths)) if a)
+            results['upload_photo'] = await measure('upload_photo', upload, lambda: upload_times, args.memory)
+            recorder.take('photos.getMessagesUploadServer', 'photos.saveMessagesPhoto')
+
+        recipients = state['recipients'][:args.recipients]
+
+        async def mail():
+            await manager.mailing_loop(
+                recipients, "Benchmark", 0, lambda *_: None,
+                batch_size=args.batch_size, concurrency=args.concurrency
+            )
+            return len(recipients)
+        results['mailing_loop'] = await measure(
+            'mailing_loop', mail, lambda: recorder.take('messages.send'), args.memory
+        )
+        results['mailing_loop']['failures'] = dict(
+            (str(code), count) for code, count in manager.failure_stats.items()
+        )
+        results['mailing_loop']['dead_letters'] = len(manager.dead_letters)
+        api_metrics = manager.metrics.to_dict()
+    finally:
+        await manager.close()
+        if server:
+            await server.stop()
+
+    return {
+        'meta': {
+            'timestamp': int(time.time()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'params': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        },
+        'results': results,
+        'api_metrics': api_metrics,
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Benchmarks whose throughput fell more than `tolerance` (0.2 = 20%) below the baseline."""
+    regressions = []
+    for name, old in baseline.get('results', {}).items():
+        new = report['results'].get(name)
+        if not new or not old.get('throughput'):
+            continue
+        ratio = new['throughput'] / old['throughput']
+        if ratio < 1 - tolerance:
+            regressions.append(f"{name}: {old['throughput']} -> {new['throughput']} items/s ({ratio:.0%})")
+    return regressions
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="VKManager benchmarks against a fake VK API.")
+    parser.add_argument("--url", help="API URL of an already running fake_vk_server.py")
+    parser.add_argument("--conversations", type=int, default=100_000)
+    parser.add_argument("--recipients", type=int, default=10_000, help="how many to mail")
+    parser.add_argument("--uploads", type=int, default=20)
+    parser.add_argument("--upload-size", type=int, default=512 * 1024, help="bytes per uploaded file")
+    parser.add_argument("--filter-runs", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--parallel", type=int, default=3, help="parallel execute calls while fetching")
+    parser.add_argument("--rps", type=float, default=1000, help="client rate limit")
+    parser.add_argument("--burst", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error", action="append", help="CODE=RATE, e.g. 6=0.01")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip tracemalloc (it slows allocation)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON report")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    report = asyncio.run(run_benchmarks(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,475 @@
+import os
+import copy
+import json
+import asyncio
+from typing import Any, AsyncIterable, Callable, Dict, List, Optional, Tuple, Union
+from vk_logic import VKManager, MAX_PEER_IDS, MAX_ATTACHMENTS
+from conversation_store import ConversationStore
+from longpoll import BotsLongPoll
+from campaign_journal import CampaignJournal
+from suppression import SuppressionList
+from profiles import MessageTemplate
+from upload_cache import UploadCache
+from metrics import Metrics
+from activity_index import ActivityIndex
+from frequency_cap import SendHistory, SLOTS
+from simulator import ApiModel, simulate, summary
+
+FILTER_TYPES = ("all", "activity")
+
+
+class CampaignSettings:
+    """What to send and to whom; filled from the GUI form, CLI flags or a campaign file."""
+
+    FIELDS = (
+        'message', 'attachment', 'files', 'filter_type', 'min_days', 'max_days', 'limit',
+        'text_contains', 'interval', 'concurrency', 'batch', 'stream', 'personalize', 'test_mode',
+        'max_sends', 'per_days'
+    )
+
+    def __init__(
+        self,
+        message: str = "",
+        attachment: str = "",
+        files: Optional[List[str]] = None,
+        filter_type: str = "all",
+        min_days: int = 0,
+        max_days: int = 365,
+        limit: int = 0,
+        text_contains: str = "",
+        interval: float = 0,
+        concurrency: int = 4,
+        batch: bool = False,
+        stream: bool = False,
+        personalize: bool = False,
+        test_mode: bool = False,
+        max_sends: int = 0,
+        per_days: float = 7
+    ):
+        self.message = message or ""
+        self.attachment = attachment or ""
+        self.files = list(files or [])
+        self.filter_type = filter_type
+        self.min_days = int(min_days)
+        self.max_days = int(max_days)
+        self.limit = int(limit)
+        self.text_contains = text_contains or ""
+        self.interval = float(interval)
+        self.concurrency = int(concurrency)
+        self.batch = bool(batch)
+        self.stream = bool(stream)
+        self.personalize = bool(personalize)
+        self.test_mode = bool(test_mode)
+        # Frequency cap: skip users sent `max_sends` messages in the last `per_days` (0 = off)
+        self.max_sends = int(max_sends)
+        self.per_days = float(per_days)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CampaignSettings":
+        """Unknown keys are rejected so a typo in a campaign file is not silently ignored."""
+        unknown = set(data) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"Неизвестные параметры рассылки: {', '.join(sorted(unknown))}")
+        return cls(**data)
+
+    @classmethod
+    def from_file(cls, path: str) -> "CampaignSettings":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @property
+    def attachments(self) -> List[str]:
+        return [a.strip() for a in self.attachment.split(",") if a.strip()]
+
+    @property
+    def filters(self) -> Dict[str, Any]:
+        return {
+            'min_days': self.min_days,
+            'max_days': self.max_days,
+            'limit': self.limit,
+            'text_contains': self.text_contains
+        }
+
+    @property
+    def frequency_cap(self) -> Optional[Tuple[int, float]]:
+        return (self.max_sends, self.per_days) if self.max_sends > 0 else None
+
+    def validate(self):
+        """Raises ValueError with a message for the user."""
+        if not self.message and not self.attachments and not self.files:
+            raise ValueError("Сообщение и вложения пусты.")
+        if len(self.attachments) + len(self.files) > MAX_ATTACHMENTS:
+            raise ValueError(f"не более {MAX_ATTACHMENTS} вложений в сообщении.")
+        if self.filter_type not in FILTER_TYPES:
+            raise ValueError(f"Неизвестная категория: {self.filter_type}")
+        if self.concurrency < 1:
+            raise ValueError("Число запросов должно быть больше нуля.")
+        if self.max_sends > SLOTS:
+            raise ValueError(f"ограничение частоты — не более {SLOTS} сообщений за период.")
+        if self.max_sends > 0 and self.per_days <= 0:
+            raise ValueError("Период ограничения частоты должен быть больше нуля.")
+        if self.personalize:
+            try:
+                MessageTemplate(self.message)
+            except ValueError as e:
+                raise ValueError(f"некорректный шаблон сообщения ({e})")
+
+
+class CampaignRunner:
+    """Campaign flow shared by the Flet window and the headless CLI.
+
+    Owns the VKManager and the per-group data files (conversation index,
+    suppression list, upload cache, campaign journals); the front end only
+    supplies settings, a `log` callback and a progress callback.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        group_id: int,
+        data_dir: str,
+        log: Callable[[str], None] = print,
+        metrics: Optional[Metrics] = None
+    ):
+        self.data_dir = data_dir
+        self.campaigns_dir = os.path.join(data_dir, "campaigns")
+        self.log = log
+        # Through self.log, so a front end may swap the callback later
+        self.manager = VKManager(token, group_id, metrics=metrics, log=lambda message: self.log(message))
+        self.manager.suppression = SuppressionList(
+            os.path.join(data_dir, f"suppressed_{group_id}.bin")
+        )
+        # Keys include the group id, so one file serves every group
+        self.manager.upload_cache = UploadCache(
+            os.path.join(data_dir, "upload_cache.json"), log=lambda message: self.log(message)
+        )
+        self.manager.send_history = SendHistory(os.path.join(data_dir, f"send_history_{group_id}.db"))
+        self.store = ConversationStore(
+            os.path.join(data_dir, f"conversations_{group_id}.db")
+        )
+        self.long_poll: Optional[BotsLongPoll] = None
+        self.activity_index: Optional[ActivityIndex] = None
+        self.index_lock = asyncio.Lock()
+        # Off when a coordinator shares one Metrics between runners and reports it itself
+        self.report_metrics = True
+        self.forked = False
+        # Latency/error model for dry runs (settings.test_mode)
+        self.api_model = ApiModel()
+
+    def create_long_poll(self) -> BotsLongPoll:
+        """Long Poll consumer keeping the conversation index fresh; run it with `long_poll.run()`."""
+        self.long_poll = BotsLongPoll(self.manager, self.store)
+        return self.long_poll
+
+    def fork(
+        self,
+        rate_limiter=None,
+        log: Optional[Callable[[str], None]] = None,
+        metrics: Optional[Metrics] = None
+    ) -> "CampaignRunner":
+        """A runner for another concurrent campaign of the same group.
+
+        It gets its own VKManager (stop flag, failure stats, dead letters,
+        HTTP session) sending through `rate_limiter`, but shares this runner's
+        store, suppression list, upload cache, send history and profiles.
+        `log` and `metrics` default to this runner's.
+        """
+        runner = copy.copy(self)
+        runner.log = log or self.log
+        manager = VKManager(
+            self.manager.token,
+            self.manager.group_id,
+            api_url=self.manager.api.api_url,
+            metrics=metrics or self.manager.metrics,
+            rate_limiter=rate_limiter or self.manager.rate_limiter,
+            log=lambda message: runner.log(message)
+        )
+        manager.suppression = self.manager.suppression
+        manager.upload_cache = self.manager.upload_cache
+        manager.send_history = self.manager.send_history
+        manager.profiles = self.manager.profiles
+        runner.manager = manager
+        runner.report_metrics = False
+        runner.forked = True
+        return runner
+
+    async def close(self):
+        if self.forked:
+            # The store and Long Poll belong to the runner this one was forked from
+            await self.manager.close()
+            return
+        if self.long_poll:
+            self.long_poll.stop()
+        self.manager.suppression.save()
+        await self.manager.close()
+        self.store.close()
+        self.manager.send_history.close()
+
+    def stop(self):
+        self.manager.stop()
+
+    async def upload_attachments(self, settings: CampaignSettings) -> Optional[str]:
+        """Uploads `settings.files` and returns the full attachment string, or None on failure."""
+        attachments = settings.attachments
+        if settings.files and settings.test_mode:
+            # A dry run uploads nothing; placeholders keep the attachment count right
+            self.log(f"Симуляция: файлы не загружаются ({len(settings.files)}).")
+            attachments.extend(f"doc0_{n}" for n in range(len(settings.files)))
+        elif settings.files:
+            self.log(f"Загрузка файлов: {len(settings.files)}...")
+            uploaded_ids = await self.manager.upload_files(settings.files)
+            for path, uploaded_id in zip(settings.files, uploaded_ids):
+                if uploaded_id:
+                    self.log(f"Файл {os.path.basename(path)} загружен: {uploaded_id}")
+                else:
+                    self.log(f"Ошибка при загрузке файла {os.path.basename(path)}.")
+            if not all(uploaded_ids):
+                return None
+            attachments.extend(uploaded_ids)
+        return ",".join(attachments)
+
+    async def select_recipients(
+        self, settings: CampaignSettings
+    ) -> Optional[Union[List[int], AsyncIterable[List[int]]]]:
+        """Recipients matching the filters: a list, or a stream of id pages in streaming mode."""
+        mode_str = "(СИМУЛЯЦИЯ)" if settings.test_mode else ""
+        index_is_live = self.long_poll and self.long_poll.is_live
+
+        if settings.stream and not index_is_live:
+            # Pages go straight from the API through the filter into the send queue
+            self.log(f"Потоковый режим: отправка начнётся с первой страницы диалогов {mode_str}...")
+            return self.manager.stream_recipients(
+                settings.filter_type, store=self.store, frequency_cap=settings.frequency_cap, **settings.filters
+            )
+
+        table = None
+        if index_is_live:
+            self.log("Диалоги актуальны (Long Poll), синхронизация не требуется.")
+        else:
+            self.log(f"Синхронизация диалогов (в базе: {self.store.count()})...")
+            table = await self.manager.sync_conversations(self.store, parallel=3, as_table=True)
+            self.activity_index = await asyncio.to_thread(ActivityIndex.from_table, table)
+        index = await self.get_activity_index()
+        if not len(index):
+            self.log("Диалоги не найдены или произошла ошибка.")
+            return None
+
+        cap = settings.frequency_cap
+        # With a frequency cap the limit is applied after it, so capped users do not count
+        limit = 0 if cap else settings.limit
+        if settings.text_contains:
+            if table is None:
+                table = await asyncio.to_thread(self.store.load_table)
+            user_ids = await self.manager.filter_users(
+                table, settings.filter_type, **dict(settings.filters, limit=limit)
+            )
+        else:
+            # Same slice the audience preview counted; no pass over the whole table
+            user_ids = index.select(*self.day_range(settings), limit=limit, exclude=self.manager.suppression)
+        if cap and user_ids:
+            matched = len(user_ids)
+            user_ids = await asyncio.to_thread(
+                self.manager.send_history.allowed, user_ids, *cap, limit=settings.limit
+            )
+            if not settings.limit:
+                self.log(f"Пропущено по ограничению частоты ({cap[0]} за {cap[1]:g} дн.): {matched - len(user_ids)}.")
+        if not user_ids:
+            self.log("Нет пользователей, подходящих под фильтры.")
+            return None
+
+        self.log(f"Найдено {len(user_ids)} пользователей. Запуск рассылки {mode_str}...")
+        return user_ids
+
+    async def get_activity_index(self) -> ActivityIndex:
+        """The activity index, rebuilt from the store only if the store changed since."""
+        async with self.index_lock:
+            index = self.activity_index
+            if index is None or index.generation != self.store.generation:
+                table = await asyncio.to_thread(self.store.load_table)
+                index = self.activity_index = await asyncio.to_thread(ActivityIndex.from_table, table)
+            return index
+
+    @staticmethod
+    def day_range(settings: CampaignSettings) -> Tuple[Optional[int], Optional[int]]:
+        if settings.filter_type == "activity":
+            return settings.min_days, settings.max_days
+        return None, None
+
+    async def preview(self, settings: CampaignSettings) -> Tuple[int, List[int]]:
+        """Audience size and activity histogram from the local index, without API calls.
+
+        The count ignores the text filter, the suppression list and the frequency cap.
+        """
+        index = await self.get_activity_index()
+        count = index.count(*self.day_range(settings))
+        if settings.limit > 0:
+            count = min(count, settings.limit)
+        return count, index.histogram()
+
+    async def prepare(
+        self, settings: CampaignSettings
+    ) -> Optional[Tuple[str, Union[List[int], AsyncIterable[List[int]]]]]:
+        """Validates settings, uploads files and selects recipients.
+
+        Returns (attachment, recipients), or None if the campaign cannot start.
+        """
+        try:
+            settings.validate()
+        except ValueError as e:
+            self.log(f"Ошибка: {e}")
+            return None
+
+        attachment = await self.upload_attachments(settings)
+        if attachment is None:
+            return None
+        user_ids = await self.select_recipients(settings)
+        if user_ids is None:
+            return None
+        return attachment, user_ids
+
+    async def send(
+        self,
+        settings: CampaignSettings,
+        attachment: str,
+        user_ids: Union[List[int], AsyncIterable[List[int]]],
+        on_progress: Callable[[int, int, str], None]
+    ):
+        if settings.test_mode:
+            await self.simulate(settings, attachment, user_ids, on_progress)
+            return
+        batch_size = MAX_PEER_IDS if settings.batch else 1
+        journal = CampaignJournal.create(
+            self.campaigns_dir,
+            user_ids if isinstance(user_ids, list) else [],
+            settings.message,
+            attachment=attachment,
+            batch_size=batch_size,
+            personalize=settings.personalize,
+            group_id=self.manager.group_id
+        )
+        self.log(f"Рассылка {journal.campaign_id} начата.")
+        if self.report_metrics:
+            self.manager.metrics.reset()
+        try:
+            await self.manager.mailing_loop(
+                user_ids,
+                settings.message,
+                settings.interval,
+                on_progress,
+                attachment=attachment,
+                batch_size=batch_size,
+                concurrency=settings.concurrency,
+                journal=journal,
+                personalize=settings.personalize
+            )
+        finally:
+            journal.close()
+            self.export_dead_letters(journal)
+            self.log_metrics()
+
+    async def simulate(
+        self,
+        settings: CampaignSettings,
+        attachment: str,
+        user_ids: Union[List[int], AsyncIterable[List[int]]],
+        on_progress: Callable[[int, int, str], None]
+    ) -> Dict[str, Any]:
+        """Dry run on a virtual clock with `self.api_model`; nothing is sent.
+
+        Logs the projected duration, request count and failures and returns the report.
+        """
+        if not isinstance(user_ids, list):
+            user_ids = [user_id async for page in user_ids for user_id in page]
+        loop = asyncio.get_running_loop()
+
+        def progress(current: int, total: int, status: str):
+            loop.call_soon_threadsafe(on_progress, current, total, status)
+
+        report = await asyncio.to_thread(
+            simulate,
+            user_ids,
+            settings.message,
+            self.api_model,
+            progress,
+            attachment=attachment,
+            interval=settings.interval,
+            batch_size=MAX_PEER_IDS if settings.batch else 1,
+            concurrency=settings.concurrency,
+            personalize=settings.personalize,
+            rps=getattr(self.manager.rate_limiter, 'max_rps', 15)
+        )
+        self.log(f"Симуляция завершена за {report['wall_seconds']} с, ничего не отправлено:")
+        for line in summary(report):
+            self.log(f"  {line}")
+        return report
+
+    async def run(self, settings: CampaignSettings, on_progress: Callable[[int, int, str], None]) -> bool:
+        """Runs a whole campaign; returns False if it could not be started."""
+        prepared = await self.prepare(settings)
+        if prepared is None:
+            return False
+        await self.send(settings, *prepared, on_progress)
+        return True
+
+    def find_unfinished(self) -> Optional[str]:
+        return CampaignJournal.find_unfinished(self.campaigns_dir, self.manager.group_id)
+
+    async def resume(
+        self,
+        on_progress: Callable[[int, int, str], None],
+        interval: float = 0,
+        concurrency: int = 4,
+        path: Optional[str] = None
+    ) -> bool:
+        """Continues an interrupted campaign (the latest one unless `path` is given)."""
+        path = path or self.find_unfinished()
+        if not path:
+            self.log("Нет прерванных рассылок.")
+            return False
+
+        journal = CampaignJournal.open(path)
+        if journal.group_id is not None and journal.group_id != self.manager.group_id:
+            journal.close()
+            self.log(f"Ошибка: рассылка {journal.campaign_id} была начата для группы {journal.group_id}.")
+            return False
+        try:
+            self.log(
+                f"Продолжение рассылки {journal.campaign_id}: "
+                f"доставлено {len(journal.delivered)}, осталось {len(journal.remaining())}."
+            )
+            if self.report_metrics:
+                self.manager.metrics.reset()
+            await self.manager.mailing_loop(
+                journal.user_ids,
+                journal.message,
+                interval,
+                on_progress,
+                attachment=journal.attachment,
+                batch_size=journal.batch_size,
+                concurrency=concurrency,
+                journal=journal,
+                personalize=journal.personalize
+            )
+        finally:
+            journal.close()
+            self.export_dead_letters(journal)
+            self.log_metrics()
+        return True
+
+    def log_metrics(self):
+        """Logs where the campaign's time went (API latency, waits, errors)."""
+        lines = self.manager.metrics.summary() if self.report_metrics else []
+        if lines:
+            self.log("Статистика запросов:")
+            for line in lines:
+                self.log(f"  {line}")
+
+    def export_dead_letters(self, journal: CampaignJournal):
+        path = self.manager.dead_letters.export_csv(
+            os.path.join(self.campaigns_dir, f"{journal.campaign_id}_failed.csv")
+        )
+        if path:
+            self.log(f"Недоставленные ({len(self.manager.dead_letters)}) сохранены в {path}")
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Set
+
+GROUP_ID_PATTERN = re.compile(rb'"group_id": (-?\d+|null)')
+
+
+def derive_random_id(campaign_id: str, position: int) -> int:
+    """Deterministic messages.send random_id for the recipient at `position` in a campaign.
+
+    A per-campaign base plus the position (of the first peer, for a peer_ids
+    chunk), so ids never collide within a campaign and a retried or resumed
+    send reuses its id, letting VK drop the duplicate.
+    """
+    digest = hashlib.blake2b(campaign_id.encode(), digest_size=8).digest()
+    # random_id is a signed int32 on the VK side; keep it positive and non-zero
+    return (int.from_bytes(digest, "big") + position) % 0x7FFFFFFF + 1
+
+
+class CampaignJournal:
+    """Append-only JSON-lines log of a campaign and its per-recipient outcomes.
+
+    The first line describes the campaign (message, attachment, recipients),
+    every following line records one delivery result. Writes are buffered and
+    fsynced in batches, so journaling costs almost nothing per send while a
+    crash loses at most the last unsynced batch.
+    """
+
+    def __init__(self, path: str, flush_every: int = 200, flush_interval: float = 1.0):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.campaign_id = ""
+        self.group_id: Optional[int] = None
+        self.message = ""
+        self.attachment = ""
+        self.batch_size = 1
+        self.personalize = False
+        self.user_ids: List[int] = []
+        self.delivered: Set[int] = set()
+        self.failed: Dict[int, Any] = {}
+        self.finished = False
+        self.pending = 0
+        self.last_flush = time.monotonic()
+        self.file = None
+
+    @classmethod
+    def create(
+        cls,
+        directory: str,
+        user_ids: List[int],
+        message: str,
+        attachment: str = "",
+        batch_size: int = 1,
+        personalize: bool = False,
+        group_id: Optional[int] = None,
+        **kwargs
+    ) -> "CampaignJournal":
+        """Starts a new campaign journal in `directory`."""
+        os.makedirs(directory, exist_ok=True)
+        campaign_id = uuid.uuid4().hex
+        journal = cls(os.path.join(directory, f"{campaign_id}.jsonl"), **kwargs)
+        journal.campaign_id = campaign_id
+        journal.group_id = group_id
+        journal.message = message
+        journal.attachment = attachment
+        journal.batch_size = batch_size
+        journal.personalize = personalize
+        journal.user_ids = list(user_ids)
+        journal.file = open(journal.path, "a", encoding="utf-8")
+        journal.write({
+            "type": "campaign",
+            "campaign_id": campaign_id,
+            "group_id": group_id,
+            "created": int(time.time()),
+            "message": message,
+            "attachment": attachment,
+            "batch_size": batch_size,
+            "personalize": personalize,
+            "user_ids": journal.user_ids
+        })
+        journal.flush()
+        return journal
+
+    @classmethod
+    def open(cls, path: str, **kwargs) -> "CampaignJournal":
+        """Replays an existing journal and reopens it for appending."""
+        journal = cls(path, **kwargs)
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn last line after a crash
+                    continue
+                journal.apply(record)
+        journal.file = open(path, "a", encoding="utf-8")
+        return journal
+
+    @staticmethod
+    def find_unfinished(directory: str, group_id: Optional[int] = None) -> Optional[str]:
+        """Path of the most recent campaign that did not run to completion.
+
+        With `group_id`, campaigns started for other groups are skipped.
+        """
+        if not os.path.isdir(directory):
+            return None
+        paths = sorted(
+            (os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".jsonl")),
+            key=os.path.getmtime,
+            reverse=True
+        )
+        for path in paths:
+            with open(path, "rb") as f:
+                if group_id is not None:
+                    # group_id sits near the start of the header, before the recipients
+                    match = GROUP_ID_PATTERN.search(f.read(256))
+                    if match and match.group(1) != b"null" and int(match.group(1)) != group_id:
+                        continue
+                # The finish marker is always the last complete line
+                f.seek(max(0, os.path.getsize(path) - 64))
+                if b'"finished"' not in f.read():
+                    return path
+        return None
+
+    def apply(self, record: Dict[str, Any]):
+        kind = record.get("type")
+        if kind == "campaign":
+            self.campaign_id = record["campaign_id"]
+            self.group_id = record.get("group_id")
+            self.message = record["message"]
+            self.attachment = record.get("attachment", "")
+            self.batch_size = record.get("batch_size", 1)
+            self.personalize = record.get("personalize", False)
+            self.user_ids = record["user_ids"]
+        elif kind == "recipients":
+            self.user_ids.extend(record["user_ids"])
+        elif kind == "finished":
+            self.finished = True
+        elif record.get("status") == "sent":
+            self.delivered.add(record["peer"])
+            self.failed.pop(record["peer"], None)
+        elif record.get("status") == "failed":
+            self.failed[record["peer"]] = record.get("code")
+
+    def write(self, record: Dict[str, Any]):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.pending += 1
+
+    def add_recipients(self, user_ids: List[int]):
+        """Appends recipients of a streamed campaign as they are discovered."""
+        record = {"type": "recipients", "user_ids": list(user_ids)}
+        self.apply(record)
+        self.write(record)
+
+    def record_results(self, results: Dict[int, Optional[Dict[str, Any]]]):
+        """Journals final outcomes: None for delivered peers, a failure record otherwise."""
+        for peer_id, failure in results.items():
+            if failure is None:
+                record = {"peer": peer_id, "status": "sent"}
+            else:
+                record = {"peer": peer_id, "status": "failed", "code": failure['code']}
+            self.apply(record)
+            self.write(record)
+        if self.pending >= self.flush_every or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def remaining(self) -> List[int]:
+        return [user_id for user_id in self.user_ids if user_id not in self.delivered]
+
+    def flush(self):
+        if self.file and self.pending:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.pending = 0
+        self.last_flush = time.monotonic()
+
+    def finish(self):
+        """Marks the campaign as completed so it is no longer offered for resume."""
+        self.finished = True
+        self.write({"type": "finished"})
+        self.flush()
+
+    def close(self):
+        if self.file:
+            self.flush()
+            self.file.close()
+            self.file = None
@@ -0,0 +1,80 @@
+import os
+import json
+from typing import Any, Callable, Dict, List, Optional
+from metrics import log_to_stderr
+
+
+def load_config(path: str, log: Callable[[str], None] = log_to_stderr) -> Dict[str, Any]:
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            log(f"Ошибка чтения {path}: {e}")
+    return {}
+
+
+def load_accounts(config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """(token, group) pairs from config.json.
+
+    Either an `accounts` list of {"vk_token", "vk_group_id", "name"} objects,
+    or the single `vk_token`/`vk_group_id` pair the settings dialog writes.
+    """
+    accounts = []
+    for account in config.get("accounts") or []:
+        if account.get("vk_token") and account.get("vk_group_id"):
+            accounts.append({
+                'name': account.get("name") or str(account["vk_group_id"]),
+                'vk_token': account["vk_token"],
+                'vk_group_id': int(account["vk_group_id"])
+            })
+    if not accounts and config.get("vk_token") and config.get("vk_group_id"):
+        accounts.append({
+            'name': str(config["vk_group_id"]),
+            'vk_token': config["vk_token"],
+            'vk_group_id': int(config["vk_group_id"])
+        })
+    return accounts
+
+
+class ConfigFile:
+    """config.json read once and kept in memory.
+
+    `update()` changes the cached copy and writes the whole file through
+    (to a temporary file, then renamed over the old one), so other keys such
+    as `accounts` survive and a crash mid-write never leaves half a file.
+    """
+
+    def __init__(self, path: str, log: Callable[[str], None] = log_to_stderr):
+        self.path = path
+        self.log = log
+        self._data: Optional[Dict[str, Any]] = None
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._data = load_config(self.path, self.log)
+        return self._data
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.data.get(key, default)
+
+    def accounts(self) -> List[Dict[str, Any]]:
+        return load_accounts(self.data)
+
+    def update(self, **values) -> bool:
+        data = dict(self.data, **values)
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=4)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            self.log(f"Ошибка сохранения {self.path}: {e}")
+            return False
+        self._data = data
+        return True
+
+    def reload(self):
+        """Drops the cached copy, e.g. after the file was edited by hand."""
+        self._data = None
@@ -0,0 +1,96 @@
+import sqlite3
+import threading
+from typing import List, Dict, Any, Iterable, Optional
+from conversation_table import ConversationTable
+
+
+class ConversationStore:
+    """Persistent conversation index (SQLite) keyed by peer id.
+
+    Keeps the last message date/text of every dialog plus a sync watermark,
+    so repeat campaigns only need to download conversations that changed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        # Bumped on every write, so derived indexes can tell they are stale
+        self.generation = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "id INTEGER PRIMARY KEY, "
+                "last_message_date INTEGER NOT NULL, "
+                "last_message_text TEXT NOT NULL DEFAULT '')"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_last_message_date "
+                "ON conversations (last_message_date DESC)"
+            )
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+
+    def upsert_many(self, conversations: Iterable[Dict[str, Any]]):
+        """Inserts or refreshes conversations, never moving a date backwards."""
+        rows = [
+            (c['id'], int(c['last_message_date']), c.get('last_message_text') or '')
+            for c in conversations
+        ]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO conversations (id, last_message_date, last_message_text) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET "
+                "last_message_date = excluded.last_message_date, "
+                "last_message_text = excluded.last_message_text "
+                "WHERE excluded.last_message_date >= conversations.last_message_date",
+                rows
+            )
+            self.generation += 1
+
+    def load(self) -> List[Dict[str, Any]]:
+        """Returns all conversations, newest first, in fetch_conversations format."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, last_message_date, last_message_text FROM conversations "
+                "ORDER BY last_message_date DESC"
+            ).fetchall()
+        return [
+            {'id': row[0], 'last_message_date': row[1], 'last_message_text': row[2]}
+            for row in rows
+        ]
+
+    def load_table(self) -> ConversationTable:
+        """Same as load(), but straight into columns without a dict per row."""
+        table = ConversationTable()
+        with self.lock:
+            cursor = self.conn.execute(
+                "SELECT id, last_message_date, last_message_text FROM conversations "
+                "ORDER BY last_message_date DESC"
+            )
+            for peer_id, date, text in cursor:
+                table.append(peer_id, date, text)
+            table.generation = self.generation
+        return table
+
+    def count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+    def get_watermark(self) -> Optional[int]:
+        """Date of the newest message seen by the last completed sync."""
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'watermark'").fetchone()
+        return int(row[0]) if row else None
+
+    def set_watermark(self, value: int):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('watermark', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (int(value),)
+            )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
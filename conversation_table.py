@@ -0,0 +1,98 @@
+import array
+import math
+import operator
+from functools import reduce
+from itertools import compress, islice, repeat
+from typing import Any, Callable, Container, Dict, Iterable, Iterator, List, Optional
+
+
+class ConversationTable:
+    """Conversations held column by column instead of one dict per row.
+
+    `ids` and `dates` are int64 arrays (8 bytes per value), texts a plain list.
+    """
+
+    def __init__(self, ids: Iterable[int] = (), dates: Iterable[int] = (), texts: Iterable[str] = ()):
+        self.ids = array.array("q", ids)
+        self.dates = array.array("q", dates)
+        self.texts = list(texts)
+        # ConversationStore.generation at load time, if the table came from a store
+        self.generation: Optional[int] = None
+
+    @classmethod
+    def from_dicts(cls, conversations: Iterable[Dict[str, Any]]) -> "ConversationTable":
+        table = cls()
+        for conv in conversations:
+            table.append(conv['id'], conv['last_message_date'], conv.get('last_message_text', ''))
+        return table
+
+    def append(self, peer_id: int, date: int, text: str = ""):
+        self.ids.append(peer_id)
+        self.dates.append(int(date))
+        self.texts.append(text or "")
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        for peer_id, date, text in zip(self.ids, self.dates, self.texts):
+            yield {'id': peer_id, 'last_message_date': date, 'last_message_text': text}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+# A predicate turns a table into a lazy boolean mask, one value per row.
+# Masks are built from bound C methods (`x.__le__`, `set.__contains__`) mapped
+# over whole columns, so no Python-level function runs per row.
+Predicate = Callable[[ConversationTable], Iterator[bool]]
+
+
+def date_range(min_date: float = None, max_date: float = None) -> Predicate:
+    """last_message_date within [min_date, max_date] (either bound optional)."""
+    def mask(table: ConversationTable) -> Iterator[bool]:
+        masks = []
+        if min_date is not None:
+            masks.append(map(math.ceil(min_date).__le__, table.dates))
+        if max_date is not None:
+            masks.append(map(math.floor(max_date).__ge__, table.dates))
+        return combine(masks) if masks else repeat(True, len(table))
+    return mask
+
+
+def id_in(allowed: Container[int]) -> Predicate:
+    def mask(table: ConversationTable) -> Iterator[bool]:
+        return map(allowed.__contains__, table.ids)
+    return mask
+
+
+def id_not_in(denied: Container[int]) -> Predicate:
+    def mask(table: ConversationTable) -> Iterator[bool]:
+        return map(operator.not_, map(denied.__contains__, table.ids))
+    return mask
+
+
+def contains_text(substring: str, ignore_case: bool = True) -> Predicate:
+    if ignore_case:
+        substring = substring.casefold()
+
+    def mask(table: ConversationTable) -> Iterator[bool]:
+        texts = map(str.casefold, table.texts) if ignore_case else table.texts
+        return map(operator.contains, texts, repeat(substring))
+    return mask
+
+
+def combine(masks: List[Iterator[bool]]) -> Iterator[bool]:
+    return reduce(lambda a, b: map(operator.and_, a, b), masks)
+
+
+def select(table: ConversationTable, predicates: List[Predicate], limit: int = 0) -> List[int]:
+    """Ids of rows matching every predicate, in table order.
+
+    All masks are consumed lazily in a single pass, which stops as soon as
+    `limit` ids have been collected.
+    """
+    if predicates:
+        ids = compress(table.ids, combine([predicate(table) for predicate in predicates]))
+    else:
+        ids = iter(table.ids)
+    if limit > 0:
+        ids = islice(ids, limit)
+    return list(ids)
@@ -0,0 +1,247 @@
+import asyncio
+import multiprocessing
+import queue
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+from campaign import CampaignRunner, CampaignSettings
+from metrics import Metrics
+
+
+def assign_shards(recipients: List[List[int]]) -> List[List[int]]:
+    """Gives every user to exactly one shard.
+
+    A user found in several groups' conversations goes to whichever of those
+    shards is smallest at that point, so one user gets one message and the
+    work stays balanced. Order within each shard is kept.
+    """
+    owners: Dict[int, List[int]] = {}
+    for shard, user_ids in enumerate(recipients):
+        for user_id in user_ids:
+            owners.setdefault(user_id, []).append(shard)
+
+    sizes = [0] * len(recipients)
+    chosen: Dict[int, int] = {}
+    # Users only one shard can reach are fixed first
+    for user_id, shards in owners.items():
+        if len(shards) == 1:
+            chosen[user_id] = shards[0]
+            sizes[shards[0]] += 1
+    for user_id, shards in owners.items():
+        if len(shards) > 1:
+            shard = min(shards, key=lambda s: sizes[s])
+            chosen[user_id] = shard
+            sizes[shard] += 1
+
+    return [
+        [user_id for user_id in user_ids if chosen[user_id] == shard]
+        for shard, user_ids in enumerate(recipients)
+    ]
+
+
+class MergedProgress:
+    """Folds per-shard progress callbacks into one (current, total, status) stream."""
+
+    def __init__(self, on_progress: Callable[[int, int, str], None]):
+        self.on_progress = on_progress
+        self.current: Dict[str, int] = {}
+        self.total: Dict[str, int] = {}
+
+    def shard(self, name: str) -> Callable[[int, int, str], None]:
+        self.current[name] = 0
+        self.total[name] = 0
+
+        def report(current: int, total: int, status: str):
+            self.update(name, current, total, status)
+        return report
+
+    def update(self, name: str, current: int, total: int, status: str):
+        self.current[name] = current
+        self.total[name] = total
+        self.on_progress(sum(self.current.values()), sum(self.total.values()), f"{status} [{name}]")
+
+
+def run_shard_process(
+    account: Dict[str, Any],
+    data_dir: str,
+    settings: Dict[str, Any],
+    events: "multiprocessing.Queue",
+    stop_event: "multiprocessing.Event"
+):
+    """Process entry point: one account's campaign with its own event loop and limiter."""
+    asyncio.run(run_shard(account, data_dir, settings, events, stop_event))
+
+
+async def run_shard(
+    account: Dict[str, Any],
+    data_dir: str,
+    settings: Dict[str, Any],
+    events: "multiprocessing.Queue",
+    stop_event: "multiprocessing.Event"
+):
+    name = account['name']
+    runner = CampaignRunner(
+        account['vk_token'], account['vk_group_id'], data_dir,
+        log=lambda message: events.put(('log', name, message))
+    )
+
+    async def watch_stop():
+        while not stop_event.is_set():
+            await asyncio.sleep(0.2)
+        runner.stop()
+
+    watcher = asyncio.create_task(watch_stop())
+    ok = False
+    try:
+        ok = await runner.run(
+            CampaignSettings.from_dict(settings),
+            lambda current, total, status: events.put(('progress', name, (current, total, status)))
+        )
+    except Exception as e:
+        events.put(('log', name, f"Критическая ошибка: {e}"))
+    finally:
+        watcher.cancel()
+        await runner.close()
+        events.put(('done', name, ok))
+
+
+class CampaignCoordinator:
+    """Runs one campaign across several (token, group) accounts at once.
+
+    Each account mails its own group's conversations through its own
+    CampaignRunner, so each has its own rate limiter and HTTP session.
+    Throughput grows with the number of tokens. In-process shards share one
+    event loop, and users found in several groups get the message once (see
+    `assign_shards`). With `processes=True` each account runs in its own
+    process instead. That spreads the CPU-bound work over cores, but then each
+    group mails all its own recipients, without de-duplication.
+
+    Pass the front end's own `runner` when it stays open during the run: its
+    group is then mailed through a fork of it, so that group's suppression
+    list, send history and index are not opened (and saved) twice.
+    """
+
+    def __init__(
+        self,
+        accounts: List[Dict[str, Any]],
+        data_dir: str,
+        log: Callable[[str], None] = print,
+        runner: Optional[CampaignRunner] = None
+    ):
+        self.accounts = accounts
+        self.data_dir = data_dir
+        self.log = log
+        self.runner = runner
+        self.runners: List[CampaignRunner] = []
+        # Shared by in-process shards: API calls of all accounts in one place
+        self.metrics = Metrics()
+        self.stop_event = None  # multiprocessing Event while shard processes run
+
+    def shard_log(self, name: str) -> Callable[[str], None]:
+        return lambda message: self.log(f"[{name}] {message}")
+
+    def create_runner(self, account: Dict[str, Any]) -> CampaignRunner:
+        log = self.shard_log(account['name'])
+        if self.runner is not None and account['vk_group_id'] == self.runner.manager.group_id:
+            return self.runner.fork(log=log, metrics=self.metrics)
+        runner = CampaignRunner(
+            account['vk_token'], account['vk_group_id'], self.data_dir, log=log, metrics=self.metrics
+        )
+        if self.runner is not None:
+            # upload_cache.json is one file for all groups
+            runner.manager.upload_cache = self.runner.manager.upload_cache
+        return runner
+
+    async def run(
+        self,
+        settings: CampaignSettings,
+        on_progress: Callable[[int, int, str], None],
+        processes: bool = False
+    ) -> bool:
+        if processes:
+            return await self.run_processes(settings, on_progress)
+
+        self.runners = [self.create_runner(account) for account in self.accounts]
+        for runner in self.runners:
+            runner.report_metrics = False
+        self.metrics.reset()
+        try:
+            if settings.stream:
+                # Recipients have to be known up front to be de-duplicated
+                self.log("Потоковый режим недоступен для нескольких групп, диалоги будут загружены целиком.")
+                settings = CampaignSettings.from_dict({**settings.to_dict(), 'stream': False})
+            prepared = await asyncio.gather(*(runner.prepare(settings) for runner in self.runners))
+            active = [
+                (account, runner, p)
+                for account, runner, p in zip(self.accounts, self.runners, prepared) if p is not None
+            ]
+            if not active:
+                return False
+
+            shards = assign_shards([user_ids for _account, _runner, (_attachment, user_ids) in active])
+            merged = MergedProgress(on_progress)
+            sends = []
+            for (account, runner, (attachment, _user_ids)), user_ids in zip(active, shards):
+                self.shard_log(account['name'])(f"Получателей после объединения: {len(user_ids)}")
+                if user_ids:
+                    sends.append(runner.send(settings, attachment, user_ids, merged.shard(account['name'])))
+            await asyncio.gather(*sends)
+            lines = self.metrics.summary()
+            if lines:
+                self.log("Статистика запросов (все группы):")
+                for line in lines:
+                    self.log(f"  {line}")
+            return True
+        finally:
+            for runner in self.runners:
+                await runner.close()
+            self.runners = []
+
+    async def run_processes(self, settings: CampaignSettings, on_progress: Callable[[int, int, str], None]) -> bool:
+        context = multiprocessing.get_context("spawn")
+        events = context.Queue()
+        self.stop_event = context.Event()
+        workers = [
+            context.Process(
+                target=run_shard_process,
+                args=(account, self.data_dir, settings.to_dict(), events, self.stop_event),
+                daemon=True
+            )
+            for account in self.accounts
+        ]
+        for worker in workers:
+            worker.start()
+
+        merged = MergedProgress(on_progress)
+        reporters = {a['name']: merged.shard(a['name']) for a in self.accounts}
+        results: Dict[str, bool] = {}
+        try:
+            while len(results) < len(workers):
+                try:
+                    kind, name, payload = events.get_nowait()
+                except queue.Empty:
+                    if not any(worker.is_alive() for worker in workers) and events.empty():
+                        break  # a process died without reporting
+                    await asyncio.sleep(0.05)
+                    continue
+                if kind == 'progress':
+                    reporters[name](*payload)
+                elif kind == 'log':
+                    self.shard_log(name)(payload)
+                else:
+                    results[name] = payload
+        finally:
+            for worker in workers:
+                await asyncio.to_thread(worker.join)
+            self.stop_event = None
+        return any(results.values())
+
+    @property
+    def failure_stats(self) -> Counter:
+        """Failed attempts per error code across in-process shards."""
+        return sum((runner.manager.failure_stats for runner in self.runners), Counter())
+
+    def stop(self):
+        for runner in self.runners:
+            runner.stop()
+        if self.stop_event is not None:
+            self.stop_event.set()
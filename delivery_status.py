@@ -0,0 +1,20 @@
+from typing import Any, Dict, Optional
+
+# Per-recipient progress lines of VKManager.mailing_loop look like
+# "Пользователь 123: Успешно" or "Пользователь 123: Ошибка [901]".
+# Kept out of vk_logic so the GUI can count outcomes without importing the API stack.
+USER_STATUS_PREFIX = "Пользователь "
+STATUS_SENT = "Успешно"
+STATUS_FAILED = "Ошибка"
+
+
+def user_status(user_id: int, failure: Optional[Dict[str, Any]]) -> str:
+    outcome = STATUS_SENT if failure is None else f"{STATUS_FAILED} [{failure['code']}]"
+    return f"{USER_STATUS_PREFIX}{user_id}: {outcome}"
+
+
+def outcome_of(status: str) -> Optional[bool]:
+    """True for a delivered recipient, False for a failed one, None for other lines."""
+    if not status.startswith(USER_STATUS_PREFIX):
+        return None
+    return not status.split(": ", 1)[-1].startswith(STATUS_FAILED)
@@ -0,0 +1,293 @@
+"""Local stand-in for the VK API, for tests and benchmarks.
+
+Serves the methods VKManager uses (conversations, execute, messages.send,
+users.get, photo/doc/video uploads) over real HTTP, with configurable
+latency, injected errors and up to millions of synthetic conversations.
+
+    python fake_vk_server.py --port 8080 --conversations 1000000 --latency 0.02 --error 6=0.01 --error 502=0.001
+
+then point the client at it: VKManager(token, group_id, api_url="http://127.0.0.1:8080/method/").
+"""
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter
+from typing import Any, Dict, List, Optional
+from aiohttp import web
+from simulator import ERROR_MESSAGES, parse_error_rates
+
+CHAT_PEER_OFFSET = 2000000000
+
+class FakeApiError(Exception):
+    """Raised by a method handler to answer with an API error instead of a response."""
+
+    def __init__(self, code: int):
+        super().__init__(ERROR_MESSAGES.get(code, "Injected error"))
+        self.code = code
+
+
+class FakeVkServer:
+    """aiohttp server answering like api.vk.com for a synthetic group.
+
+    Conversation `i` (0-based, newest first) has peer id `i + 1`, or is a chat
+    every `chat_every` items. Dates go back `spacing` seconds per item from
+    `now`. Nothing is stored per conversation, so 10^6 of them cost no memory.
+
+    `error_rates` maps an error code to its probability per call: 6, 9 and 10
+    come back as API errors, codes >= 500 as HTTP statuses, and 901 as a
+    per-recipient send failure.
+    """
+
+    def __init__(
+        self,
+        conversations: int = 100_000,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rates: Optional[Dict[int, float]] = None,
+        rps_limit: float = 0,
+        chat_every: int = 50,
+        now: Optional[int] = None,
+        seed: Optional[int] = None
+    ):
+        self.conversations = conversations
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rates = dict(error_rates or {})
+        self.rps_limit = rps_limit
+        self.chat_every = chat_every
+        self.now = now or int(time.time())
+        # Spread the dialogs over about two years
+        self.spacing = max(1, 2 * 365 * 86400 // max(1, conversations))
+        self.random = random.Random(seed)
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.delivered = 0
+        self.uploaded_bytes = 0
+        self.next_id = 0
+        self.window_start = 0.0
+        self.window_calls = 0
+        self.runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.base_url}/method/"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post("/method/{name}", self.handle_method)
+        app.router.add_post("/upload/{kind}", self.handle_upload)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.base_url = f"http://{host}:{self.runner.addresses[0][1]}"
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+    # Synthetic data
+
+    def peer_id(self, index: int) -> int:
+        if self.chat_every and index % self.chat_every == 0:
+            return CHAT_PEER_OFFSET + 1 + index
+        return index + 1
+
+    def date(self, index: int) -> int:
+        return self.now - index * self.spacing
+
+    def conversation(self, index: int) -> Dict[str, Any]:
+        peer_id = self.peer_id(index)
+        return {
+            'conversation': {'peer': {'id': peer_id, 'type': 'chat' if peer_id >= CHAT_PEER_OFFSET else 'user'}},
+            'last_message': {'date': self.date(index), 'text': f"msg {index}"}
+        }
+
+    def conversation_page(self, offset: int, count: int) -> Dict[str, List[Any]]:
+        indexes = range(offset, min(offset + count, self.conversations))
+        ids = [self.peer_id(i) for i in indexes]
+        return {
+            'ids': ids,
+            'types': ['chat' if p >= CHAT_PEER_OFFSET else 'user' for p in ids],
+            'dates': [self.date(i) for i in indexes],
+            'texts': [f"msg {i}" for i in indexes],
+        }
+
+    @staticmethod
+    def user(user_id: int) -> Dict[str, Any]:
+        return {'id': user_id, 'first_name': f"Name{user_id}", 'last_name': f"Last{user_id}"}
+
+    # Error injection
+
+    def roll(self, code: int) -> bool:
+        rate = self.error_rates.get(code, 0)
+        return rate > 0 and self.random.random() < rate
+
+    def over_rate_limit(self) -> bool:
+        if not self.rps_limit:
+            return False
+        now = time.monotonic()
+        if now - self.window_start >= 1:
+            self.window_start = now
+            self.window_calls = 0
+        self.window_calls += 1
+        return self.window_calls > self.rps_limit
+
+    @staticmethod
+    def api_error(code: int, message: str) -> web.Response:
+        return web.json_response({'error': {'error_code': code, 'error_msg': message}})
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        params = dict(await request.post())
+        self.calls[name] += 1
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if self.over_rate_limit():
+            self.errors[6] += 1
+            return self.api_error(6, ERROR_MESSAGES[6])
+        for code in sorted(self.error_rates):
+            if code == 901 or not self.roll(code):
+                continue
+            self.errors[code] += 1
+            if code >= 500:
+                return web.Response(status=code, text="injected")
+            return self.api_error(code, ERROR_MESSAGES.get(code, "Injected error"))
+
+        handler = getattr(self, "method_" + name.replace(".", "_"), None)
+        if handler is None:
+            return self.api_error(3, "Unknown method passed")
+        try:
+            return web.json_response({'response': handler(params)})
+        except FakeApiError as e:
+            return self.api_error(e.code, str(e))
+        except (KeyError, ValueError) as e:
+            return self.api_error(100, f"One of the parameters specified was missing or invalid: {e}")
+
+    async def handle_upload(self, request: web.Request) -> web.Response:
+        kind = request.match_info["kind"]
+        reader = await request.multipart()
+        part = await reader.next()
+        size = 0
+        while True:
+            chunk = await part.read_chunk()
+            if not chunk:
+                break
+            size += len(chunk)
+        self.uploaded_bytes += size
+        self.next_id += 1
+        if kind == "photo":
+            return web.json_response({'server': 1, 'photo': json.dumps([{'id': self.next_id}]), 'hash': "fake"})
+        if kind == "doc":
+            return web.json_response({'file': str(self.next_id)})
+        return web.json_response({'size': size})
+
+    # API methods
+
+    def method_messages_getConversations(self, params: Dict[str, str]) -> Dict[str, Any]:
+        offset, count = int(params.get('offset', 0)), min(int(params.get('count', 20)), 200)
+        end = min(offset + count, self.conversations)
+        return {'count': self.conversations, 'items': [self.conversation(i) for i in range(offset, end)]}
+
+    def method_execute(self, params: Dict[str, str]) -> Any:
+        code = params['code']
+        if "getConversations" in code:
+            offset = int(re.search(r'var offset = (\d+);', code).group(1))
+            pages = int(re.search(r'while \(i < (\d+)\)', code).group(1))
+            count = int(re.search(r'"count": (\d+)', code).group(1))
+            result = []
+            while pages and offset < self.conversations:
+                result.append(self.conversation_page(offset, count))
+                offset += count
+                pages -= 1
+            return {'count': self.conversations, 'pages': result}
+        if "API.users.get" in code:
+            parts = []
+            for n in range(code.count("API.users.get")):
+                parts.append([self.user(int(i)) for i in params[f"ids{n}"].split(",")])
+            return parts
+        raise ValueError("code")
+
+    def method_messages_send(self, params: Dict[str, str]) -> Any:
+        if 'peer_ids' not in params:
+            peer_id = int(params['peer_id'])
+            if self.roll(901):
+                self.errors[901] += 1
+                raise FakeApiError(901)
+            self.delivered += 1
+            self.next_id += 1
+            return self.next_id
+        result = []
+        for peer_id in map(int, params['peer_ids'].split(",")):
+            if self.roll(901):
+                self.errors[901] += 1
+                result.append({'peer_id': peer_id, 'error': {'code': 901, 'description': ERROR_MESSAGES[901]}})
+            else:
+                self.delivered += 1
+                self.next_id += 1
+                result.append({'peer_id': peer_id, 'message_id': self.next_id})
+        return result
+
+    def method_users_get(self, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        return [self.user(int(i)) for i in params['user_ids'].split(",")]
+
+    def method_photos_getMessagesUploadServer(self, params: Dict[str, str]) -> Dict[str, Any]:
+        return {'upload_url': f"{self.base_url}/upload/photo"}
+
+    def method_photos_saveMessagesPhoto(self, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        photo_id = json.loads(params['photo'])[0]['id']
+        return [{'owner_id': -1, 'id': photo_id}]
+
+    def method_docs_getMessagesUploadServer(self, params: Dict[str, str]) -> Dict[str, Any]:
+        return {'upload_url': f"{self.base_url}/upload/doc"}
+
+    def method_docs_save(self, params: Dict[str, str]) -> Dict[str, Any]:
+        return {'type': 'doc', 'doc': {'owner_id': -1, 'id': int(params['file'])}}
+
+    def method_video_save(self, params: Dict[str, str]) -> Dict[str, Any]:
+        self.next_id += 1
+        return {'upload_url': f"{self.base_url}/upload/video", 'owner_id': -1, 'video_id': self.next_id}
+
+
+async def serve(args: argparse.Namespace):
+    server = FakeVkServer(
+        conversations=args.conversations,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rates=parse_error_rates(args.error),
+        rps_limit=args.rps_limit,
+        seed=args.seed
+    )
+    await server.start(args.host, args.port)
+    print(f"Fake VK API on {server.api_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake VK API server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--conversations", type=int, default=100_000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency, up to this many seconds")
+    parser.add_argument("--error", action="append", help="CODE=RATE, e.g. 6=0.01 or 502=0.001")
+    parser.add_argument("--rps-limit", type=float, default=0, help="answer error 6 above this many calls per second")
+    parser.add_argument("--seed", type=int)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import time
+import array
+import sqlite3
+import threading
+from bisect import bisect_left
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
+
+SLOTS = 16  # send times kept per peer, so caps up to 16 messages per window can be enforced
+LOOKUP_CHUNK = 900  # ids per `IN (...)` query, below SQLite's default variable limit
+FLUSH_EVERY = 500
+
+
+class SendHistory:
+    """Recent send times per peer, for frequency caps across campaigns.
+
+    One SQLite row per peer holds its last `slots` send times as a packed
+    uint32 BLOB, oldest first. Checking a recipient is one primary-key lookup
+    plus a bisect over at most `slots` values, however long the history, and
+    only the rows of the ids being checked are ever loaded. `record()`
+    buffers sends and `flush()` writes them in one transaction; it blocks on
+    SQLite, so the mailing loop runs it through `asyncio.to_thread`.
+    """
+
+    TYPECODE = "I"
+
+    def __init__(self, path: str, slots: int = SLOTS):
+        self.path = path
+        self.slots = slots
+        self.pending: List[Tuple[int, int]] = []
+        self.lock = threading.Lock()
+        # One read-modify-write at a time, or concurrent flushes could drop each other's sends
+        self.flush_lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS send_history ("
+                "peer_id INTEGER PRIMARY KEY, "
+                "stamps BLOB NOT NULL)"
+            )
+
+    def load(self, peer_ids: List[int]) -> Dict[int, array.array]:
+        """Send times of the given peers (peers never messaged are absent)."""
+        history = {}
+        with self.lock:
+            for i in range(0, len(peer_ids), LOOKUP_CHUNK):
+                chunk = peer_ids[i:i + LOOKUP_CHUNK]
+                rows = self.conn.execute(
+                    f"SELECT peer_id, stamps FROM send_history WHERE peer_id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                )
+                for peer_id, blob in rows:
+                    stamps = array.array(self.TYPECODE)
+                    stamps.frombytes(blob)
+                    history[peer_id] = stamps
+        return history
+
+    @staticmethod
+    def sends_since(stamps: array.array, since: float) -> int:
+        return len(stamps) - bisect_left(stamps, since)
+
+    def allowed(
+        self,
+        peer_ids: Iterable[int],
+        max_sends: int,
+        days: float,
+        limit: int = 0,
+        now: Optional[float] = None
+    ) -> List[int]:
+        """Peers sent fewer than `max_sends` messages in the last `days`, in input order.
+
+        Candidates are looked up chunk by chunk and the scan stops once
+        `limit` peers have been accepted.
+        """
+        if max_sends > self.slots:
+            raise ValueError(f"не более {self.slots} сообщений за период")
+        since = (time.time() if now is None else now) - days * 86400
+        self.flush()
+        result = []
+        peer_ids = iter(peer_ids)
+        while True:
+            chunk = list(islice(peer_ids, LOOKUP_CHUNK))
+            if not chunk:
+                return result
+            history = self.load(chunk)
+            for peer_id in chunk:
+                stamps = history.get(peer_id)
+                if stamps is None or self.sends_since(stamps, since) < max_sends:
+                    result.append(peer_id)
+                    if len(result) == limit:
+                        return result
+
+    def record(self, peer_ids: Iterable[int], when: Optional[float] = None) -> bool:
+        """Buffers sends; True once enough are pending that the caller should `flush()`."""
+        when = int(time.time() if when is None else when)
+        sends = [(peer_id, when) for peer_id in peer_ids]
+        with self.lock:
+            self.pending.extend(sends)
+            return len(self.pending) >= FLUSH_EVERY
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, []
+            if not pending:
+                return
+            sends: Dict[int, List[int]] = {}
+            for peer_id, when in pending:
+                sends.setdefault(peer_id, []).append(when)
+            history = self.load(list(sends))
+            rows = []
+            for peer_id, times in sends.items():
+                stamps = history.get(peer_id) or array.array(self.TYPECODE)
+                stamps.extend(sorted(times))
+                # Keep the newest `slots` times, oldest first (the ring)
+                rows.append((peer_id, stamps[-self.slots:].tobytes()))
+            with self.lock, self.conn:
+                self.conn.executemany(
+                    "INSERT INTO send_history (peer_id, stamps) VALUES (?, ?) "
+                    "ON CONFLICT(peer_id) DO UPDATE SET stamps = excluded.stamps",
+                    rows
+                )
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,169 @@
+import asyncio
+import aiohttp
+from typing import Any, Dict, List, Optional
+from vk_api.exceptions import ApiError
+from conversation_store import ConversationStore
+
+CHAT_PEER_OFFSET = 2000000000  # peer ids above this are group chats
+SAVE_INTERVAL = 5.0  # seconds between suppression list saves while unsubscribes keep arriving
+
+
+class BotsLongPoll:
+    """Background Bots Long Poll consumer that keeps a ConversationStore current.
+
+    Listens to message_new / message_reply and upserts the conversation's last
+    message; message_deny / message_allow update the manager's suppression
+    list, which is saved in a thread soon after (at most every
+    `save_interval` seconds, however many arrive). When VK reports
+    lost history (failed=1/3) the store is caught up with an incremental sync
+    before the index is considered live again.
+    """
+
+    def __init__(
+        self,
+        manager,
+        store: ConversationStore,
+        wait: int = 25,
+        retry_delay: float = 1,
+        max_backoff: float = 30,
+        save_interval: float = SAVE_INTERVAL
+    ):
+        self.manager = manager
+        self.store = store
+        self.wait = wait
+        self.retry_delay = retry_delay
+        self.max_backoff = max_backoff
+        self.save_interval = save_interval
+        self.unsaved = False
+        self.saving: Optional[asyncio.Task] = None
+        self.server: Optional[str] = None
+        self.key: Optional[str] = None
+        self.ts: Optional[str] = None
+        self.is_live = False
+        self.is_running = False
+        self.task: Optional[asyncio.Task] = None
+
+    async def get_server(self, update_ts: bool = True):
+        """Requests a new key (and optionally ts) from groups.getLongPollServer."""
+        response = await self.manager.vk.groups.getLongPollServer(group_id=self.manager.group_id)
+        self.server = response['server']
+        self.key = response['key']
+        if update_ts or self.ts is None:
+            self.ts = str(response['ts'])
+
+    async def check(self) -> Dict[str, Any]:
+        session = await self.manager.api.get_session()
+        params = {'act': 'a_check', 'key': self.key, 'ts': self.ts, 'wait': self.wait}
+        timeout = aiohttp.ClientTimeout(total=self.wait + 10)
+        async with session.get(self.server, params=params, timeout=timeout) as resp:
+            return await resp.json(content_type=None)
+
+    def apply_suppression(self, updates: List[Dict[str, Any]]) -> bool:
+        """message_deny / message_allow -> suppression list; True if any arrived.
+
+        Runs on the event loop thread, like every other user of the list.
+        """
+        suppression = self.manager.suppression
+        changed = False
+        for update in updates:
+            if update.get('type') not in ('message_deny', 'message_allow') or suppression is None:
+                continue
+            user_id = update['object']['user_id']
+            if update['type'] == 'message_deny':
+                suppression.add(user_id)
+            else:
+                suppression.discard(user_id)
+            changed = True
+        return changed
+
+    def handle_updates(self, updates: List[Dict[str, Any]]):
+        conversations = {}
+        for update in updates:
+            if update.get('type') == 'message_new':
+                message = update['object'].get('message', update['object'])
+            elif update.get('type') == 'message_reply':
+                message = update['object']
+            else:
+                continue
+            peer_id = message.get('peer_id', 0)
+            if 0 < peer_id < CHAT_PEER_OFFSET:
+                conversations[peer_id] = {
+                    'id': peer_id,
+                    'last_message_date': message['date'],
+                    'last_message_text': message.get('text', '')
+                }
+        if conversations:
+            self.store.upsert_many(conversations.values())
+
+    async def save_suppression(self):
+        """Writes the suppression list off the loop; changes arriving meanwhile share the next save."""
+        while self.unsaved:
+            self.unsaved = False
+            try:
+                await asyncio.to_thread(self.manager.suppression.save)
+            except Exception as e:
+                self.manager.log(f"Ошибка сохранения списка отписок: {e}")
+                self.unsaved = True
+            await asyncio.sleep(self.save_interval)
+
+    async def recover(self):
+        """Events were lost: fetch fresh credentials and backfill from the API."""
+        self.is_live = False
+        await self.get_server()
+        await self.manager.sync_conversations(self.store)
+
+    async def run(self):
+        self.is_running = True
+        self.task = asyncio.current_task()
+        backoff = self.retry_delay
+
+        while self.is_running:
+            try:
+                if self.server is None:
+                    # Anything that happened before the first poll is picked up by a regular sync
+                    await self.recover()
+                response = await self.check()
+                failed = response.get('failed')
+                if failed == 2:
+                    # Key expired, the current ts is still valid
+                    await self.get_server(update_ts=False)
+                elif failed in (1, 3):
+                    await self.recover()
+                else:
+                    self.ts = str(response['ts'])
+                    updates = response.get('updates', [])
+                    if self.apply_suppression(updates):
+                        # Unsubscribes must survive an exit between campaigns
+                        self.unsaved = True
+                        if self.saving is None or self.saving.done():
+                            self.saving = asyncio.create_task(self.save_suppression())
+                    await asyncio.to_thread(self.handle_updates, updates)
+                    self.is_live = True
+                backoff = self.retry_delay
+            except asyncio.CancelledError:
+                raise
+            except ApiError as e:
+                # Long Poll disabled for the group or the token lacks rights
+                self.manager.log(f"Long Poll недоступен: {e}")
+                break
+            except Exception as e:
+                self.manager.log(f"Ошибка Long Poll: {e}, переподключение через {backoff} с")
+                self.is_live = False
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+        self.is_running = False
+        self.is_live = False
+
+    def start(self) -> asyncio.Task:
+        self.task = asyncio.create_task(self.run())
+        return self.task
+
+    def stop(self):
+        self.is_running = False
+        self.is_live = False
+        if self.task:
+            self.task.cancel()
+        if self.saving:
+            # CampaignRunner.close() saves whatever is left
+            self.saving.cancel()
@@ -1,9 +1,13 @@
+from startup_profile import StartupTimer
+startup = StartupTimer()
+
 import flet as ft
 import asyncio
 import os
-import time
-import json
-from vk_logic import VKManager
+from config_file import ConfigFile
+from progress_reporter import ProgressReporter
+from activity_index import HISTOGRAM_DAYS
+startup.mark("импорт flet")
 
 # Constants for styling - Cleaner, more stable palette
 BG_COLOR = "#121212"
@@ -12,17 +16,29 @@ ACCENT_COLOR = "#007AFF"  # Classic Blue
 TEXT_COLOR = "#FFFFFF"
 SECONDARY_TEXT = "#B0B0B0"
 CONFIG_FILE = "config.json"
+STATUS_LABELS = {
+    "scheduled": "ожидает", "running": "идёт", "paused": "пауза",
+    "finished": "завершена", "stopped": "остановлена", "failed": "ошибка",
+}
+DATA_DIR = os.path.dirname(os.path.abspath(CONFIG_FILE))
 
 class VKSenderApp:
     def __init__(self, page: ft.Page):
         self.page = page
-        self.vk_manager = None
+        self.config = ConfigFile(CONFIG_FILE)
+        self.backend = None
+        self.runner = None
+        self.coordinator = None
+        self.scheduler = None
+        self.initializing = True
         self.setup_page()
         self.init_ui_components()
         self.build_layout()
-        
-        # Initialize API on startup
-        self.auto_init_api()
+        startup.mark("первый кадр")
+        self.page.run_task(self.reporter.run)
+
+        # vk_api/aiohttp and the API session load after the first frame
+        self.page.run_task(self.auto_init_api)
 
     def setup_page(self):
         self.page.title = " "
@@ -33,45 +49,56 @@ class VKSenderApp:
         self.page.window_height = 750
         self.page.update()
 
-    def load_settings(self):
-        if os.path.exists(CONFIG_FILE):
-            try:
-                with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"Error loading config: {e}")
-        return {}
-
     def save_settings(self, token, group_id):
-        try:
-            with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-                json.dump({"vk_token": token, "vk_group_id": group_id}, f, ensure_ascii=False, indent=4)
-            return True
-        except Exception as e:
-            print(f"Error saving config: {e}")
-            return False
+        # Keeps other keys (e.g. the `accounts` list) intact
+        return self.config.update(vk_token=token, vk_group_id=group_id)
+
+    async def load_backend(self):
+        """Imports the mailing modules (vk_api, aiohttp, ...) off the UI thread, once."""
+        if self.backend is None:
+            self.backend = await asyncio.to_thread(BackendModules)
+        return self.backend
+
+    async def create_manager(self, token, group_id):
+        backend = await self.load_backend()
+        if self.runner:
+            self.page.run_task(self.runner.close)
+        self.runner = await asyncio.to_thread(
+            backend.CampaignRunner, token, group_id, DATA_DIR, log=self.log
+        )
+        self.runner.api_model = backend.ApiModel.from_dict(self.config.get("simulation") or {})
+        self.scheduler = None
+        self.reporter.metrics = self.runner.manager.metrics
+        # Keep the conversation index fresh in the background
+        self.page.run_task(self.runner.create_long_poll().run)
+        self.page.run_task(self.update_preview)
 
-    def auto_init_api(self):
-        settings = self.load_settings()
-        token = settings.get("vk_token")
-        group_id = settings.get("vk_group_id")
-        
-        if token and group_id:
-            try:
-                self.vk_manager = VKManager(token, int(group_id))
+    async def auto_init_api(self):
+        token = self.config.get("vk_token")
+        group_id = self.config.get("vk_group_id")
+
+        try:
+            await self.load_backend()
+            startup.mark("импорт модулей рассылки")
+            if token and group_id:
+                await self.create_manager(token, int(group_id))
+                startup.mark("инициализация API")
                 self.token_input.value = token
                 self.group_id_input.value = str(group_id)
                 self.log("API автоматически инициализировано из файла.")
-            except Exception as e:
-                self.log(f"Ошибка авто-инициализации: {e}")
-        else:
-            self.log("Настройки API не найдены. Пожалуйста, настройте их.")
+            else:
+                self.log("Настройки API не найдены. Пожалуйста, настройте их.")
+        except Exception as e:
+            self.log(f"Ошибка авто-инициализации: {e}")
+        finally:
+            self.initializing = False
+        self.log(f"Запуск: {startup.summary()}")
 
     def init_ui_components(self):
         # File Picker
         self.file_picker = ft.FilePicker(on_result=self.on_file_result)
         self.page.overlay.append(self.file_picker)
-        self.selected_file_path = None
+        self.selected_file_paths = []
 
         # API Settings
         self.token_input = ft.TextField(
@@ -111,22 +138,22 @@ class VKSenderApp:
         # Local File Upload
         self.file_info_text = ft.Text("Файл не выбран", size=12, color=SECONDARY_TEXT)
         self.select_file_button = ft.OutlinedButton(
-            "Выбрать файл с ПК",
+            "Выбрать файлы с ПК",
             icon=ft.Icons.UPLOAD_FILE,
-            on_click=lambda _: self.file_picker.pick_files(),
+            on_click=lambda _: self.file_picker.pick_files(allow_multiple=True),
             style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=8))
         )
         self.clear_file_button = ft.IconButton(
             icon=ft.Icons.CLOSE,
             icon_color="#CF6679",
-            tooltip="Убрать файл",
+            tooltip="Убрать файлы",
             visible=False,
             on_click=self.reset_file
         )
 
         # Interval Settings
         self.interval_slider = ft.Slider(
-            min=1, max=60, divisions=59, 
+            min=0, max=60, divisions=60, 
             label="{value} сек", value=3,
             active_color=ACCENT_COLOR
         )
@@ -149,6 +176,7 @@ class VKSenderApp:
             value="0", 
             width=100, 
             visible=False,
+            on_change=self.on_audience_change,
             border_color="#333333",
             text_size=14
         )
@@ -157,6 +185,14 @@ class VKSenderApp:
             value="365", 
             width=100, 
             visible=False,
+            on_change=self.on_audience_change,
+            border_color="#333333",
+            text_size=14
+        )
+
+        # Last Message Text Filter
+        self.text_filter_input = ft.TextField(
+            label="Последнее сообщение содержит", 
             border_color="#333333",
             text_size=14
         )
@@ -165,17 +201,99 @@ class VKSenderApp:
         self.limit_input = ft.TextField(
             label="Лимит получателей (0 = все)", 
             value="0", 
+            on_change=self.on_audience_change,
+            border_color="#333333",
+            text_size=14
+        )
+
+        # Frequency Cap
+        self.max_sends_input = ft.TextField(
+            label="Не больше писем", 
+            value="0", 
+            width=130, 
+            hint_text="0 = без ограничения",
+            border_color="#333333",
+            text_size=14
+        )
+        self.per_days_input = ft.TextField(
+            label="за дней", 
+            value="7", 
+            width=100, 
             border_color="#333333",
             text_size=14
         )
 
+        # Audience Preview (recomputed from the activity index on every keystroke)
+        self.audience_text = ft.Text("", size=12, color=SECONDARY_TEXT)
+        self.histogram_row = ft.Row([], spacing=4, vertical_alignment=ft.CrossAxisAlignment.END)
+
+        # Parallel Requests
+        self.concurrency_input = ft.TextField(
+            label="Параллельных запросов", 
+            value="4", 
+            border_color="#333333",
+            text_size=14
+        )
+
+        # Personalization
+        self.personalize_checkbox = ft.Checkbox(
+            label="Подставлять {first_name}, {last_name}", 
+            value=False,
+            fill_color=ACCENT_COLOR
+        )
+
+        # Streaming
+        self.stream_checkbox = ft.Checkbox(
+            label="Отправлять во время загрузки диалогов", 
+            value=False,
+            fill_color=ACCENT_COLOR
+        )
+
         # Test Mode
         self.test_mode_checkbox = ft.Checkbox(
-            label="Тестовый режим (без отправки)", 
+            label="Симуляция (без отправки, прогноз)", 
+            value=False,
+            fill_color=ACCENT_COLOR
+        )
+
+        # All Accounts (config.json "accounts")
+        accounts_count = len(self.config.accounts())
+        self.all_accounts_checkbox = ft.Checkbox(
+            label=f"Все группы из config.json ({accounts_count})", 
+            value=False,
+            visible=accounts_count > 1,
+            fill_color=ACCENT_COLOR
+        )
+
+        # Batched Delivery
+        self.batch_mode_checkbox = ft.Checkbox(
+            label="Пакетная отправка (до 100 за запрос)", 
             value=False,
             fill_color=ACCENT_COLOR
         )
 
+        # Campaign Queue
+        self.priority_input = ft.TextField(
+            label="Приоритет", 
+            value="1", 
+            width=100, 
+            border_color="#333333",
+            text_size=14
+        )
+        self.start_time_input = ft.TextField(
+            label="Запуск (ЧЧ:ММ)", 
+            width=140, 
+            hint_text="сейчас",
+            border_color="#333333",
+            text_size=14
+        )
+        self.quiet_hours_input = ft.TextField(
+            label="Тихие часы (напр. 22-9)", 
+            border_color="#333333",
+            text_size=14
+        )
+        self.queue_column = ft.Column([], spacing=5)
+
         # Progress & Logs
         self.progress_bar = ft.ProgressBar(
             value=0, 
@@ -185,7 +303,11 @@ class VKSenderApp:
             border_radius=4
         )
         self.progress_text = ft.Text("Готов к работе", size=14, color=SECONDARY_TEXT)
-        self.log_area = ft.ListView(expand=True, spacing=5, padding=10)
+        self.failure_text = ft.Text("", size=12, color="#CF6679")
+        # The whole log is one Text re-rendered from the reporter's ring buffer
+        self.log_text = ft.Text("", size=12, color=SECONDARY_TEXT, selectable=True)
+        self.log_area = ft.ListView([self.log_text], expand=True, padding=10, auto_scroll=True)
+        self.reporter = ProgressReporter(self.render_progress)
         
         # Buttons
         self.start_button = ft.ElevatedButton(
@@ -209,6 +331,18 @@ class VKSenderApp:
             on_click=self.stop_mailing,
             disabled=True
         )
+        self.resume_button = ft.OutlinedButton(
+            "Продолжить прерванную",
+            icon=ft.Icons.REPLAY,
+            on_click=self.resume_mailing,
+            style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=8))
+        )
+        self.queue_button = ft.OutlinedButton(
+            "В очередь",
+            icon=ft.Icons.SCHEDULE,
+            on_click=self.queue_mailing,
+            style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=8))
+        )
 
     def build_layout(self):
         # Sidebar
@@ -216,10 +350,21 @@ class VKSenderApp:
             content=ft.Column([
                 self.filter_dropdown,
                 ft.Row([self.min_days_input, self.max_days_input], spacing=10),
+                self.text_filter_input,
                 self.limit_input,
+                ft.Row([self.max_sends_input, self.per_days_input], spacing=10),
+                self.audience_text,
+                self.histogram_row,
+                self.concurrency_input,
                 self.test_mode_checkbox,
+                self.batch_mode_checkbox,
+                self.stream_checkbox,
+                self.personalize_checkbox,
+                self.all_accounts_checkbox,
+                ft.Row([self.priority_input, self.start_time_input], spacing=10),
+                self.quiet_hours_input,
                 ft.Divider(height=20, color="#333333"),
-                ft.Text("Интервал (секунды)", size=14, color=SECONDARY_TEXT),
+                ft.Text("Мин. интервал (секунды, 0 = по лимиту API)", size=14, color=SECONDARY_TEXT),
                 self.interval_slider,
                 ft.Divider(height=20, color="#333333"),
                 ft.OutlinedButton(
@@ -247,10 +392,12 @@ class VKSenderApp:
                 ], spacing=10, vertical_alignment=ft.CrossAxisAlignment.CENTER),
                 # VK Attachment Row
                 self.attachment_input,
-                ft.Row([self.start_button, self.stop_button], spacing=15),
+                ft.Row([self.start_button, self.stop_button, self.resume_button, self.queue_button], spacing=15),
+                self.queue_column,
                 ft.Column([
                     self.progress_text,
                     self.progress_bar,
+                    self.failure_text,
                 ], spacing=5),
                 ft.Container(
                     content=self.log_area,
@@ -273,13 +420,16 @@ class VKSenderApp:
         
     def on_file_result(self, e: ft.FilePickerResultEvent):
         if e.files:
-            self.selected_file_path = e.files[0].path
-            self.file_info_text.value = f"Файл: {e.files[0].name}"
+            self.selected_file_paths = [f.path for f in e.files]
+            if len(e.files) == 1:
+                self.file_info_text.value = f"Файл: {e.files[0].name}"
+            else:
+                self.file_info_text.value = f"Файлов: {len(e.files)}"
             self.clear_file_button.visible = True
             self.page.update()
 
     def reset_file(self, e):
-        self.selected_file_path = None
+        self.selected_file_paths = []
         self.file_info_text.value = "Файл не выбран"
         self.clear_file_button.visible = False
         self.page.update()
@@ -289,20 +439,71 @@ class VKSenderApp:
         self.min_days_input.visible = is_activity
         self.max_days_input.visible = is_activity
         self.page.update()
+        self.on_audience_change(e)
+
+    def on_audience_change(self, e):
+        self.page.run_task(self.update_preview)
+
+    async def update_preview(self):
+        if not self.runner:
+            return
+        try:
+            settings = self.backend.CampaignSettings(
+                filter_type=self.filter_dropdown.value,
+                min_days=self.min_days_input.value or 0,
+                max_days=self.max_days_input.value or 365,
+                limit=self.limit_input.value or 0
+            )
+        except ValueError:
+            self.audience_text.value = "Получателей: —"
+            self.page.update()
+            return
+        try:
+            count, histogram = await self.runner.preview(settings)
+        except Exception as ex:
+            self.log(f"Ошибка предпросмотра аудитории: {ex}")
+            return
+        self.audience_text.value = f"Получателей: {count}" + (
+            " (до фильтра по тексту)" if self.text_filter_input.value else ""
+        )
+        self.render_histogram(histogram, settings)
+        self.page.update()
+
+    def render_histogram(self, counts, settings):
+        bounds = (0,) + HISTOGRAM_DAYS
+        peak = max(counts) or 1
+        bars = []
+        for i, count in enumerate(counts):
+            start = bounds[i]
+            end = bounds[i + 1] if i + 1 < len(bounds) else None
+            label = f"{start}+" if end is None else f"{start}–{end}"
+            selected = settings.filter_type != "activity" or (
+                start <= settings.max_days and (end is None or end > settings.min_days)
+            )
+            bars.append(ft.Column([
+                ft.Container(
+                    height=max(2, 40 * count / peak),
+                    width=28,
+                    bgcolor=ACCENT_COLOR if selected else "#333333",
+                    border_radius=2,
+                    tooltip=f"{label} дн.: {count}"
+                ),
+                ft.Text(label, size=9, color=SECONDARY_TEXT)
+            ], spacing=2, horizontal_alignment=ft.CrossAxisAlignment.CENTER))
+        self.histogram_row.controls = bars
 
     def show_settings(self, e):
         # Load current values into inputs
-        settings = self.load_settings()
-        self.token_input.value = settings.get("vk_token") or ""
-        self.group_id_input.value = str(settings.get("vk_group_id") or "")
+        self.token_input.value = self.config.get("vk_token") or ""
+        self.group_id_input.value = str(self.config.get("vk_group_id") or "")
 
-        def save_settings_click(e):
+        async def save_settings_click(e):
             try:
                 token = self.token_input.value
                 group_id = int(self.group_id_input.value or 0)
                 
                 if self.save_settings(token, group_id):
-                    self.vk_manager = VKManager(token, group_id)
+                    await self.create_manager(token, group_id)
                     settings_dialog.open = False
                     self.log("Настройки API сохранены в файл.")
                     self.page.update()
@@ -329,115 +530,204 @@ class VKSenderApp:
         self.page.update()
 
     def log(self, message: str):
-        self.log_area.controls.append(
-            ft.Text(
-                f"[{time.strftime('%H:%M:%S')}] {message}", 
-                size=12, 
-                color=SECONDARY_TEXT
+        # Shown on the next reporter frame
+        self.reporter.log(message)
+
+    def render_progress(self, reporter: ProgressReporter):
+        self.progress_bar.value = reporter.fraction
+        if reporter.total:
+            self.progress_text.value = (
+                f"Прогресс: {reporter.current}/{reporter.total} · "
+                f"успешно {reporter.counts['sent']} · ошибок {reporter.counts['failed']} · "
+                f"{reporter.rate:.1f} польз./с"
             )
-        )
-        if len(self.log_area.controls) > 100:
-            self.log_area.controls.pop(0)
-        self.log_area.scroll_to(offset=-1, duration=100)
+        if self.coordinator:
+            stats = self.coordinator.failure_stats
+        else:
+            stats = self.runner.manager.failure_stats if self.runner else None
+        self.failure_text.value = "Ошибки: " + ", ".join(
+            f"{code} × {count}" for code, count in stats.most_common()
+        ) if stats else ""
+        if reporter.log_changed:
+            self.log_text.value = "\n".join(reporter.lines)
+        self.render_queue()
         self.page.update()
 
+    def render_queue(self):
+        campaigns = self.scheduler.campaigns if self.scheduler else []
+        rows = []
+        for campaign in campaigns:
+            status = campaign.status
+            rows.append(ft.Row([
+                ft.Text(
+                    f"{campaign.name} · приоритет {campaign.priority:g} · {STATUS_LABELS[status]} · "
+                    f"{campaign.current}/{campaign.total}",
+                    size=12, color=SECONDARY_TEXT, expand=True
+                ),
+                ft.IconButton(
+                    icon=ft.Icons.PLAY_ARROW if status == "paused" else ft.Icons.PAUSE,
+                    icon_size=16,
+                    disabled=campaign.done,
+                    on_click=lambda e, c=campaign: self.toggle_pause(c)
+                ),
+                ft.IconButton(
+                    icon=ft.Icons.STOP,
+                    icon_size=16,
+                    icon_color="#CF6679",
+                    disabled=campaign.done,
+                    on_click=lambda e, c=campaign: c.stop()
+                ),
+            ], spacing=5))
+        self.queue_column.controls = rows
+
+    def toggle_pause(self, campaign):
+        if campaign.lane.paused:
+            campaign.resume()
+        else:
+            campaign.pause()
+        self.reporter.touch()
+
+    def read_settings(self):
+        """CampaignSettings from the form; raises ValueError on non-numeric fields."""
+        return self.backend.CampaignSettings(
+            message=self.message_input.value,
+            attachment=self.attachment_input.value,
+            files=self.selected_file_paths,
+            filter_type=self.filter_dropdown.value,
+            min_days=self.min_days_input.value or 0,
+            max_days=self.max_days_input.value or 365,
+            limit=self.limit_input.value or 0,
+            text_contains=self.text_filter_input.value,
+            interval=self.interval_slider.value,
+            concurrency=self.concurrency_input.value or 1,
+            batch=self.batch_mode_checkbox.value,
+            stream=self.stream_checkbox.value,
+            personalize=self.personalize_checkbox.value,
+            test_mode=self.test_mode_checkbox.value,
+            max_sends=self.max_sends_input.value or 0,
+            per_days=self.per_days_input.value or 7
+        )
+
     async def start_mailing(self, e):
-        if not self.vk_manager:
-            self.log("Ошибка: Настройки API не заданы.")
-            self.show_settings(None)
+        if not self.check_runner():
             return
-        
-        if not self.message_input.value and not self.attachment_input.value and not self.selected_file_path:
-            self.log("Ошибка: Сообщение и вложения пусты.")
+
+        try:
+            settings = self.read_settings()
+        except ValueError:
+            self.log("Ошибка: Дни, Лимит и число запросов должны быть числами.")
             return
 
         self.start_button.disabled = True
+        self.resume_button.disabled = True
         self.stop_button.disabled = False
-        
-        # Handle local file upload
-        final_attachment = self.attachment_input.value
-        if self.selected_file_path:
-            self.log(f"Загрузка файла {self.selected_file_path}...")
-            self.page.update()
-            uploaded_id = await self.vk_manager.upload_photo(self.selected_file_path)
-            if uploaded_id:
-                self.log(f"Файл успешно загружен: {uploaded_id}")
-                if final_attachment:
-                    final_attachment += f",{uploaded_id}"
-                else:
-                    final_attachment = uploaded_id
+        self.reporter.reset()
+        try:
+            if self.all_accounts_checkbox.value:
+                self.coordinator = self.backend.CampaignCoordinator(
+                    self.config.accounts(), DATA_DIR, log=self.log, runner=self.runner
+                )
+                await self.coordinator.run(settings, self.reporter.on_progress)
             else:
-                self.log("Ошибка при загрузке файла.")
-                self.reset_buttons()
-                return
+                await self.runner.run(settings, self.reporter.on_progress)
+        except Exception as ex:
+            self.log(f"Критическая ошибка: {ex}")
+        finally:
+            self.coordinator = None
 
-        self.log("Получение списка диалогов...")
-        self.page.update()
+        self.reset_buttons()
+        # The sync may have changed the index
+        await self.update_preview()
+
+    async def resume_mailing(self, e):
+        if not self.check_runner():
+            return
 
         try:
-            conversations = await self.vk_manager.fetch_conversations()
-            if not conversations:
-                self.log("Диалоги не найдены или произошла ошибка.")
-                self.reset_buttons()
-                return
-
-            # Get filter parameters
-            filter_type = self.filter_dropdown.value
-            try:
-                min_days = int(self.min_days_input.value or 0)
-                max_days = int(self.max_days_input.value or 365)
-                limit = int(self.limit_input.value or 0)
-            except ValueError:
-                self.log("Ошибка: Дни и Лимит должны быть числами.")
-                self.reset_buttons()
-                return
-
-            user_ids = await self.vk_manager.filter_users(
-                conversations, 
-                filter_type, 
-                min_days=min_days,
-                max_days=max_days,
-                limit=limit
-            )
+            concurrency = int(self.concurrency_input.value or 1)
+        except ValueError:
+            self.log("Ошибка: Число запросов должно быть числом.")
+            return
 
-            if not user_ids:
-                self.log("Нет пользователей, подходящих под фильтры.")
-                self.reset_buttons()
-                return
-
-            test_mode = self.test_mode_checkbox.value
-            mode_str = "(ТЕСТОВЫЙ РЕЖИМ)" if test_mode else ""
-            self.log(f"Найдено {len(user_ids)} пользователей. Запуск рассылки {mode_str}...")
-            
-            def on_progress(current, total, status):
-                self.progress_bar.value = current / total if total > 0 else 0
-                self.progress_text.value = f"Прогресс: {current}/{total} - {status}"
-                self.log(status)
-                self.page.update()
-
-            await self.vk_manager.mailing_loop(
-                user_ids, 
-                self.message_input.value, 
-                self.interval_slider.value, 
-                on_progress,
-                test_mode=test_mode,
-                attachment=final_attachment
+        self.start_button.disabled = True
+        self.resume_button.disabled = True
+        self.stop_button.disabled = False
+        self.reporter.reset()
+        try:
+            await self.runner.resume(
+                self.reporter.on_progress,
+                interval=self.interval_slider.value,
+                concurrency=concurrency
             )
         except Exception as ex:
             self.log(f"Критическая ошибка: {ex}")
-        
+
         self.reset_buttons()
 
+    async def queue_mailing(self, e):
+        """Adds the form as another campaign running alongside the queued ones."""
+        if not self.check_runner():
+            return
+
+        try:
+            settings = self.read_settings()
+            priority = float(self.priority_input.value or 1)
+            start_at = self.backend.parse_start_time(self.start_time_input.value) if self.start_time_input.value else None
+            quiet_hours = self.backend.QuietHours.parse(self.quiet_hours_input.value) if self.quiet_hours_input.value else None
+            if self.scheduler is None:
+                self.scheduler = self.backend.CampaignScheduler(self.runner, log=self.log)
+            self.scheduler.quiet_hours = quiet_hours
+            self.scheduler.add(
+                settings, priority=priority, start_at=start_at, on_progress=lambda *_: self.reporter.touch()
+            )
+        except ValueError as ex:
+            self.log(f"Ошибка: {ex}")
+            return
+        self.scheduler.launch()
+        self.reporter.touch()
+
+    def check_runner(self):
+        if self.runner:
+            return True
+        if self.initializing:
+            self.log("API ещё инициализируется, подождите...")
+        else:
+            self.log("Ошибка: Настройки API не заданы.")
+            self.show_settings(None)
+        return False
+
     def reset_buttons(self):
         self.start_button.disabled = False
+        self.resume_button.disabled = False
         self.stop_button.disabled = True
         self.page.update()
 
     def stop_mailing(self, e):
-        if self.vk_manager:
-            self.vk_manager.stop()
+        if self.coordinator:
+            self.coordinator.stop()
+        if self.scheduler:
+            self.scheduler.stop()
+        if self.runner:
+            self.runner.stop()
             self.log("Остановка рассылки...")
 
+class BackendModules:
+    """The mailing stack, imported on first use rather than at launch."""
+
+    def __init__(self):
+        from campaign import CampaignRunner, CampaignSettings
+        from coordinator import CampaignCoordinator
+        from scheduler import CampaignScheduler, QuietHours, parse_start_time
+        from simulator import ApiModel
+        self.CampaignRunner = CampaignRunner
+        self.CampaignSettings = CampaignSettings
+        self.CampaignCoordinator = CampaignCoordinator
+        self.CampaignScheduler = CampaignScheduler
+        self.QuietHours = QuietHours
+        self.parse_start_time = parse_start_time
+        self.ApiModel = ApiModel
+
+
 def main(page: ft.Page):
     VKSenderApp(page)
 
@@ -0,0 +1,209 @@
+import os
+import sys
+import json
+import time
+import asyncio
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Callable, Dict, List, Tuple
+
+def log_to_stderr(message: str):
+    """Default for the `log` callbacks: keeps stdout free for the front end's own output."""
+    sys.stderr.write(message + "\n")
+
+
+# Seconds; a bit finer than the Prometheus defaults at the fast end
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram: O(log buckets) per observation, constant memory."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile (0 <= q <= 1)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'buckets': {str(bound): count for bound, count in zip(self.buckets + ("+Inf",), self.counts)},
+        }
+
+
+class Metrics:
+    """In-process metrics for API calls, rate limiting and the send pipeline.
+
+    - per API method: call count, latency histogram (network time only),
+      error count per code
+    - named timings: `rate_limiter_wait`, `send_slot_wait`, `upload`,
+      `ui_render` and whatever else is passed to `observe()`
+    - gauges such as `send_queue_depth` (current value and peak)
+
+    Export with `to_prometheus()` or `to_dict()`; `summary()` gives the
+    human-readable lines logged after a campaign.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()  # (method, code) -> count
+        self.latency: Dict[str, Histogram] = {}
+        self.timings: Dict[str, Histogram] = {}
+        self.gauges: Dict[str, float] = {}
+        self.gauge_peaks: Dict[str, float] = {}
+
+    def observe_call(self, method: str, seconds: float, error_code: Any = None):
+        self.calls[method] += 1
+        histogram = self.latency.get(method)
+        if histogram is None:
+            histogram = self.latency[method] = Histogram()
+        histogram.observe(seconds)
+        if error_code is not None:
+            self.errors[(method, str(error_code))] += 1
+
+    def observe(self, name: str, seconds: float):
+        histogram = self.timings.get(name)
+        if histogram is None:
+            histogram = self.timings[name] = Histogram()
+        histogram.observe(seconds)
+
+    def set_gauge(self, name: str, value: float):
+        self.gauges[name] = value
+        if value > self.gauge_peaks.get(name, float("-inf")):
+            self.gauge_peaks[name] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'started': int(self.started),
+            'uptime_seconds': round(time.time() - self.started, 3),
+            'calls': dict(self.calls),
+            'errors': {f"{method}:{code}": count for (method, code), count in self.errors.items()},
+            'latency_seconds': {method: h.to_dict() for method, h in self.latency.items()},
+            'timings_seconds': {name: h.to_dict() for name, h in self.timings.items()},
+            'gauges': dict(self.gauges),
+            'gauge_peaks': dict(self.gauge_peaks),
+        }
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = [
+            "# TYPE vk_api_calls_total counter",
+            *(f'vk_api_calls_total{{method="{m}"}} {n}' for m, n in sorted(self.calls.items())),
+            "# TYPE vk_api_errors_total counter",
+            *(f'vk_api_errors_total{{method="{m}",code="{c}"}} {n}' for (m, c), n in sorted(self.errors.items())),
+            "# TYPE vk_api_latency_seconds histogram",
+        ]
+        for method, histogram in sorted(self.latency.items()):
+            lines.extend(self.histogram_lines("vk_api_latency_seconds", histogram, f'method="{method}"'))
+        for name, histogram in sorted(self.timings.items()):
+            lines.append(f"# TYPE vk_{name}_seconds histogram")
+            lines.extend(self.histogram_lines(f"vk_{name}_seconds", histogram))
+        for name, value in sorted(self.gauges.items()):
+            lines.append(f"# TYPE vk_{name} gauge")
+            lines.append(f"vk_{name} {value}")
+            lines.append(f"vk_{name}_max {self.gauge_peaks[name]}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def histogram_lines(name: str, histogram: Histogram, labels: str = "") -> List[str]:
+        prefix = labels + "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {histogram.sum:.6f}")
+        lines.append(f"{name}_count{suffix} {histogram.count}")
+        return lines
+
+    def summary(self) -> List[str]:
+        """A few lines for the log: where the time went and what failed."""
+        lines = []
+        for method, histogram in sorted(self.latency.items(), key=lambda item: -item[1].sum):
+            errors = sum(n for (m, _code), n in self.errors.items() if m == method)
+            lines.append(
+                f"{method}: {histogram.count} вызовов, {histogram.sum:.1f} с в сети, "
+                f"p50 ≤ {histogram.quantile(0.5) * 1000:g} мс, p99 ≤ {histogram.quantile(0.99) * 1000:g} мс"
+                + (f", ошибок {errors}" if errors else "")
+            )
+        for name, histogram in sorted(self.timings.items()):
+            lines.append(f"{name}: {histogram.count} раз, всего {histogram.sum:.1f} с")
+        if self.errors:
+            codes = Counter()
+            for (_method, code), count in self.errors.items():
+                codes[code] += count
+            lines.append("Коды ошибок: " + ", ".join(f"{code} × {count}" for code, count in codes.most_common()))
+        for name, peak in sorted(self.gauge_peaks.items()):
+            lines.append(f"{name}: максимум {peak:g}")
+        return lines
+
+
+async def serve_metrics(metrics: Metrics, host: str = "127.0.0.1", port: int = 9108):
+    """Starts a /metrics (Prometheus) and /metrics.json endpoint; returns the aiohttp runner."""
+    from aiohttp import web
+
+    async def prometheus(request):
+        return web.Response(text=metrics.to_prometheus(), content_type="text/plain", charset="utf-8")
+
+    async def as_json(request):
+        return web.json_response(metrics.to_dict())
+
+    app = web.Application()
+    app.router.add_get("/metrics", prometheus)
+    app.router.add_get("/metrics.json", as_json)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def write_json(metrics: Metrics, path: str):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(metrics.to_dict(), f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+async def dump_metrics(
+    metrics: Metrics,
+    path: str,
+    interval: float = 10.0,
+    log: Callable[[str], None] = log_to_stderr
+):
+    """Rewrites `path` with a JSON snapshot every `interval` seconds until cancelled."""
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                write_json(metrics, path)
+            except OSError as e:
+                log(f"Ошибка записи метрик: {e}")
+    finally:
+        try:
+            write_json(metrics, path)
+        except OSError as e:
+            log(f"Ошибка записи метрик: {e}")
@@ -0,0 +1,88 @@
+import time
+from collections import OrderedDict
+from string import Formatter
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+BASE_PROFILE_FIELDS = {"id", "first_name", "last_name"}  # returned by users.get without `fields`
+
+
+class ProfileCache:
+    """LRU cache of users.get profiles with a time-to-live."""
+
+    def __init__(self, max_size: int = 200_000, ttl: float = 24 * 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        # user id -> (stored at, fields requested, profile)
+        self.items: "OrderedDict[int, Tuple[float, FrozenSet[str], Dict[str, Any]]]" = OrderedDict()
+
+    def entry(self, user_id: int) -> Optional[Tuple[float, FrozenSet[str], Dict[str, Any]]]:
+        entry = self.items.get(user_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.ttl:
+            del self.items[user_id]
+            return None
+        self.items.move_to_end(user_id)
+        return entry
+
+    def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        entry = self.entry(user_id)
+        return entry[2] if entry else None
+
+    def put(self, profile: Dict[str, Any], fields: Iterable[str] = ()):
+        # VK omits empty fields from the profile, so remember what was asked for
+        self.items[profile['id']] = (time.monotonic(), frozenset(fields), profile)
+        self.items.move_to_end(profile['id'])
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+    def missing(self, user_ids: Iterable[int], fields: Iterable[str] = ()) -> List[int]:
+        """Ids that are not cached (or cached without some of the requested fields)."""
+        fields = set(fields)
+        result = []
+        for user_id in user_ids:
+            entry = self.entry(user_id)
+            if entry is None or not fields.issubset(entry[1]):
+                result.append(user_id)
+        return result
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+class MessageTemplate:
+    """Message text with `{field}` placeholders filled from the recipient's profile.
+
+    The text is parsed once; rendering just joins precompiled pieces.
+    Use `{{` and `}}` for literal braces.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.parts: List[Tuple[str, Optional[str]]] = []
+        for literal, field, _spec, _conversion in Formatter().parse(text):
+            self.parts.append((literal, field or None))
+        self.fields = {field for _literal, field in self.parts if field}
+        self.plain = "".join(literal for literal, _field in self.parts)
+
+    @property
+    def profile_fields(self) -> List[str]:
+        """Extra `fields` to request from users.get for this template."""
+        return sorted(self.fields - BASE_PROFILE_FIELDS)
+
+    @staticmethod
+    def format_value(value: Any) -> str:
+        if value is None:
+            return ""
+        if isinstance(value, dict):
+            # city, country etc. come as {"id": ..., "title": ...}
+            return str(value.get("title", ""))
+        return str(value)
+
+    def render(self, profile: Dict[str, Any]) -> str:
+        if not self.fields:
+            return self.plain
+        return "".join(
+            literal + (self.format_value(profile.get(field)) if field else "")
+            for literal, field in self.parts
+        )
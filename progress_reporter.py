@@ -0,0 +1,112 @@
+import time
+import asyncio
+from collections import Counter, deque
+from typing import Callable, Deque, Optional, Tuple
+from metrics import Metrics, log_to_stderr
+from delivery_status import outcome_of
+
+
+class ProgressReporter:
+    """Coalesces mailing progress and hands it to the UI at a fixed frame rate.
+
+    `on_progress()` and `log()` only bump counters and append to a bounded
+    deque, so the send loop never waits for the UI. `render(reporter)` is
+    called from `flush()` at most `fps` times a second, and only if something
+    changed. Successful sends are counted, not logged line by line.
+    """
+
+    def __init__(self, render: Callable[["ProgressReporter"], None], fps: float = 8,
+                 log_size: int = 200, rate_window: float = 10.0):
+        self.render = render
+        self.interval = 1 / fps
+        self.lines: Deque[str] = deque(maxlen=log_size)
+        self.rate_window = rate_window
+        self.samples: Deque[Tuple[float, int]] = deque()
+        self.counts: Counter = Counter()
+        self.current = 0
+        self.total = 0
+        self.status = ""
+        self.dirty = False
+        self.log_changed = False
+        self.task: Optional[asyncio.Task] = None
+        self.metrics: Optional[Metrics] = None  # render time goes to `ui_render`
+
+    def reset(self):
+        """Clears the counters before a new campaign; the log is kept."""
+        self.samples.clear()
+        self.counts.clear()
+        self.current = 0
+        self.total = 0
+        self.status = ""
+        self.dirty = True
+
+    def log(self, message: str):
+        self.lines.append(f"[{time.strftime('%H:%M:%S')}] {message}")
+        self.log_changed = True
+        self.dirty = True
+
+    def on_progress(self, current: int, total: int, status: str):
+        self.current = current
+        self.total = total
+        self.status = status
+        outcome = outcome_of(status)
+        if outcome is None:
+            self.log(status)
+        elif outcome:
+            self.counts['sent'] += 1
+        else:
+            self.counts['failed'] += 1
+            self.log(status)
+        self.dirty = True
+
+    def touch(self):
+        """Asks for a frame without logging anything."""
+        self.dirty = True
+
+    @property
+    def fraction(self) -> float:
+        return self.current / self.total if self.total > 0 else 0
+
+    @property
+    def rate(self) -> float:
+        """Recipients processed per second over the last `rate_window` seconds."""
+        if len(self.samples) < 2:
+            return 0.0
+        (first_time, first_done), (last_time, last_done) = self.samples[0], self.samples[-1]
+        if last_time <= first_time:
+            return 0.0
+        return (last_done - first_done) / (last_time - first_time)
+
+    def sample(self):
+        now = time.monotonic()
+        self.samples.append((now, self.current))
+        while len(self.samples) > 2 and now - self.samples[0][0] > self.rate_window:
+            self.samples.popleft()
+
+    def flush(self):
+        """Renders one frame if anything changed since the previous one."""
+        self.sample()
+        if not self.dirty:
+            return
+        self.dirty = False
+        started = time.perf_counter()
+        try:
+            self.render(self)
+        except Exception as e:
+            log_to_stderr(f"Ошибка отрисовки прогресса: {e}")
+        if self.metrics:
+            self.metrics.observe('ui_render', time.perf_counter() - started)
+        self.log_changed = False
+
+    async def run(self):
+        """Frame loop; keep it running for the lifetime of the window."""
+        self.task = asyncio.current_task()
+        while True:
+            await asyncio.sleep(self.interval)
+            self.flush()
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        self.flush()
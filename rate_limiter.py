@@ -0,0 +1,71 @@
+import asyncio
+import time
+from typing import Callable
+
+THROTTLE_ERROR_CODES = {
+    6,   # Too many requests per second
+    9,   # Flood control
+    29,  # Rate limit reached
+}
+
+
+class AdaptiveRateLimiter:
+    """Async token bucket shared by every API call of a token.
+
+    Throttling errors halve the rate and pause the bucket for `cooldown`
+    seconds; each successful call then ramps the rate back up by `ramp_step`
+    until `rps` is reached again.
+    """
+
+    def __init__(
+        self,
+        rps: float = 15,
+        burst: int = 5,
+        min_rps: float = 0.5,
+        ramp_step: float = 0.1,
+        cooldown: float = 1.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.max_rps = rps
+        self.rate = rps
+        self.burst = max(1, burst)
+        self.min_rps = min(min_rps, rps)
+        self.ramp_step = ramp_step
+        self.cooldown = cooldown
+        self.clock = clock  # a virtual clock in simulations
+        self.tokens = float(self.burst)
+        self.updated_at = clock()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        """Waits until a request may be sent."""
+        # The lock makes waiters line up in FIFO order instead of racing for tokens
+        async with self.lock:
+            while True:
+                now = self.clock()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                # At least a microsecond: with a virtual clock a rounding-sized wait would never refill
+                await asyncio.sleep(max(1e-6, (1 - self.tokens) / self.rate))
+
+    def on_success(self):
+        if self.rate < self.max_rps:
+            self.rate = min(self.max_rps, self.rate + self.ramp_step)
+
+    def on_throttled(self):
+        """VK reported a rate/flood limit: slow down and drain the bucket."""
+        now = self.clock()
+        self.refill(now)
+        self.rate = max(self.min_rps, self.rate / 2)
+        self.tokens = 0.0
+        self.paused_until = max(self.paused_until, now + self.cooldown)
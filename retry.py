@@ -0,0 +1,100 @@
+import asyncio
+import csv
+import random
+from typing import Any, Dict, List, Optional
+import aiohttp
+from vk_api.exceptions import ApiError, ApiHttpError
+
+# VK error codes worth retrying: the same request may succeed a bit later
+TRANSIENT_ERROR_CODES = {
+    1,   # Unknown error
+    6,   # Too many requests per second
+    9,   # Flood control
+    10,  # Internal server error
+    29,  # Rate limit reached
+    "timeout",
+    "network",
+    "stale_attachment",  # cached upload was refreshed, send again with the new one
+}
+
+# Errors that will not go away by retrying; the recipient is dead-lettered at once
+PERMANENT_ERROR_CODES = {
+    5,    # Authorization failed
+    7,    # Permission denied
+    15,   # Access denied
+    18,   # User deleted or banned
+    100,  # Invalid parameter
+    900,  # Recipient blacklisted the group
+    901,  # Can't send messages without user's permission
+    902,  # Recipient's privacy settings
+    914,  # Message too long
+}
+
+
+def classify_error(error: BaseException) -> Dict[str, Any]:
+    """Turns a send exception into a failure record: {'code': ..., 'reason': ...}."""
+    if isinstance(error, ApiError):
+        return {'code': error.code, 'reason': error.error.get('error_msg', str(error))}
+    if isinstance(error, ApiHttpError):
+        return {'code': f"http_{error.response.status_code}", 'reason': str(error)}
+    if isinstance(error, asyncio.TimeoutError):
+        return {'code': "timeout", 'reason': "Request timed out"}
+    if isinstance(error, aiohttp.ClientError):
+        return {'code': "network", 'reason': str(error) or type(error).__name__}
+    return {'code': type(error).__name__, 'reason': str(error)}
+
+
+def is_transient(code: Any) -> bool:
+    if code in TRANSIENT_ERROR_CODES:
+        return True
+    # 5xx from VK or a proxy in between
+    return isinstance(code, str) and code.startswith("http_5")
+
+
+def is_stale_attachment(failure: Dict[str, Any]) -> bool:
+    """VK refused the attachment itself (e.g. the uploaded photo was deleted)."""
+    return failure['code'] == 100 and "attachment" in str(failure['reason']).lower()
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter for transient send failures."""
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, code: Any, attempt: int) -> bool:
+        """`attempt` is the number of attempts already made."""
+        return attempt < self.max_attempts and is_transient(code)
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class DeadLetterList:
+    """Recipients that could not be reached, with the reason of the last failure."""
+
+    def __init__(self):
+        self.entries: List[Dict[str, Any]] = []
+
+    def add(self, peer_id: int, failure: Dict[str, Any], attempts: int = 1):
+        self.entries.append({
+            'peer_id': peer_id,
+            'code': failure['code'],
+            'reason': failure['reason'],
+            'attempts': attempts
+        })
+
+    def export_csv(self, path: str) -> Optional[str]:
+        """Writes the list to a CSV file; returns the path or None if there is nothing to write."""
+        if not self.entries:
+            return None
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=['peer_id', 'code', 'reason', 'attempts'])
+            writer.writeheader()
+            writer.writerows(self.entries)
+        return path
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,339 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+from rate_limiter import AdaptiveRateLimiter
+from campaign import CampaignRunner, CampaignSettings
+
+
+class QuietHours:
+    """Local-time hours [start, end) when campaigns make no requests, e.g. 22–9 (may wrap midnight)."""
+
+    def __init__(self, start: int, end: int):
+        if not (0 <= start <= 23 and 0 <= end <= 23):
+            raise ValueError("часы тишины задаются числами от 0 до 23")
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def parse(cls, value: str) -> "QuietHours":
+        """"22-9" -> QuietHours(22, 9)"""
+        try:
+            start, end = value.split("-", 1)
+            return cls(int(start), int(end))
+        except ValueError:
+            raise ValueError(f"некорректные часы тишины: {value!r} (нужно, например, 22-9)")
+
+    def __str__(self) -> str:
+        return f"{self.start}-{self.end}"
+
+    def contains(self, moment: datetime) -> bool:
+        if self.start == self.end:
+            return False
+        if self.start < self.end:
+            return self.start <= moment.hour < self.end
+        return moment.hour >= self.start or moment.hour < self.end
+
+    def delay(self, now: Optional[float] = None) -> float:
+        """Seconds until sending is allowed again (0 outside quiet hours)."""
+        moment = datetime.fromtimestamp(time.time() if now is None else now)
+        if not self.contains(moment):
+            return 0.0
+        end = moment.replace(hour=self.end, minute=0, second=0, microsecond=0)
+        if end <= moment:
+            end += timedelta(days=1)
+        return (end - moment).total_seconds()
+
+
+def parse_start_time(value: str, now: Optional[float] = None) -> float:
+    """"2026-10-18 10:00" or "10:00" (the next such time of day) -> Unix time."""
+    value = value.strip()
+    moment = datetime.fromtimestamp(time.time() if now is None else now)
+    try:
+        if " " in value or "T" in value:
+            return datetime.fromisoformat(value).timestamp()
+        start = datetime.combine(moment.date(), datetime.strptime(value, "%H:%M").time())
+    except ValueError:
+        raise ValueError(f"некорректное время запуска: {value!r} (нужно ЧЧ:ММ или ГГГГ-ММ-ДД ЧЧ:ММ)")
+    if start <= moment:
+        start += timedelta(days=1)
+    return start.timestamp()
+
+
+class Lane:
+    """One campaign's entrance to a FairShareLimiter.
+
+    Has the AdaptiveRateLimiter interface (acquire / on_success / on_throttled),
+    so it is handed to VKManager in place of the token's limiter. A paused lane
+    holds its callers in `acquire()`; requests already sent still complete.
+    """
+
+    def __init__(self, limiter: "FairShareLimiter", weight: float):
+        self.limiter = limiter
+        self.weight = weight
+        self.finish = 0.0
+        self.resumed = asyncio.Event()
+        self.resumed.set()
+
+    @property
+    def paused(self) -> bool:
+        return not self.resumed.is_set()
+
+    def pause(self):
+        self.resumed.clear()
+
+    def resume(self):
+        self.resumed.set()
+
+    async def acquire(self):
+        while True:
+            await self.resumed.wait()
+            delay = self.limiter.quiet_delay()
+            if delay <= 0:
+                break
+            # Re-check now and then, so a pause or a changed schedule is picked up
+            await asyncio.sleep(min(delay, 60))
+        await self.limiter.acquire(self)
+
+    def on_success(self):
+        self.limiter.bucket.on_success()
+
+    def on_throttled(self):
+        self.limiter.bucket.on_throttled()
+
+
+class FairShareLimiter:
+    """Weighted fair queueing in front of one token's AdaptiveRateLimiter.
+
+    Each request gets a finish tag `max(virtual_time, lane.finish) + 1 / weight`
+    and the smallest tag takes the next token from the bucket. Busy lanes thus
+    split the token's budget in proportion to their weights, an idle lane
+    banks no credit, and the bucket's own AIMD backoff still applies to all.
+    """
+
+    def __init__(self, bucket: AdaptiveRateLimiter, quiet_hours: Optional[QuietHours] = None):
+        self.bucket = bucket
+        self.quiet_hours = quiet_hours
+        self.virtual_time = 0.0
+        self.waiting: list = []
+        self.order = itertools.count()
+        self.dispatcher: Optional[asyncio.Task] = None
+
+    def lane(self, weight: float = 1) -> Lane:
+        if weight <= 0:
+            raise ValueError("приоритет должен быть больше нуля")
+        return Lane(self, weight)
+
+    def quiet_delay(self) -> float:
+        return self.quiet_hours.delay() if self.quiet_hours else 0.0
+
+    async def acquire(self, lane: Lane):
+        lane.finish = max(self.virtual_time, lane.finish) + 1 / lane.weight
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, (lane.finish, next(self.order), future))
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.create_task(self.dispatch())
+        await future
+
+    async def dispatch(self):
+        while self.waiting:
+            await self.bucket.acquire()
+            # Pick the winner only once the token is there, so late high-weight requests can overtake
+            while self.waiting:
+                finish, _, future = heapq.heappop(self.waiting)
+                if not future.done():  # Cancelled waiters are skipped
+                    self.virtual_time = finish
+                    future.set_result(None)
+                    break
+
+
+class ScheduledCampaign:
+    """A queued campaign and its controls; `status` is what the UI shows."""
+
+    def __init__(
+        self,
+        name: str,
+        settings: CampaignSettings,
+        lane: Lane,
+        start_at: Optional[float] = None,
+        on_progress: Optional[Callable[[int, int, str], None]] = None
+    ):
+        self.name = name
+        self.settings = settings
+        self.lane = lane
+        self.start_at = start_at
+        self.callback = on_progress
+        self.state = "scheduled"  # scheduled, running, finished, stopped, failed
+        self.current = 0
+        self.total = 0
+        self.last_status = ""
+        self.task: Optional[asyncio.Task] = None
+        self.runner: Optional[CampaignRunner] = None
+
+    @property
+    def priority(self) -> float:
+        return self.lane.weight
+
+    @property
+    def done(self) -> bool:
+        return self.state in ("finished", "stopped", "failed")
+
+    @property
+    def status(self) -> str:
+        return "paused" if self.lane.paused and not self.done else self.state
+
+    def on_progress(self, current: int, total: int, status: str):
+        self.current = current
+        self.total = total
+        self.last_status = status
+        if self.callback:
+            self.callback(current, total, status)
+
+    def pause(self):
+        self.lane.pause()
+
+    def resume(self):
+        self.lane.resume()
+
+    def stop(self):
+        """Cancels the campaign right away, also mid-sleep; its journal stays resumable."""
+        self.lane.resume()
+        if self.task and not self.task.done():
+            self.task.cancel()
+        elif self.task is None:
+            self.state = "stopped"
+
+
+class CampaignScheduler:
+    """Runs several campaigns of one group at once under the token's request budget.
+
+    Every campaign sends through its own lane of a FairShareLimiter wrapped
+    around the token's rate limiter, so they share the budget in proportion to
+    their `priority` (2 gets twice the requests of 1 while both are busy).
+    Campaigns wait for their `start_at` time, no requests are made during
+    `quiet_hours`, and each one can be paused, resumed or stopped on its own.
+    """
+
+    def __init__(
+        self,
+        runner: CampaignRunner,
+        quiet_hours: Optional[QuietHours] = None,
+        log: Callable[[str], None] = print
+    ):
+        self.runner = runner
+        self.limiter = FairShareLimiter(runner.manager.rate_limiter, quiet_hours)
+        self.log = log
+        self.campaigns: List[ScheduledCampaign] = []
+        self.started = False
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def quiet_hours(self) -> Optional[QuietHours]:
+        return self.limiter.quiet_hours
+
+    @quiet_hours.setter
+    def quiet_hours(self, value: Optional[QuietHours]):
+        self.limiter.quiet_hours = value
+
+    def add(
+        self,
+        settings: CampaignSettings,
+        name: Optional[str] = None,
+        priority: float = 1,
+        start_at: Optional[float] = None,
+        on_progress: Optional[Callable[[int, int, str], None]] = None
+    ) -> ScheduledCampaign:
+        """Queues a campaign; if the scheduler is already running it starts straight away."""
+        settings.validate()
+        campaign = ScheduledCampaign(
+            name or f"Рассылка {len(self.campaigns) + 1}",
+            settings,
+            self.limiter.lane(priority),
+            start_at=start_at,
+            on_progress=on_progress
+        )
+        self.campaigns.append(campaign)
+        if self.started:
+            self.start(campaign)
+        return campaign
+
+    def add_plan(self, plan: Dict[str, Any], base_dir: str = "") -> List[ScheduledCampaign]:
+        """Queues the campaigns of a plan file.
+
+        {"quiet_hours": "22-9", "campaigns": [{"name": "...", "priority": 2,
+        "start_at": "10:00", "campaign": "spring.json" or "settings": {...}}]}
+        """
+        if plan.get("quiet_hours"):
+            self.quiet_hours = QuietHours.parse(plan["quiet_hours"])
+        campaigns = []
+        for entry in plan.get("campaigns") or []:
+            if entry.get("campaign"):
+                settings = CampaignSettings.from_file(os.path.join(base_dir, entry["campaign"]))
+            else:
+                settings = CampaignSettings.from_dict(entry.get("settings") or {})
+            campaigns.append(self.add(
+                settings,
+                name=entry.get("name"),
+                priority=entry.get("priority", 1),
+                start_at=parse_start_time(entry["start_at"]) if entry.get("start_at") else None
+            ))
+        return campaigns
+
+    def get(self, name: str) -> Optional[ScheduledCampaign]:
+        return next((c for c in self.campaigns if c.name == name), None)
+
+    def start(self, campaign: ScheduledCampaign):
+        if campaign.task is None and not campaign.done:
+            campaign.task = asyncio.create_task(self.run_campaign(campaign))
+
+    async def run_campaign(self, campaign: ScheduledCampaign):
+        runner = campaign.runner = self.runner.fork(campaign.lane)
+        runner.log = lambda message: self.log(f"[{campaign.name}] {message}")
+        try:
+            delay = campaign.start_at - time.time() if campaign.start_at else 0
+            if delay > 0:
+                runner.log(f"Запуск в {time.strftime('%d.%m %H:%M', time.localtime(campaign.start_at))}.")
+                await asyncio.sleep(delay)
+            campaign.state = "running"
+            ok = await runner.run(campaign.settings, campaign.on_progress)
+            campaign.state = "finished" if ok else "failed"
+        except asyncio.CancelledError:
+            campaign.state = "stopped"
+            runner.log("Остановлено пользователем.")
+        except Exception as e:
+            campaign.state = "failed"
+            runner.log(f"Критическая ошибка: {e}")
+        finally:
+            await runner.close()
+
+    async def run(self):
+        """Runs every queued campaign, including ones added meanwhile, until all are done."""
+        self.started = True
+        self.runner.manager.metrics.reset()
+        try:
+            for campaign in self.campaigns:
+                self.start(campaign)
+            while True:
+                pending = [c.task for c in self.campaigns if c.task and not c.task.done()]
+                if not pending:
+                    break
+                await asyncio.wait(pending)
+        except asyncio.CancelledError:
+            self.stop()
+            raise
+        finally:
+            self.started = False
+            self.runner.log_metrics()
+
+    def launch(self) -> asyncio.Task:
+        """Starts `run()` in the background unless it is already running."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+        return self.task
+
+    def stop(self):
+        for campaign in self.campaigns:
+            campaign.stop()
@@ -0,0 +1,317 @@
+"""Dry runs: the real mailing pipeline against a simulated API on a virtual clock.
+
+`simulate()` runs VKManager.mailing_loop (batching, rate limiting, AIMD
+backoff, retries, personalization) unchanged, but every API call is answered
+in-process by SimulatedVkApi after a modelled latency, and time is virtual:
+when nothing is runnable the event loop jumps to the next timer instead of
+sleeping. A 100k-recipient campaign that would take hours is projected in
+seconds.
+"""
+import time
+import random
+import asyncio
+import selectors
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+from vk_api.exceptions import ApiHttpError
+from rate_limiter import AdaptiveRateLimiter, THROTTLE_ERROR_CODES
+from suppression import SUPPRESS_ERROR_CODES
+from vk_logic import VKManager
+from delivery_status import outcome_of
+from vk_transport import AsyncVkApi, HttpResponse
+
+VK_GROUP_RPS = 20  # VK's own limit for community tokens
+
+# Also used by fake_vk_server.py, which the CLI must not import (aiohttp.web)
+ERROR_MESSAGES = {
+    6: "Too many requests per second",
+    9: "Flood control",
+    10: "Internal server error",
+    901: "Can't send messages for users without permission",
+}
+
+
+def parse_error_rates(values: List[str]) -> Dict[int, float]:
+    """["6=0.01", "502=0.001"] -> {6: 0.01, 502: 0.001}"""
+    rates = {}
+    for value in values or []:
+        code, rate = value.split("=", 1)
+        rates[int(code)] = float(rate)
+    return rates
+
+
+class VirtualSelector(selectors.BaseSelector):
+    """Wraps a real selector; a blocking wait advances the loop's clock instead."""
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.loop: Optional["VirtualClockLoop"] = None
+
+    def register(self, fileobj, events, data=None):
+        return self.selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self.selector.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self.selector.modify(fileobj, events, data)
+
+    def select(self, timeout=None):
+        events = self.selector.select(0)
+        if events or timeout == 0:
+            return events
+        if timeout is None:
+            # Nothing scheduled: only another thread can wake us, so really wait
+            return self.selector.select(None)
+        self.loop.now += timeout
+        return events
+
+    def close(self):
+        self.selector.close()
+
+    def get_map(self):
+        return self.selector.get_map()
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """Event loop whose `time()` only moves when every task is waiting on a timer.
+
+    Only meant for code that does no real I/O: a socket read would never be
+    waited for, the clock would just skip ahead.
+    """
+
+    def __init__(self):
+        selector = VirtualSelector()
+        super().__init__(selector)
+        selector.loop = self
+        self.now = 0.0
+
+    def time(self) -> float:
+        return self.now
+
+
+class ApiModel:
+    """How the simulated API behaves.
+
+    `latency` + up to `jitter` seconds per call. `error_rates` maps an error
+    code to its probability: 6, 9, 10 etc. fail the whole call, codes >= 500
+    come back as HTTP statuses, and codes of users refusing messages (901...)
+    fail single recipients. Calls above `rps_limit` per second get error 6,
+    like VK answers a token exceeding its limit.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.08,
+        jitter: float = 0.04,
+        error_rates: Optional[Dict[int, float]] = None,
+        rps_limit: float = VK_GROUP_RPS,
+        seed: Optional[int] = None
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rates = dict(error_rates or {})
+        self.rps_limit = rps_limit
+        self.seed = seed
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ApiModel":
+        """From the "simulation" section of config.json; error_rates as {"901": 0.02} or ["901=0.02"]."""
+        rates = data.get('error_rates') or {}
+        if isinstance(rates, list):
+            rates = parse_error_rates(rates)
+        return cls(
+            latency=float(data.get('latency', 0.08)),
+            jitter=float(data.get('jitter', 0.04)),
+            error_rates={int(code): float(rate) for code, rate in rates.items()},
+            rps_limit=float(data.get('rps_limit', VK_GROUP_RPS)),
+            seed=data.get('seed')
+        )
+
+
+class SimulatedVkApi(AsyncVkApi):
+    """AsyncVkApi whose HTTP round trip is replaced by the ApiModel."""
+
+    def __init__(self, model: ApiModel, rate_limiter: AdaptiveRateLimiter, **kwargs):
+        super().__init__("simulation", rate_limiter=rate_limiter, **kwargs)
+        self.model = model
+        self.random = random.Random(model.seed)
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.window_start = 0.0
+        self.window_calls = 0
+        self.next_id = 0
+
+    def roll(self, code: int) -> bool:
+        rate = self.model.error_rates.get(code, 0)
+        return rate > 0 and self.random.random() < rate
+
+    def over_rate_limit(self) -> bool:
+        if not self.model.rps_limit:
+            return False
+        now = asyncio.get_running_loop().time()
+        if now - self.window_start >= 1:
+            self.window_start = now
+            self.window_calls = 0
+        self.window_calls += 1
+        return self.window_calls > self.model.rps_limit
+
+    def error(self, code: int) -> Dict[str, Any]:
+        self.errors[code] += 1
+        return {'error': {'error_code': code, 'error_msg': ERROR_MESSAGES.get(code, "Simulated error")}}
+
+    async def request(self, method: str, values: Dict[str, str], raw: bool = False) -> Dict[str, Any]:
+        self.calls[method] += 1
+        model = self.model
+        await asyncio.sleep(model.latency + (self.random.uniform(0, model.jitter) if model.jitter else 0))
+        if self.over_rate_limit():
+            return self.error(6)
+        for code in sorted(model.error_rates):
+            if code in SUPPRESS_ERROR_CODES or not self.roll(code):
+                continue
+            if code >= 500:
+                self.errors[code] += 1
+                raise ApiHttpError(self, method, values, raw, HttpResponse(code, "simulated"))
+            return self.error(code)
+
+        if method == 'messages.send':
+            return self.send(values)
+        if method == 'users.get':
+            return {'response': [self.user(int(i)) for i in values['user_ids'].split(",")]}
+        if method == 'execute' and "API.users.get" in values['code']:
+            return {'response': [
+                [self.user(int(i)) for i in values[f"ids{n}"].split(",")]
+                for n in range(values['code'].count("API.users.get"))
+            ]}
+        return self.error(3)
+
+    def send(self, values: Dict[str, str]) -> Dict[str, Any]:
+        if 'peer_ids' not in values:
+            code = self.refused()
+            if code:
+                return self.error(code)
+            self.next_id += 1
+            return {'response': self.next_id}
+        result = []
+        for peer_id in map(int, values['peer_ids'].split(",")):
+            code = self.refused()
+            if code:
+                self.errors[code] += 1
+                result.append({'peer_id': peer_id, 'error': {'code': code, 'description': ERROR_MESSAGES.get(code, "")}})
+            else:
+                self.next_id += 1
+                result.append({'peer_id': peer_id, 'message_id': self.next_id})
+        return {'response': result}
+
+    def refused(self) -> Optional[int]:
+        """A per-recipient error code rolled for one user, if any."""
+        for code in sorted(SUPPRESS_ERROR_CODES):
+            if self.roll(code):
+                return code
+        return None
+
+    @staticmethod
+    def user(user_id: int) -> Dict[str, Any]:
+        return {'id': user_id, 'first_name': "Имя", 'last_name': "Фамилия"}
+
+    async def close(self):
+        pass
+
+
+async def run_simulation(
+    user_ids: List[int],
+    message: str,
+    model: ApiModel,
+    attachment: str = "",
+    interval: float = 0,
+    batch_size: int = 1,
+    concurrency: int = 4,
+    personalize: bool = False,
+    rps: float = 15,
+    burst: int = 5,
+    on_progress: Optional[Callable[[int, int, str], None]] = None
+) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    limiter = AdaptiveRateLimiter(rps=rps, burst=burst, clock=loop.time)
+    # Per-send errors are summed up in the report instead of logged
+    manager = VKManager("simulation", 1, rate_limiter=limiter, log=lambda message: None)
+    api = manager.api = SimulatedVkApi(model, rate_limiter=limiter)
+    manager.vk = api.get_api()
+
+    outcome = Counter()
+
+    def progress(current: int, total: int, status: str):
+        if outcome_of(status):
+            outcome['delivered'] += 1
+        if on_progress:
+            on_progress(current, total, status)
+
+    started = loop.time()
+    await manager.mailing_loop(
+        user_ids, message, interval, progress,
+        attachment=attachment,
+        batch_size=batch_size,
+        concurrency=concurrency,
+        personalize=personalize
+    )
+    failed = Counter(str(entry['code']) for entry in manager.dead_letters.entries)
+    return {
+        'recipients': len(user_ids),
+        'delivered': outcome['delivered'],
+        'failed': sum(failed.values()),
+        'failed_by_code': dict(failed),
+        'duration_seconds': round(loop.time() - started, 1),
+        'requests': sum(api.calls.values()),
+        'requests_by_method': dict(api.calls),
+        'failed_attempts_by_code': {str(code): count for code, count in manager.failure_stats.items()},
+        'throttled': sum(api.errors[code] for code in THROTTLE_ERROR_CODES),
+    }
+
+
+def simulate(
+    user_ids: List[int],
+    message: str,
+    model: Optional[ApiModel] = None,
+    on_progress: Optional[Callable[[int, int, str], None]] = None,
+    **options
+) -> Dict[str, Any]:
+    """Runs a dry run on its own virtual-clock loop and returns the projection.
+
+    Blocks; call it through `asyncio.to_thread` from a running loop. Options
+    are those of `run_simulation` (attachment, interval, batch_size, ...).
+    """
+    loop = VirtualClockLoop()
+    wall = time.perf_counter()
+    try:
+        report = loop.run_until_complete(
+            run_simulation(user_ids, message, model or ApiModel(), on_progress=on_progress, **options)
+        )
+    finally:
+        loop.close()
+    report['wall_seconds'] = round(time.perf_counter() - wall, 3)
+    return report
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours} ч {minutes} мин"
+    if minutes:
+        return f"{minutes} мин {seconds} с"
+    return f"{seconds} с"
+
+
+def summary(report: Dict[str, Any]) -> List[str]:
+    """Log lines for a simulation report."""
+    lines = [
+        f"Получателей: {report['recipients']}, доставлено бы: {report['delivered']}, "
+        f"не доставлено: {report['failed']}",
+        f"Ожидаемая длительность: {format_duration(report['duration_seconds'])}, "
+        f"запросов к API: {report['requests']} (из них с ошибкой лимита: {report['throttled']})",
+    ]
+    if report['failed_by_code']:
+        lines.append("Ожидаемые ошибки: " + ", ".join(
+            f"{code} × {count}" for code, count in Counter(report['failed_by_code']).most_common()
+        ))
+    return lines
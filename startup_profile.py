@@ -0,0 +1,161 @@
+"""Cold-start timings, tracked between releases like benchmark.py throughput.
+
+    python startup_profile.py --runs 7 --output startup.json
+    python startup_profile.py --compare startup.json
+
+Every step runs in a fresh interpreter (nothing cached in sys.modules), and
+the median of --runs is reported in milliseconds: interpreter start, the
+imports the window needs before its first frame, the modules the GUI loads
+in the background, and building a CampaignRunner. With --compare, steps that
+got slower by more than --tolerance (and by more than --min-delta ms, to
+ignore noise on fast steps) are listed on stderr and the exit code is 1.
+
+The GUI logs the same breakdown for a real launch (`StartupTimer`).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Any, Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Step name -> (setup, timed code). Only the timed part is measured.
+STEPS = {
+    'interpreter': ("", "pass"),
+    'import_ui_core': ("", "import config_file, progress_reporter, activity_index"),
+    'import_flet': ("", "import flet"),
+    'import_vk_api': ("", "import vk_api"),
+    'import_aiohttp': ("", "import aiohttp"),
+    'import_campaign': ("", "import campaign"),
+    'import_gui_backend': ("", "import campaign, coordinator, scheduler"),
+    'import_vk_sender': ("", "import vk_sender"),
+    'runner_init': (
+        "import tempfile, campaign; data_dir = tempfile.mkdtemp()",
+        "campaign.CampaignRunner('token', 1, data_dir, log=lambda message: None)"
+    ),
+}
+
+SCRIPT = """
+import time
+_started = time.perf_counter()
+{setup}
+_started = time.perf_counter() if {has_setup} else _started
+{code}
+print(time.perf_counter() - _started)
+"""
+
+
+class StartupTimer:
+    """Splits a launch into named phases: `mark(name)` closes the phase that just ended."""
+
+    def __init__(self):
+        self.started = self.last = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def mark(self, phase: str) -> float:
+        now = time.perf_counter()
+        self.phases[phase] = now - self.last
+        self.last = now
+        return self.phases[phase]
+
+    @property
+    def total(self) -> float:
+        return self.last - self.started
+
+    def summary(self) -> str:
+        parts = [f"{phase} {seconds * 1000:.0f} мс" for phase, seconds in self.phases.items()]
+        return ", ".join(parts) + f" (всего {self.total * 1000:.0f} мс)"
+
+
+def run_step(setup: str, code: str) -> Optional[float]:
+    """Seconds the code took in a fresh interpreter; None if it failed (e.g. flet missing)."""
+    # Imported here: main.py imports this module for StartupTimer before its first frame
+    import subprocess
+    script = SCRIPT.format(setup=setup, code=code, has_setup=bool(setup))
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", script], cwd=HERE, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        return None
+    # For the interpreter itself, the whole process lifetime is the measurement
+    return wall if code == "pass" else float(result.stdout.strip().splitlines()[-1])
+
+
+def profile(runs: int, steps: Optional[List[str]] = None) -> Dict[str, Any]:
+    import platform
+    import statistics
+    results = {}
+    for name in steps or STEPS:
+        setup, code = STEPS[name]
+        samples = []
+        for _ in range(runs):
+            seconds = run_step(setup, code)
+            if seconds is None:
+                break
+            samples.append(seconds * 1000)
+        if not samples:
+            results[name] = None
+            continue
+        results[name] = {
+            'median_ms': round(statistics.median(samples), 1),
+            'min_ms': round(min(samples), 1),
+            'max_ms': round(max(samples), 1),
+        }
+    return {
+        'meta': {
+            'timestamp': int(time.time()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'runs': runs,
+        },
+        'results': results,
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_delta: float) -> List[str]:
+    """Steps whose median grew more than `tolerance` (0.2 = 20%) and `min_delta` ms over the baseline."""
+    regressions = []
+    for name, old in baseline.get('results', {}).items():
+        new = report['results'].get(name)
+        if not new or not old or not old.get('median_ms'):
+            continue
+        ratio = new['median_ms'] / old['median_ms']
+        if ratio > 1 + tolerance and new['median_ms'] - old['median_ms'] > min_delta:
+            regressions.append(f"{name}: {old['median_ms']} -> {new['median_ms']} ms ({ratio:.0%})")
+    return regressions
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Cold-start import and init timings.")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per step")
+    parser.add_argument("--step", action="append", choices=list(STEPS), help="only these steps")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON report")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--min-delta", type=float, default=10, help="ms; smaller slowdowns are noise")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    report = profile(args.runs, args.step)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance, args.min_delta)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+import os
+import array
+import bisect
+import threading
+from typing import Iterable, Optional, Set
+
+# Send failures meaning the user does not want (or cannot get) our messages
+SUPPRESS_ERROR_CODES = {
+    18,   # User deleted or banned
+    900,  # Recipient blacklisted the group
+    901,  # Messages not allowed by the user
+    902,  # Recipient's privacy settings
+}
+
+
+class SuppressionList:
+    """Persistent set of peer ids that must not be messaged.
+
+    Stored as a sorted array of unsigned 32-bit ints (4 bytes per id, VK user
+    ids fit) and searched with bisect, so millions of ids cost a few MB instead
+    of the ~60 bytes per entry of a Python set. The file is loaded on the first
+    lookup; recent changes live in small add/remove sets until `save()` merges
+    them into the array. `save()` may run in a worker thread while the loop
+    keeps changing the list: it writes a snapshot of the pending changes and
+    afterwards keeps whatever changed again in the meantime.
+    """
+
+    TYPECODE = "I"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._ids: Optional[array.array] = None
+        self.added: Set[int] = set()
+        self.removed: Set[int] = set()
+        # `lock` guards the pending sets, `save_lock` lets one save run at a time
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+
+    @property
+    def ids(self) -> array.array:
+        if self._ids is None:
+            self._ids = array.array(self.TYPECODE)
+            if os.path.exists(self.path):
+                with open(self.path, "rb") as f:
+                    self._ids.frombytes(f.read())
+        return self._ids
+
+    def __contains__(self, peer_id: int) -> bool:
+        if peer_id in self.added:
+            return True
+        if peer_id in self.removed:
+            return False
+        return self._stored(peer_id)
+
+    def __len__(self) -> int:
+        # `added` only holds ids missing from the array, `removed` only ids present in it
+        return len(self.ids) + len(self.added) - len(self.removed)
+
+    def _stored(self, peer_id: int) -> bool:
+        ids = self.ids
+        i = bisect.bisect_left(ids, peer_id)
+        return i < len(ids) and ids[i] == peer_id
+
+    def add(self, peer_id: int):
+        with self.lock:
+            self.removed.discard(peer_id)
+            if not self._stored(peer_id):
+                self.added.add(peer_id)
+
+    def update(self, peer_ids: Iterable[int]):
+        for peer_id in peer_ids:
+            self.add(peer_id)
+
+    def discard(self, peer_id: int):
+        """Allows messaging the peer again (e.g. a message_allow event)."""
+        with self.lock:
+            self.added.discard(peer_id)
+            if self._stored(peer_id):
+                self.removed.add(peer_id)
+
+    def save(self):
+        """Merges pending changes into the sorted array and rewrites the file atomically."""
+        with self.save_lock:
+            with self.lock:
+                ids = self.ids
+                added, removed = set(self.added), set(self.removed)
+            if not added and not removed and os.path.exists(self.path):
+                return
+            if removed:
+                ids = array.array(self.TYPECODE, (p for p in ids if p not in removed))
+            merged = self._merge_sorted(ids, sorted(added))
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                merged.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            with self.lock:
+                self._ids = merged
+                # Written ids leave the pending sets, unless they were flipped while writing
+                for peer_id in added:
+                    if peer_id in self.added:
+                        self.added.discard(peer_id)
+                    else:
+                        self.removed.add(peer_id)
+                for peer_id in removed:
+                    if peer_id in self.removed:
+                        self.removed.discard(peer_id)
+                    else:
+                        self.added.add(peer_id)
+
+    @staticmethod
+    def _merge_sorted(ids: array.array, new_ids: list) -> array.array:
+        """Merges a few new ids into the big sorted array without re-sorting it."""
+        if not new_ids:
+            return ids
+        merged = array.array(SuppressionList.TYPECODE)
+        start = 0
+        for peer_id in new_ids:
+            i = bisect.bisect_left(ids, peer_id, start)
+            merged.extend(ids[start:i])
+            merged.append(peer_id)
+            start = i
+        merged.extend(ids[start:])
+        return merged
@@ -0,0 +1,61 @@
+import time
+import random
+import asyncio
+from activity_index import ActivityIndex
+from campaign import CampaignRunner, CampaignSettings
+from conversation_table import ConversationTable
+from vk_logic import VKManager
+
+
+def make_table(n=2000, seed=3):
+    rnd = random.Random(seed)
+    now = int(time.time())
+    rows = sorted(((peer_id, now - rnd.randrange(0, 800 * 86400)) for peer_id in range(1, n + 1)),
+                  key=lambda row: -row[1])
+    return ConversationTable([r[0] for r in rows], [r[1] for r in rows], ["" for _ in rows])
+
+
+def test_index_matches_filter_users():
+    async def run():
+        table = make_table()
+        index = ActivityIndex.from_table(table)
+        manager = VKManager("token", 1)
+        for min_days, max_days, limit in [(0, 365, 0), (7, 30, 0), (30, 7, 0), (0, 0, 0), (90, 1000, 50)]:
+            expected = await manager.filter_users(table, "activity", min_days, max_days, limit=limit)
+            selected = index.select(min_days, max_days, limit=limit)
+            assert set(selected) == set(expected)
+            if not limit:
+                assert index.count(min_days, max_days) == len(expected)
+        assert index.select(limit=10) == list(table.ids[:10])
+        assert index.count() == len(table)
+
+        denied = set(table.ids[:5])
+        assert index.select(exclude=denied, limit=3) == list(table.ids[5:8])
+
+        histogram = index.histogram()
+        assert sum(histogram) == len(table)
+        assert histogram[-1] == index.count(365, None)
+        await manager.close()
+
+    asyncio.run(run())
+
+
+def test_runner_reuses_index_until_store_changes(tmp_path):
+    async def run():
+        runner = CampaignRunner("token", 1, str(tmp_path))
+        now = int(time.time())
+        runner.store.upsert_many(
+            {'id': i, 'last_message_date': now - i * 86400 + 43200, 'last_message_text': ""} for i in range(1, 101)
+        )
+        count, histogram = await runner.preview(CampaignSettings(filter_type="activity", min_days=0, max_days=29))
+        assert count == 29 and sum(histogram) == 100
+        index = runner.activity_index
+        assert (await runner.preview(CampaignSettings(limit=10)))[0] == 10
+        assert runner.activity_index is index
+
+        runner.store.upsert_many([{'id': 500, 'last_message_date': now}])
+        assert (await runner.preview(CampaignSettings()))[0] == 101
+        assert runner.activity_index is not index
+        await runner.close()
+
+    asyncio.run(run())
@@ -0,0 +1,101 @@
+import io
+import os
+import json
+import asyncio
+import subprocess
+import sys
+from campaign import CampaignRunner, CampaignSettings
+from campaign_journal import CampaignJournal
+from fake_vk_server import FakeVkServer
+from rate_limiter import AdaptiveRateLimiter
+from vk_sender import ConsoleOutput, build_parser, settings_from_args
+from vk_transport import AsyncVkApiMethod
+from test_vk_logic import FakeApi
+
+
+def test_cli_arguments_override_campaign_file(tmp_path):
+    campaign = tmp_path / "spring.json"
+    campaign.write_text(json.dumps({
+        'message': "from file", 'filter_type': "activity", 'max_days': 30, 'attachment': "photo-1_1"
+    }), encoding="utf-8")
+    args = build_parser().parse_args([
+        "send", "--campaign", str(campaign), "--max-days", "7", "--attach", "photo-1_2",
+        "--attach", "doc-1_3", "--test", "--json"
+    ])
+    settings = settings_from_args(args)
+    assert settings.message == "from file"
+    assert settings.filter_type == "activity" and settings.max_days == 7
+    assert settings.attachments == ["photo-1_2", "doc-1_3"]
+    assert settings.test_mode and not settings.batch and args.json
+
+    campaign.write_text(json.dumps({'mesage': "typo"}), encoding="utf-8")
+    try:
+        settings_from_args(args)
+    except ValueError as e:
+        assert "mesage" in str(e)
+    else:
+        raise AssertionError("unknown key accepted")
+
+
+def test_runner_sends_headless_and_reports_json(tmp_path):
+    async def run():
+        runner = CampaignRunner("token", 1, str(tmp_path))
+        api = FakeApi(total=500)
+        runner.manager.api = api
+        runner.manager.vk = AsyncVkApiMethod(api)
+        stream = io.StringIO()
+        output = ConsoleOutput(as_json=True, stream=stream)
+        runner.log = output.log
+
+        assert not await runner.run(CampaignSettings(), output.on_progress)
+        ok = await runner.run(
+            CampaignSettings(message="hi", limit=50, test_mode=True), output.on_progress
+        )
+        await runner.close()
+        assert ok
+        events = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert events[0] == {'event': 'log', 'time': events[0]['time'], 'message': "Ошибка: Сообщение и вложения пусты."}
+        progress = [e for e in events if e['event'] == 'progress']
+        assert len(progress) == 51
+        assert progress[-1]['status'] == "Рассылка завершена." and progress[-1]['total'] == 50
+
+    asyncio.run(run())
+
+
+def test_send_errors_stay_in_the_json_stream(tmp_path, capsys):
+    async def run():
+        server = FakeVkServer(conversations=100, chat_every=0, error_rates={901: 0.3}, seed=3)
+        await server.start()
+        stream = io.StringIO()
+        output = ConsoleOutput(as_json=True, stream=stream)
+        runner = CampaignRunner("token", 1, str(tmp_path), log=output.log)
+        runner.manager.api.api_url = server.api_url
+        runner.manager.rate_limiter = runner.manager.api.rate_limiter = AdaptiveRateLimiter(rps=1000, burst=100)
+        assert await runner.run(CampaignSettings(message="hi", concurrency=8), output.on_progress)
+        await runner.close()
+        await server.stop()
+        return stream.getvalue()
+
+    (tmp_path / "upload_cache.json").write_text("{broken", encoding="utf-8")
+    text = asyncio.run(run())
+    events = [json.loads(line) for line in text.splitlines()]
+    assert any(e['event'] == 'log' and "901" in e['message'] for e in events)
+    assert any(e['event'] == 'log' and "кэша загрузок" in e['message'] for e in events)
+    assert capsys.readouterr().out == ""
+
+
+def test_cli_does_not_import_flet():
+    result = subprocess.run(
+        [sys.executable, "-c", "import sys, vk_sender; print('flet' in sys.modules)"],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    assert result.stdout.strip() == "False"
+
+
+def test_unfinished_campaigns_are_found_per_group(tmp_path):
+    journal = CampaignJournal.create(str(tmp_path), [1, 2], "hi", group_id=7)
+    journal.close()
+    assert CampaignJournal.find_unfinished(str(tmp_path), 7) == journal.path
+    assert CampaignJournal.find_unfinished(str(tmp_path), 8) is None
+    assert CampaignJournal.find_unfinished(str(tmp_path)) == journal.path
+    assert CampaignJournal.open(journal.path).group_id == 7
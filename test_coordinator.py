@@ -0,0 +1,101 @@
+import asyncio
+import coordinator
+from campaign import CampaignRunner, CampaignSettings
+from config_file import load_accounts
+from coordinator import CampaignCoordinator, MergedProgress, assign_shards
+from fake_vk_server import FakeVkServer
+from rate_limiter import AdaptiveRateLimiter
+from vk_transport import AsyncVkApiMethod
+from test_vk_logic import FakeApi
+
+
+def test_load_accounts_falls_back_to_single_pair():
+    assert load_accounts({'vk_token': "t", 'vk_group_id': "5"}) == [{'name': "5", 'vk_token': "t", 'vk_group_id': 5}]
+    config = {
+        'vk_token': "t", 'vk_group_id': 5,
+        'accounts': [{'vk_token': "a", 'vk_group_id': 1, 'name': "main"}, {'vk_token': "b", 'vk_group_id': 2}, {'name': "broken"}]
+    }
+    assert [a['name'] for a in load_accounts(config)] == ["main", "2"]
+
+
+def test_shared_users_are_balanced_between_shards():
+    shards = assign_shards([[1, 2, 3, 4, 5, 6], [4, 5, 6, 7], [6, 8]])
+    assert sorted(sum(shards, [])) == [1, 2, 3, 4, 5, 6, 7, 8]
+    assert shards[0] == [1, 2, 3]
+    assert sorted(len(s) for s in shards) == [2, 3, 3]
+
+
+def test_merged_progress_sums_shards():
+    events = []
+    merged = MergedProgress(lambda *args: events.append(args))
+    first, second = merged.shard("a"), merged.shard("b")
+    first(1, 10, "Пользователь 1: Успешно")
+    second(2, 5, "Пользователь 7: Ошибка [901]")
+    assert events[-1] == (3, 15, "Пользователь 7: Ошибка [901] [b]")
+
+
+def test_coordinator_runs_each_group_with_its_own_limiter(tmp_path, monkeypatch):
+    apis = {}
+
+    class ShardRunner(CampaignRunner):
+        def __init__(self, token, group_id, data_dir, log=print, metrics=None):
+            super().__init__(token, group_id, data_dir, log, metrics)
+            api = FakeApi(total=300)
+            if group_id == 2:
+                # Group 2 shares users 201..300 with group 1
+                for item in api.items:
+                    item['conversation']['peer']['id'] += 200
+            apis[group_id] = api
+            self.manager.api = api
+            self.manager.vk = AsyncVkApiMethod(api)
+
+    monkeypatch.setattr(coordinator, "CampaignRunner", ShardRunner)
+    accounts = [
+        {'name': "one", 'vk_token': "a", 'vk_group_id': 1},
+        {'name': "two", 'vk_token': "b", 'vk_group_id': 2},
+    ]
+
+    async def run():
+        progress = []
+        group = CampaignCoordinator(accounts, str(tmp_path), log=lambda message: None)
+        ok = await group.run(
+            CampaignSettings(message="hi", test_mode=True, stream=True), lambda *args: progress.append(args)
+        )
+        assert ok
+        users = [int(status.split()[1].rstrip(':')) for _c, _t, status in progress if status.startswith("Пользователь")]
+        # 294 users in each group (every 50th peer is a chat), 98 of them in both
+        assert len(users) == len(set(users)) == 294 + 294 - 98
+        assert progress[-1][0] == progress[-1][1] == 294 + 294 - 98
+        assert apis[1] is not apis[2]
+
+    asyncio.run(run())
+
+
+def test_coordinator_mails_the_open_runners_group_through_a_fork(tmp_path, monkeypatch):
+    class SecondRunner(CampaignRunner):
+        def __init__(self, *args, **kwargs):
+            raise AssertionError("group 1 files opened twice")
+
+    async def run():
+        server = FakeVkServer(conversations=50, chat_every=0)
+        await server.start()
+        window = CampaignRunner("token", 1, str(tmp_path), log=lambda message: None)
+        window.manager.api.api_url = server.api_url
+        window.manager.rate_limiter = AdaptiveRateLimiter(rps=1000, burst=100)
+        suppression = window.manager.suppression
+        monkeypatch.setattr(coordinator, "CampaignRunner", SecondRunner)
+
+        group = CampaignCoordinator(
+            [{'name': "one", 'vk_token': "token", 'vk_group_id': 1}], str(tmp_path),
+            log=lambda message: None, runner=window
+        )
+        assert await group.run(CampaignSettings(message="hi"), lambda *args: None)
+        assert server.delivered == 50
+        assert window.manager.suppression is suppression
+        # The window's runner is still open after the coordinator closed its shards
+        assert (await window.preview(CampaignSettings(message="hi")))[0] == 50
+
+        await window.close()
+        await server.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,57 @@
+import json
+import asyncio
+import benchmark
+from fake_vk_server import FakeVkServer
+from retry import RetryPolicy
+from vk_logic import VKManager
+
+
+def test_manager_against_fake_server_with_injected_errors(tmp_path):
+    async def run():
+        server = FakeVkServer(conversations=12_000, error_rates={901: 0.05, 502: 0.02}, seed=3)
+        await server.start()
+        manager = VKManager("token", 1, rps=1000, burst=100, api_url=server.api_url)
+        try:
+            conversations = await manager.fetch_conversations(batched=True, parallel=2)
+            # Every 50th dialog is a chat
+            assert len(conversations) == 12_000 - 240
+            assert server.calls['execute'] >= 3
+
+            user_ids = await manager.filter_users(conversations, "all", limit=500)
+            await manager.mailing_loop(
+                user_ids, "hi", 0, lambda *_: None, batch_size=100, concurrency=4,
+                retry_policy=RetryPolicy(base_delay=0.01)
+            )
+            failed = {entry['peer_id'] for entry in manager.dead_letters.entries}
+            assert server.errors[901] > 0
+            assert all(entry['code'] == 901 for entry in manager.dead_letters.entries)
+            assert server.delivered == 500 - len(failed)
+
+            photo = tmp_path / "banner.jpg"
+            photo.write_bytes(b"x" * 100_000)
+            server.error_rates = {}
+            assert (await manager.upload_photo(str(photo))).startswith("photo-1_")
+            assert server.uploaded_bytes == 100_000
+        finally:
+            await manager.close()
+            await server.stop()
+
+    asyncio.run(run())
+
+
+def test_benchmark_reports_json_and_flags_regressions(tmp_path):
+    output = tmp_path / "bench.json"
+    code = benchmark.main([
+        "--conversations", "6000", "--recipients", "200", "--uploads", "2", "--upload-size", "1024",
+        "--filter-runs", "2", "--no-memory", "--output", str(output)
+    ])
+    assert code == 0
+    report = json.loads(output.read_text())
+    assert set(report['results']) == {'fetch_conversations', 'filter_users', 'upload_photo', 'mailing_loop'}
+    for result in report['results'].values():
+        assert result['throughput'] > 0 and result['p99_ms'] >= result['p50_ms']
+
+    baseline = json.loads(output.read_text())
+    baseline['results']['mailing_loop']['throughput'] *= 10
+    assert benchmark.compare(report, baseline, 0.2)[0].startswith("mailing_loop:")
+    assert benchmark.compare(report, report, 0.2) == []
@@ -0,0 +1,52 @@
+import asyncio
+from campaign import CampaignRunner, CampaignSettings
+from fake_vk_server import FakeVkServer
+from frequency_cap import SendHistory
+from rate_limiter import AdaptiveRateLimiter
+
+DAY = 86400
+
+
+def test_history_keeps_a_ring_of_recent_sends(tmp_path):
+    history = SendHistory(str(tmp_path / "history.db"), slots=3)
+    now = 1_800_000_000
+    for days_ago in (10, 5, 3, 2):
+        history.record([1, 2], when=now - days_ago * DAY)
+    history.record([2], when=now)
+    history.flush()
+    stamps = history.load([1, 2, 3])
+    assert list(stamps[1]) == [now - 5 * DAY, now - 3 * DAY, now - 2 * DAY]
+    assert list(stamps[2]) == [now - 3 * DAY, now - 2 * DAY, now]
+    assert 3 not in stamps
+
+    assert history.allowed([3, 1, 2], max_sends=3, days=4, now=now) == [3, 1]
+    assert history.allowed([3, 1, 2], max_sends=1, days=1, now=now) == [3, 1]
+    assert history.allowed([1, 2, 3], max_sends=2, days=30, now=now) == [3]
+    assert history.allowed(range(1, 1000), max_sends=1, days=7, limit=2, now=now) == [3, 4]
+    history.close()
+
+
+def test_capped_users_are_skipped_by_the_next_campaign(tmp_path):
+    async def run():
+        server = FakeVkServer(conversations=200, chat_every=0)
+        await server.start()
+        runner = CampaignRunner("token", 1, str(tmp_path), log=lambda message: None)
+        runner.manager.api.api_url = server.api_url
+        runner.manager.rate_limiter = runner.manager.api.rate_limiter = AdaptiveRateLimiter(rps=1000, burst=100)
+
+        async def campaign(**settings):
+            before = server.delivered
+            assert await runner.run(CampaignSettings(message="hi", **settings), lambda *args: None)
+            return server.delivered - before
+
+        assert await campaign(limit=50, max_sends=1) == 50
+        user_ids = await runner.select_recipients(CampaignSettings(message="hi", limit=50, max_sends=1))
+        assert user_ids == list(range(51, 101))
+        assert await campaign(limit=120, max_sends=1) == 120
+        assert await campaign(max_sends=1) == 30
+        assert await campaign(max_sends=2, per_days=1) == 200
+
+        await runner.close()
+        await server.stop()
+
+    asyncio.run(run())
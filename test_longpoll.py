@@ -0,0 +1,172 @@
+import asyncio
+from aiohttp import web
+from conversation_store import ConversationStore
+from longpoll import BotsLongPoll
+from suppression import SuppressionList
+from vk_logic import VKManager
+
+
+class FakeLongPollServer:
+    """In-process VK API + Bots Long Poll server replaying a scripted event stream."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.key_requests = 0
+        self.sync_requests = 0
+        self.checks = []
+        self.conversations = [
+            {'conversation': {'peer': {'id': 30, 'type': 'user'}},
+             'last_message': {'date': 1_700_000_050, 'text': 'missed while offline'}},
+        ]
+        self.runner = None
+        self.base_url = None
+        self.closing = asyncio.Event()
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/method/{name}", self.api)
+        app.router.add_get("/lp", self.long_poll)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.base_url = f"http://127.0.0.1:{self.runner.addresses[0][1]}"
+
+    async def stop(self):
+        self.closing.set()
+        await self.runner.cleanup()
+
+    async def api(self, request):
+        name = request.match_info["name"]
+        if name == "groups.getLongPollServer":
+            self.key_requests += 1
+            return web.json_response({"response": {
+                "server": f"{self.base_url}/lp", "key": f"key{self.key_requests}", "ts": "100"
+            }})
+        if name == "messages.getConversations":
+            self.sync_requests += 1
+            return web.json_response({"response": {"count": len(self.conversations), "items": self.conversations}})
+        return web.json_response({"error": {"error_code": 3, "error_msg": "Unknown method"}})
+
+    async def long_poll(self, request):
+        self.checks.append((request.query["key"], request.query["ts"]))
+        if not self.script:
+            # Nothing left to replay: hold the request open like a real long poll
+            await self.closing.wait()
+            return web.json_response({"ts": request.query["ts"], "updates": []})
+        step = self.script.pop(0)
+        if step == "http_error":
+            return web.Response(status=502, text="bad gateway")
+        return web.json_response(step)
+
+
+def message_new(peer_id, date, text):
+    return {"type": "message_new", "object": {"message": {"peer_id": peer_id, "date": date, "text": text}}}
+
+
+def message_reply(peer_id, date, text):
+    return {"type": "message_reply", "object": {"peer_id": peer_id, "date": date, "text": text}}
+
+
+def message_deny(user_id, allow=False):
+    return {"type": "message_allow" if allow else "message_deny", "object": {"user_id": user_id}}
+
+
+def test_long_poll_keeps_store_fresh(tmp_path):
+    async def run():
+        server = FakeLongPollServer([
+            {"ts": "101", "updates": [message_new(10, 1_700_000_100, "hi"), message_new(2_000_000_001, 1_700_000_100, "chat")]},
+            {"failed": 2},
+            "http_error",
+            {"ts": "102", "updates": [message_reply(20, 1_700_000_200, "answer")]},
+            {"failed": 1, "ts": "150"},
+            {"ts": "151", "updates": [message_new(10, 1_700_000_300, "again")]},
+        ])
+        await server.start()
+        manager = VKManager("token", 1)
+        manager.api.api_url = f"{server.base_url}/method/"
+        store = ConversationStore(str(tmp_path / "conversations.db"))
+        store.set_watermark(1_700_000_000)
+        long_poll = BotsLongPoll(manager, store, retry_delay=0.01)
+        task = long_poll.start()
+        try:
+            for _ in range(200):
+                if not server.script and long_poll.is_live:
+                    break
+                await asyncio.sleep(0.02)
+
+            rows = {c['id']: c for c in store.load()}
+            assert rows[10]['last_message_text'] == "again"
+            assert rows[20]['last_message_text'] == "answer"
+            assert rows[30]['last_message_text'] == "missed while offline"
+            assert 2_000_000_001 not in rows
+
+            # initial connect, expired key, lost history
+            assert server.key_requests == 3
+            assert server.sync_requests == 2
+            # key refresh keeps ts, the failed HTTP poll is retried with the same ts
+            assert server.checks[1] == ("key1", "101")
+            assert server.checks[2] == ("key2", "101")
+            assert server.checks[3] == ("key2", "101")
+            assert long_poll.is_live
+        finally:
+            long_poll.stop()
+            await asyncio.gather(task, return_exceptions=True)
+            await manager.close()
+            await server.stop()
+            store.close()
+
+    asyncio.run(run())
+
+
+def test_unsubscribes_are_saved_as_they_arrive(tmp_path):
+    async def run():
+        server = FakeLongPollServer([
+            {"ts": "101", "updates": [message_deny(5), message_deny(6)]},
+            {"ts": "102", "updates": [message_deny(6, allow=True), message_new(10, 1_700_000_100, "hi")]},
+        ])
+        await server.start()
+        manager = VKManager("token", 1)
+        manager.api.api_url = f"{server.base_url}/method/"
+        path = str(tmp_path / "suppressed.bin")
+        manager.suppression = SuppressionList(path)
+        store = ConversationStore(str(tmp_path / "conversations.db"))
+        long_poll = BotsLongPoll(manager, store, retry_delay=0.01, save_interval=0.05)
+        task = long_poll.start()
+        try:
+            for _ in range(200):
+                saved = SuppressionList(path)
+                if len(server.checks) == 3 and 5 in saved and 6 not in saved:
+                    break
+                await asyncio.sleep(0.02)
+            # Saved without a campaign running
+            assert 5 in saved and 6 not in saved and len(saved) == 1
+        finally:
+            long_poll.stop()
+            await asyncio.gather(task, return_exceptions=True)
+            await manager.close()
+            await server.stop()
+            store.close()
+
+    asyncio.run(run())
+
+
+def test_changes_made_during_a_save_are_kept(tmp_path):
+    path = str(tmp_path / "suppressed.bin")
+    suppression = SuppressionList(path)
+    suppression.update([5, 6])
+    merge = suppression._merge_sorted
+
+    def merge_while_allowing(ids, new_ids):
+        # message_allow / message_deny handled on the loop while the thread writes
+        suppression.discard(6)
+        suppression.add(7)
+        return merge(ids, new_ids)
+
+    suppression._merge_sorted = merge_while_allowing
+    suppression.save()
+    suppression._merge_sorted = merge
+    assert 6 not in suppression and 7 in suppression
+    suppression.save()
+    saved = SuppressionList(path)
+    assert 5 in saved and 6 not in saved and 7 in saved and len(saved) == 2
@@ -0,0 +1,69 @@
+import json
+import asyncio
+import aiohttp
+from fake_vk_server import FakeVkServer
+from metrics import Histogram, dump_metrics, serve_metrics
+from retry import RetryPolicy
+from vk_logic import VKManager
+from vk_sender import build_parser
+
+
+def test_histogram_quantiles():
+    histogram = Histogram(buckets=(0.01, 0.1, 1.0))
+    for value in [0.005] * 90 + [0.05] * 9 + [5.0]:
+        histogram.observe(value)
+    assert histogram.counts == [90, 9, 0, 1]
+    assert histogram.quantile(0.5) == 0.01
+    assert histogram.quantile(0.99) == 0.1
+    assert histogram.quantile(1.0) == float("inf")
+
+
+def test_api_calls_are_measured_and_exported(tmp_path):
+    async def run():
+        server = FakeVkServer(conversations=3000, latency=0.002, error_rates={901: 0.1, 10: 0.05}, seed=5)
+        await server.start()
+        manager = VKManager("token", 1, rps=1000, burst=100, api_url=server.api_url)
+        endpoint = await serve_metrics(manager.metrics, port=0)
+        port = endpoint.addresses[0][1]
+        dump_path = str(tmp_path / "metrics.json")
+        dump = asyncio.create_task(dump_metrics(manager.metrics, dump_path, interval=0.05))
+        try:
+            user_ids = await manager.filter_users(await manager.fetch_conversations(batched=True), "all", limit=300)
+            await manager.mailing_loop(
+                user_ids, "hi", 0, lambda *_: None, concurrency=8, retry_policy=RetryPolicy(base_delay=0.01)
+            )
+            metrics = manager.metrics
+            sends = metrics.calls['messages.send']
+            assert sends == server.calls['messages.send'] >= 300
+            assert metrics.errors[('messages.send', '901')] == server.errors[901]
+            assert metrics.latency['messages.send'].count == sends
+            assert metrics.latency['messages.send'].quantile(0.5) >= 0.001
+            assert metrics.timings['rate_limiter_wait'].count == sum(metrics.calls.values())
+            assert metrics.gauge_peaks['send_queue_depth'] > 0
+
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"http://127.0.0.1:{port}/metrics") as resp:
+                    text = await resp.text()
+            assert f'vk_api_calls_total{{method="messages.send"}} {sends}' in text
+            assert 'vk_api_errors_total{method="messages.send",code="901"}' in text
+            assert f'vk_api_latency_seconds_bucket{{method="messages.send",le="+Inf"}} {sends}' in text
+            assert "vk_send_queue_depth_max" in text
+
+            summary = metrics.summary()
+            assert summary[0].startswith("messages.send: ")
+            assert any(line.startswith("Коды ошибок: ") and "901 ×" in line for line in summary)
+        finally:
+            dump.cancel()
+            await asyncio.gather(dump, return_exceptions=True)
+            await endpoint.cleanup()
+            await manager.close()
+            await server.stop()
+        with open(dump_path, encoding="utf-8") as f:
+            assert json.load(f)['calls']['messages.send'] == sends
+
+    asyncio.run(run())
+
+
+def test_cli_serves_metrics_on_localhost_by_default():
+    assert build_parser().parse_args(["send", "--metrics-port", "9100"]).metrics_host == "127.0.0.1"
+    assert build_parser().parse_args(["send", "--metrics-host", "0.0.0.0"]).metrics_host == "0.0.0.0"
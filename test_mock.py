@@ -1,48 +1,58 @@
 import asyncio
 import time
 from vk_logic import VKManager
+from simulator import ApiModel, simulate
 
-async def test_logic():
+async def run_logic():
     print("Starting mock test...")
-    
+
     # Mock VKManager to avoid real API calls
     class MockVKManager(VKManager):
         def __init__(self):
-            self.is_running = False
-            self.group_id = 123
-            
-        async def fetch_conversations(self):
+            super().__init__("token", 123)
+
+        async def fetch_conversations(self, batched=False, parallel=1):
             return [
                 {'id': 1, 'last_message_date': time.time() - 100, 'last_message_text': 'Hello!'},
                 {'id': 2, 'last_message_date': time.time() - 1000000, 'last_message_text': 'Bye.'},
                 {'id': 3, 'last_message_date': time.time() - 50, 'last_message_text': 'I want to buy something.'},
             ]
-            
-        async def send_message(self, user_id, message):
+
+        async def send_message(self, user_id, message, attachment="", random_id=None):
             print(f"Mock sending to {user_id}: {message}")
             await asyncio.sleep(0.1)
             return True
 
     manager = MockVKManager()
-    
+
     # Test filtering with range
     convs = await manager.fetch_conversations()
-    range_users = await manager.filter_users(convs, "activity", "", min_days=0, max_days=1)
+    range_users = await manager.filter_users(convs, "activity", min_days=0, max_days=1)
     print(f"Users in range 0-1 days: {range_users}")
     assert len(range_users) == 2 # IDs 1 and 3
-    
+
     # Test limit
-    limited_users = await manager.filter_users(convs, "all", "", limit=1)
+    limited_users = await manager.filter_users(convs, "all", limit=1)
     print(f"Limited users (limit=1): {limited_users}")
     assert len(limited_users) == 1
-    
-    # Test mailing loop in TEST MODE
-    print("Testing mailing loop in TEST MODE...")
+
+    # Test the mailing loop as a dry run (virtual clock, simulated API)
+    print("Testing mailing loop as a dry run...")
+    progress = []
     def on_progress(current, total, status):
         print(f"Progress: {current}/{total} - {status}")
-        
-    await manager.mailing_loop([1, 2, 3], "Test message", 0.1, on_progress, test_mode=True)
+        progress.append((current, total, status))
+
+    report = await asyncio.to_thread(
+        simulate, [1, 2, 3], "Test message", ApiModel(seed=1), on_progress, interval=0.1
+    )
+    assert progress[-1] == (3, 3, "Рассылка завершена.")
+    assert report['delivered'] == 3 and report['requests'] == 3
+    await manager.close()
     print("Mock test finished successfully!")
 
+def test_logic():
+    asyncio.run(run_logic())
+
 if __name__ == "__main__":
-    asyncio.run(test_logic())
+    test_logic()
@@ -0,0 +1,38 @@
+import asyncio
+from progress_reporter import ProgressReporter
+
+
+def test_progress_is_coalesced_into_frames():
+    async def run():
+        frames = []
+        reporter = ProgressReporter(
+            lambda r: frames.append((r.current, r.counts['sent'], r.counts['failed'], r.log_changed)),
+            fps=20, log_size=50
+        )
+        frame_loop = asyncio.create_task(reporter.run())
+        total = 20_000
+        for n in range(1, total + 1):
+            status = "Ошибка [901]" if n % 100 == 0 else "Успешно"
+            reporter.on_progress(n, total, f"Пользователь {n}: {status}")
+            if n % 1000 == 0:
+                await asyncio.sleep(0.01)
+        reporter.on_progress(total, total, "Рассылка завершена.")
+        await asyncio.sleep(0.1)
+        reporter.stop()
+        await asyncio.gather(frame_loop, return_exceptions=True)
+
+        # A handful of frames for 20k events, the last one with the final state
+        assert 1 < len(frames) < 50
+        assert frames[-1][:3] == (total, total - 200, 200)
+        # Only failures and summary lines are logged, and the log is bounded
+        assert len(reporter.lines) == 50
+        assert reporter.lines[-1].endswith("Рассылка завершена.")
+        assert reporter.lines[-2].endswith("Пользователь 20000: Ошибка [901]")
+        assert reporter.rate > 0
+
+        # Nothing changed, nothing rendered
+        count = len(frames)
+        reporter.flush()
+        assert len(frames) == count
+
+    asyncio.run(run())
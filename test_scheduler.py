@@ -0,0 +1,77 @@
+import time
+import asyncio
+from collections import Counter
+from datetime import datetime
+from campaign import CampaignRunner, CampaignSettings
+from fake_vk_server import FakeVkServer
+from rate_limiter import AdaptiveRateLimiter
+from scheduler import CampaignScheduler, FairShareLimiter, QuietHours, parse_start_time
+
+
+def test_quiet_hours_wrap_midnight():
+    quiet = QuietHours.parse("22-9")
+    late = datetime(2026, 10, 17, 23, 30).timestamp()
+    assert quiet.delay(late) == 9.5 * 3600
+    assert quiet.delay(datetime(2026, 10, 17, 8, 0).timestamp()) == 3600
+    assert quiet.delay(datetime(2026, 10, 17, 12, 0).timestamp()) == 0
+    assert QuietHours(9, 9).delay(late) == 0
+
+    noon = datetime(2026, 10, 17, 12, 0).timestamp()
+    assert parse_start_time("13:15", noon) == datetime(2026, 10, 17, 13, 15).timestamp()
+    assert parse_start_time("11:00", noon) == datetime(2026, 10, 18, 11, 0).timestamp()
+
+
+def test_busy_lanes_share_budget_by_weight():
+    async def run():
+        limiter = FairShareLimiter(AdaptiveRateLimiter(rps=1000, burst=1))
+        high, low = limiter.lane(3), limiter.lane(1)
+        grants = []
+
+        async def worker(lane, name):
+            while len(grants) < 200:
+                await lane.acquire()
+                grants.append(name)
+
+        tasks = [asyncio.create_task(worker(lane, name)) for lane, name in ((high, "high"), (low, "low")) for _ in range(4)]
+        await asyncio.gather(*tasks)
+        counts = Counter(grants[:200])
+        assert 2.5 <= counts["high"] / counts["low"] <= 3.5
+
+    asyncio.run(run())
+
+
+def test_campaigns_pause_and_stop_independently(tmp_path):
+    async def run():
+        server = FakeVkServer(conversations=400, chat_every=0)
+        await server.start()
+        runner = CampaignRunner("token", 1, str(tmp_path), log=lambda message: None)
+        runner.manager.api.api_url = server.api_url
+        runner.manager.rate_limiter = AdaptiveRateLimiter(rps=1000, burst=100)
+        scheduler = CampaignScheduler(runner, log=lambda message: None)
+        fast = scheduler.add(CampaignSettings(message="a", limit=100, concurrency=2), priority=2)
+        slow = scheduler.add(CampaignSettings(message="b", limit=20, interval=60), name="slow")
+        later = scheduler.add(CampaignSettings(message="c"), start_at=time.time() + 3600)
+        fast.pause()
+        task = scheduler.launch()
+
+        while slow.current < 1:
+            await asyncio.sleep(0.01)
+        assert fast.status == "paused" and fast.current == 0
+        fast.resume()
+        while fast.state != "finished":
+            await asyncio.sleep(0.01)
+
+        started = time.monotonic()
+        slow.stop()
+        later.stop()
+        await asyncio.wait_for(task, 5)
+        assert time.monotonic() - started < 1
+        assert (fast.state, slow.state, later.state) == ("finished", "stopped", "stopped")
+        assert fast.current == 100 and slow.current == 1
+        assert server.delivered == 101
+        assert runner.find_unfinished()  # the stopped campaign can be resumed
+
+        await runner.close()
+        await server.stop()
+
+    asyncio.run(run())
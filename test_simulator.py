@@ -0,0 +1,35 @@
+from simulator import ApiModel, simulate
+from vk_sender import api_model_from_args, build_parser
+
+
+def test_dry_run_projects_duration_without_waiting():
+    report = simulate(list(range(1, 3001)), "hi", ApiModel(latency=0.1, jitter=0, seed=1), concurrency=4)
+    assert report['delivered'] == 3000 and report['failed'] == 0
+    assert report['requests'] == 3000 and report['throttled'] == 0
+    # 15 rps after a burst of 5
+    assert 195 <= report['duration_seconds'] <= 205
+    assert report['wall_seconds'] < 10
+
+    batched = simulate(list(range(1, 3001)), "hi", ApiModel(seed=1), batch_size=100)
+    assert batched['requests'] == 30 and batched['duration_seconds'] < 5
+
+
+def test_error_model_predicts_failures_and_throttling():
+    model = ApiModel(error_rates={901: 0.05, 10: 0.05}, rps_limit=10, seed=7)
+    report = simulate(list(range(1, 2001)), "hi", model, concurrency=8)
+    assert report['delivered'] + report['failed'] == 2000
+    assert set(report['failed_by_code']) == {'901'}
+    assert 50 <= report['failed'] <= 150
+    # Error 10 is retried, and the 15 rps client trips the 10 rps server limit
+    assert report['failed_attempts_by_code']['10'] > 0
+    assert report['throttled'] > 0
+    assert report['requests'] > 2000
+    assert report['duration_seconds'] > 2000 / 10
+
+
+def test_cli_flags_override_config_model():
+    args = build_parser().parse_args(["send", "--dry-run", "--sim-latency", "0.3", "--sim-error", "901=0.1"])
+    model = api_model_from_args(args, {'simulation': {'latency': 0.05, 'error_rates': {'18': 0.01}, 'rps_limit': 5}})
+    assert args.test_mode
+    assert model.latency == 0.3 and model.rps_limit == 5
+    assert model.error_rates == {18: 0.01, 901: 0.1}
@@ -0,0 +1,43 @@
+import json
+import subprocess
+import sys
+from config_file import ConfigFile
+from startup_profile import compare
+
+
+def test_config_is_cached_and_written_through(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({'vk_token': "old", 'accounts': [{'vk_token': "a", 'vk_group_id': 2}]}), encoding="utf-8")
+    config = ConfigFile(str(path))
+    assert config.get("vk_token") == "old"
+
+    path.write_text("{}", encoding="utf-8")
+    assert config.get("vk_token") == "old"  # not re-read
+
+    assert config.update(vk_token="new", vk_group_id=5)
+    saved = json.loads(path.read_text(encoding="utf-8"))
+    assert saved == {'vk_token': "new", 'vk_group_id': 5, 'accounts': [{'vk_token': "a", 'vk_group_id': 2}]}
+    assert [account['vk_group_id'] for account in config.accounts()] == [2]
+    assert not (tmp_path / "config.json.tmp").exists()
+
+    assert not ConfigFile(str(tmp_path / "missing" / "config.json")).update(vk_token="x")
+
+
+def test_first_frame_imports_stay_light():
+    # What main.py imports before its window is drawn must not pull in the API stack
+    code = (
+        "import sys, startup_profile, config_file, progress_reporter, activity_index; "
+        "print(sorted({'aiohttp', 'vk_api', 'requests', 'sqlite3'} & set(sys.modules)))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+    baseline = {'results': {'import_campaign': {'median_ms': 300}, 'runner_init': {'median_ms': 4}, 'import_flet': None}}
+    report = {'results': {'import_campaign': {'median_ms': 400}, 'runner_init': {'median_ms': 9}, 'import_flet': None}}
+    assert compare(report, baseline, tolerance=0.2, min_delta=10) == ["import_campaign: 300 -> 400 ms (133%)"]
+
+
+def test_cli_does_not_load_the_fake_server():
+    code = "import sys, vk_sender; print('aiohttp.web' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
@@ -0,0 +1,120 @@
+import asyncio
+from aiohttp import web
+from vk_api.exceptions import ApiError, ApiHttpError
+from vk_transport import AsyncVkApi
+from rate_limiter import AdaptiveRateLimiter
+
+
+async def start_server(handler):
+    app = web.Application()
+    app.router.add_post("/method/{name}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/method/"
+
+
+async def check_transport():
+    calls = []
+
+    async def handler(request):
+        name = request.match_info["name"]
+        data = dict(await request.post())
+        calls.append((name, data))
+        if name == "messages.send":
+            if data.get("message") == "flood":
+                return web.json_response({"error": {"error_code": 6, "error_msg": "Too many requests per second"}})
+            return web.json_response({"error": {"error_code": 901, "error_msg": "Can't send"}})
+        if name == "broken.method":
+            return web.Response(status=502, text="bad gateway")
+        await asyncio.sleep(0.05)
+        return web.json_response({"response": [{"id": int(i)} for i in data["user_ids"].split(",")]})
+
+    runner, url = await start_server(handler)
+    limiter = AdaptiveRateLimiter(rps=1000, burst=100)
+    api = AsyncVkApi("token", api_url=url, rate_limiter=limiter)
+    vk = api.get_api()
+    try:
+        # Calls overlap instead of running back to back
+        started = asyncio.get_running_loop().time()
+        results = await asyncio.gather(*(vk.users.get(user_ids=[1, 2]) for _ in range(10)))
+        assert asyncio.get_running_loop().time() - started < 0.4
+        assert results[0] == [{"id": 1}, {"id": 2}]
+        assert calls[0][1]["access_token"] == "token"
+        assert calls[0][1]["v"] == api.api_version
+
+        try:
+            await vk.messages.send(peer_id=1, message="hi", random_id=0)
+            assert False, "ApiError expected"
+        except ApiError as e:
+            assert e.code == 901
+
+        try:
+            await vk.messages.send(peer_id=1, message="flood", random_id=0)
+            assert False, "ApiError expected"
+        except ApiError as e:
+            assert e.code == 6
+            assert limiter.rate == 500
+            assert limiter.tokens == 0
+
+        try:
+            await vk.broken.method()
+            assert False, "ApiHttpError expected"
+        except ApiHttpError as e:
+            assert "502" in str(e)
+    finally:
+        await api.close()
+        await runner.cleanup()
+
+
+def test_transport():
+    asyncio.run(check_transport())
+
+
+def test_slow_upload_outlives_the_api_timeout(tmp_path):
+    async def run():
+        async def handler(request):
+            # Drain the body slowly, like a big file over a slow uplink
+            async for _chunk in request.content.iter_chunked(64 * 1024):
+                await asyncio.sleep(0.05)
+            return web.json_response({"file": "ok"})
+
+        runner, url = await start_server(handler)
+        path = tmp_path / "video.mp4"
+        path.write_bytes(b"\0" * (1024 * 1024))
+        api = AsyncVkApi("token", timeout=0.5)
+        try:
+            assert await api.upload(url + "upload", "video_file", str(path)) == {"file": "ok"}
+        finally:
+            await api.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_rate_limiter_paces_and_recovers():
+    async def run():
+        loop = asyncio.get_running_loop()
+        limiter = AdaptiveRateLimiter(rps=50, burst=5, ramp_step=5, cooldown=0.1)
+        started = loop.time()
+        for _ in range(15):
+            await limiter.acquire()
+        # 5 from the burst, 10 more at 50 rps
+        assert 0.18 < loop.time() - started < 0.35
+
+        limiter.on_throttled()
+        assert limiter.rate == 25
+        started = loop.time()
+        await limiter.acquire()
+        assert loop.time() - started >= 0.1
+        for _ in range(10):
+            limiter.on_success()
+        assert limiter.rate == 50
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_transport()
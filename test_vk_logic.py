@@ -0,0 +1,553 @@
+import asyncio
+import re
+import time
+import vk_logic
+from vk_logic import VKManager, PAGE_SIZE, attachment_kind
+from conversation_store import ConversationStore
+from campaign_journal import CampaignJournal, derive_random_id
+from retry import RetryPolicy
+from suppression import SuppressionList
+from conversation_table import ConversationTable
+from profiles import MessageTemplate, ProfileCache
+from upload_cache import UploadCache
+from vk_api.exceptions import ApiError
+from vk_transport import AsyncVkApiMethod
+
+
+class FakeApi:
+    """In-memory stand-in for AsyncVkApi with a fixed list of conversations."""
+
+    def __init__(self, total=12000):
+        self.items = [self.conversation(n + 1, 1_700_000_000 - n, f'msg {n}', n % 50 == 0) for n in range(total)]
+        self.calls = []
+
+    @staticmethod
+    def conversation(peer_id, date, text, is_chat=False):
+        return {
+            'conversation': {'peer': {'id': peer_id, 'type': 'chat' if is_chat else 'user'}},
+            'last_message': {'date': date, 'text': text}
+        }
+
+    def new_message(self, peer_id, date, text):
+        self.items = [i for i in self.items if i['conversation']['peer']['id'] != peer_id]
+        self.items.insert(0, self.conversation(peer_id, date, text))
+
+    async def method(self, method, values=None, raw=False):
+        values = values or {}
+        self.calls.append(method)
+        total = len(self.items)
+        if method == 'messages.getConversations':
+            offset, count = int(values['offset']), int(values['count'])
+            return {'count': total, 'items': self.items[offset:offset + count]}
+        if method == 'execute':
+            offset = int(re.search(r'var offset = (\d+);', values['code']).group(1))
+            pages = int(re.search(r'while \(i < (\d+)\)', values['code']).group(1))
+            result = []
+            while pages and offset < total:
+                items = self.items[offset:offset + PAGE_SIZE]
+                result.append({
+                    'ids': [i['conversation']['peer']['id'] for i in items],
+                    'types': [i['conversation']['peer']['type'] for i in items],
+                    'dates': [i['last_message']['date'] for i in items],
+                    'texts': [i['last_message']['text'] for i in items],
+                })
+                offset += PAGE_SIZE
+                pages -= 1
+            return {'count': total, 'pages': result}
+        raise AssertionError(f"unexpected method {method}")
+
+    async def close(self):
+        pass
+
+
+def make_manager(api):
+    manager = VKManager("token", 1)
+    manager.api = api
+    manager.vk = AsyncVkApiMethod(api)
+    return manager
+
+
+def test_batched_fetch_matches_paged_fetch():
+    async def run():
+        api = FakeApi()
+        manager = make_manager(api)
+        paged = await manager.fetch_conversations()
+        paged_calls = len(api.calls)
+        api.calls.clear()
+        batched = await manager.fetch_conversations(batched=True, parallel=2)
+        assert batched == paged
+        assert paged_calls == 60
+        assert api.calls == ['execute'] * 3
+
+    asyncio.run(run())
+
+
+def test_incremental_sync_stops_at_watermark(tmp_path):
+    async def run():
+        api = FakeApi()
+        manager = make_manager(api)
+        store = ConversationStore(str(tmp_path / "conversations.db"))
+
+        first = await manager.sync_conversations(store)
+        assert len(first) == store.count() == 11760
+        assert store.get_watermark() == 1_699_999_999  # newest user dialog; peer 1 is a chat
+
+        api.new_message(500, 1_700_000_100, 'hello again')
+        api.new_message(999_999, 1_700_000_200, 'new user')
+        api.calls.clear()
+        second = await manager.sync_conversations(store)
+
+        assert api.calls == ['messages.getConversations']
+        assert second[0] == {'id': 999_999, 'last_message_date': 1_700_000_200, 'last_message_text': 'new user'}
+        assert second[1]['id'] == 500
+        assert len(second) == 11761
+        assert store.get_watermark() == 1_700_000_200
+        store.close()
+
+    asyncio.run(run())
+
+
+def test_batched_mailing_reports_each_user():
+    async def run():
+        sent = []
+
+        class SendApi(FakeApi):
+            async def method(self, method, values=None, raw=False):
+                assert method == 'messages.send'
+                peer_ids = list(values['peer_ids'])
+                sent.append(peer_ids)
+                return [
+                    {'peer_id': p, 'error': {'code': 901, 'description': "Can't send"}} if p % 7 == 0
+                    else {'peer_id': p, 'message_id': 0, 'conversation_message_id': 1}
+                    for p in peer_ids
+                ]
+
+        manager = make_manager(SendApi(total=0))
+        progress = []
+        await manager.mailing_loop(
+            list(range(1, 251)), "hi", 0, lambda *args: progress.append(args), batch_size=100
+        )
+        assert [len(chunk) for chunk in sent] == [100, 100, 50]
+        assert len(progress) == 251
+        assert progress[6] == (7, 250, "Пользователь 7: Ошибка [901]")
+        assert progress[7] == (8, 250, "Пользователь 8: Успешно")
+        assert progress[-1] == (250, 250, "Рассылка завершена.")
+
+    asyncio.run(run())
+
+
+def test_concurrent_mailing_keeps_order_and_stops():
+    async def run():
+        class SlowApi(FakeApi):
+            async def method(self, method, values=None, raw=False):
+                # Later recipients answer faster, so requests complete out of order
+                await asyncio.sleep(0.05 / values['peer_id'])
+                self.calls.append(values['peer_id'])
+                return 1
+
+        api = SlowApi(total=0)
+        manager = make_manager(api)
+        progress = []
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await manager.mailing_loop(list(range(1, 21)), "hi", 0, lambda *args: progress.append(args), concurrency=10)
+        assert loop.time() - started < 0.5
+        assert [p[0] for p in progress] == list(range(1, 21)) + [20]
+        assert progress[4] == (5, 20, "Пользователь 5: Успешно")
+
+        progress.clear()
+
+        def on_progress(current, total, status):
+            progress.append((current, total, status))
+            if current == 3:
+                manager.stop()
+
+        await manager.mailing_loop(list(range(1, 21)), "hi", 0.01, on_progress, concurrency=4)
+        assert progress[-2][2] == "Остановлено пользователем."
+        assert progress[-2][0] < 10
+        assert manager.workers == []
+
+    asyncio.run(run())
+
+
+def test_failing_progress_callback_ends_the_loop():
+    async def run():
+        manager = make_manager(FakeApi(total=0))
+
+        def on_progress(current, total, status):
+            if current == 3:
+                raise BrokenPipeError("stdout closed")
+
+        try:
+            await asyncio.wait_for(
+                manager.mailing_loop(list(range(1, 21)), "hi", 0, on_progress, concurrency=2), 2
+            )
+        except BrokenPipeError:
+            pass
+        else:
+            assert False, "the callback's error should propagate"
+        assert manager.workers == []
+
+    asyncio.run(run())
+
+
+def test_journal_resume_skips_delivered(tmp_path):
+    async def run():
+        sent = []
+
+        class SendApi(FakeApi):
+            async def method(self, method, values=None, raw=False):
+                peer_ids = list(values.get('peer_ids') or [values['peer_id']])
+                sent.append((tuple(peer_ids), values['random_id']))
+                if 'peer_ids' in values:
+                    return [{'peer_id': p, 'message_id': 0} for p in peer_ids]
+                return 1
+
+        manager = make_manager(SendApi(total=0))
+        user_ids = list(range(1, 11))
+        journal = CampaignJournal.create(str(tmp_path), user_ids, "hi", batch_size=3)
+
+        def stop_after_two(current, total, status):
+            if current == 6:
+                manager.stop()
+
+        await manager.mailing_loop(user_ids, "hi", 0, stop_after_two, batch_size=3, journal=journal)
+        journal.close()
+        first_run = list(sent)
+
+        path = CampaignJournal.find_unfinished(str(tmp_path))
+        assert path == journal.path
+        resumed = CampaignJournal.open(path)
+        assert resumed.delivered == {1, 2, 3, 4, 5, 6}
+        assert resumed.remaining() == [7, 8, 9, 10]
+
+        sent.clear()
+        progress = []
+        await manager.mailing_loop(
+            resumed.user_ids, resumed.message, 0, lambda *args: progress.append(args),
+            batch_size=resumed.batch_size, journal=resumed
+        )
+        resumed.close()
+        assert [peers for peers, _ in sent] == [(7, 8, 9), (10,)]
+        assert progress[-1] == (4, 4, "Рассылка завершена.")
+        # Same campaign + same position -> same random_id, so VK drops duplicates
+        assert first_run[0][1] == derive_random_id(journal.campaign_id, 0)
+        assert sent[0][1] == derive_random_id(journal.campaign_id, 6)
+        assert len({derive_random_id(journal.campaign_id, position) for position in range(100_000)}) == 100_000
+        assert CampaignJournal.find_unfinished(str(tmp_path)) is None
+        assert CampaignJournal.open(path).delivered == set(user_ids)
+
+    asyncio.run(run())
+
+
+def test_transient_failures_are_retried_and_permanent_dead_lettered(tmp_path):
+    async def run():
+        attempts = []
+
+        class FlakyApi(FakeApi):
+            async def method(self, method, values=None, raw=False):
+                peer_id = values['peer_id']
+                attempts.append(peer_id)
+                if peer_id == 2 and attempts.count(2) < 3:
+                    raise ApiError(None, method, values, False, {'error_code': 10, 'error_msg': "Internal server error"})
+                if peer_id == 4:
+                    raise ApiError(None, method, values, False, {'error_code': 901, 'error_msg': "Can't send"})
+                return 1
+
+        manager = make_manager(FlakyApi(total=0))
+        progress = []
+        await manager.mailing_loop(
+            [1, 2, 3, 4, 5], "hi", 0, lambda *args: progress.append(args),
+            retry_policy=RetryPolicy(base_delay=0.01)
+        )
+        # Peer 2 is retried in the background while 3..5 keep going
+        assert attempts[:5] == [1, 2, 3, 4, 5]
+        assert attempts.count(2) == 3
+        assert attempts.count(4) == 1
+        assert [p[2] for p in progress[:5]] == [
+            "Пользователь 1: Успешно",
+            "Пользователь 2: Успешно",
+            "Пользователь 3: Успешно",
+            "Пользователь 4: Ошибка [901]",
+            "Пользователь 5: Успешно",
+        ]
+        assert manager.failure_stats == {10: 2, 901: 1}
+        assert manager.dead_letters.entries == [{'peer_id': 4, 'code': 901, 'reason': "Can't send", 'attempts': 1}]
+        path = manager.dead_letters.export_csv(str(tmp_path / "failed.csv"))
+        assert open(path, encoding="utf-8").read().splitlines()[1] == "4,901,Can't send,1"
+
+    asyncio.run(run())
+
+
+def test_suppression_list_is_updated_from_failures(tmp_path):
+    async def run():
+        class DenyApi(FakeApi):
+            async def method(self, method, values=None, raw=False):
+                if values['peer_id'] % 2 == 0:
+                    raise ApiError(None, method, values, False, {'error_code': 901, 'error_msg': "Can't send"})
+                return 1
+
+        path = str(tmp_path / "suppressed.bin")
+        manager = make_manager(DenyApi(total=0))
+        manager.suppression = SuppressionList(path)
+        manager.suppression.update([10, 3_000_000_000])
+        await manager.mailing_loop([1, 2, 3, 4, 10], "hi", 0, lambda *args: None)
+
+        reloaded = SuppressionList(path)
+        assert list(reloaded.ids) == [2, 4, 10, 3_000_000_000]
+        assert len(reloaded) == 4
+        reloaded.discard(4)
+        assert 4 not in reloaded and 2 in reloaded and 5 not in reloaded
+
+        manager.suppression = reloaded
+        conversations = [{'id': i, 'last_message_date': time.time(), 'last_message_text': ''} for i in range(1, 6)]
+        assert await manager.filter_users(conversations, "all") == [1, 3, 4, 5]
+
+    asyncio.run(run())
+
+
+def test_columnar_filter_predicates():
+    async def run():
+        now = time.time()
+        conversations = [
+            {'id': i, 'last_message_date': int(now - i * 86400 - 60), 'last_message_text': 'Buy now' if i % 3 == 0 else 'hello'}
+            for i in range(1, 101)
+        ]
+        table = ConversationTable.from_dicts(conversations)
+        manager = make_manager(FakeApi(total=0))
+
+        assert await manager.filter_users(table, "activity", min_days=10, max_days=20) == list(range(10, 20))
+        assert await manager.filter_users(conversations, "activity", min_days=10, max_days=20, limit=3) == [10, 11, 12]
+        assert await manager.filter_users(table, "all", text_contains="BUY", exclude_ids={3, 6}, limit=2) == [9, 12]
+        assert await manager.filter_users(table, "all", include_ids={5, 50, 500}) == [5, 50]
+        assert await manager.filter_users(table, "unknown") == []
+        assert list(table.rows())[0] == conversations[0]
+
+    asyncio.run(run())
+
+
+def test_streaming_pipeline_sends_while_fetching_and_stops_at_limit(tmp_path):
+    async def run():
+        class StreamApi(FakeApi):
+            async def method(self, method, values=None, raw=False):
+                if method == 'messages.send':
+                    self.calls.append(('send', values['peer_id']))
+                    return 1
+                await asyncio.sleep(0.01)
+                return await super().method(method, values, raw)
+
+        now = int(time.time())
+        api = StreamApi(total=2000)
+        for item in api.items:
+            item['last_message']['date'] += now - 1_700_000_000
+        manager = make_manager(api)
+        journal = CampaignJournal.create(str(tmp_path), [], "hi")
+        progress = []
+
+        recipients = manager.stream_recipients("all", limit=450)
+        await manager.mailing_loop(recipients, "hi", 0, lambda *args: progress.append(args), journal=journal)
+        journal.close()
+
+        pages = [c for c in api.calls if c == 'messages.getConversations']
+        sends = [c for c in api.calls if c != 'messages.getConversations']
+        # 450 users need 3 pages of 200 (minus chats), not all 10
+        assert len(pages) == 3
+        assert len(sends) == 450
+        last_page = max(i for i, call in enumerate(api.calls) if call == 'messages.getConversations')
+        assert api.calls.index(sends[0]) < last_page
+        assert progress[-1] == (450, 450, "Рассылка завершена.")
+        assert len(CampaignJournal.open(journal.path).user_ids) == 450
+
+        # The activity window also cuts pagination short (one message per minute here)
+        api.calls.clear()
+        for n, item in enumerate(api.items):
+            item['last_message']['date'] = now - n * 60 - 30
+        ids = [page async for page in manager.stream_recipients("activity", min_days=0, max_days=0.2)]
+        assert len([c for c in api.calls if c == 'messages.getConversations']) == 2
+        assert sum(len(p) for p in ids) == 288 - 6
+
+    asyncio.run(run())
+
+
+def test_personalized_mailing_batches_profile_lookups():
+    async def run():
+        sent = {}
+
+        class ProfileApi(FakeApi):
+            async def method(self, method, values=None, raw=False):
+                self.calls.append(method)
+                if method == 'execute':
+                    parts = sorted(k for k in values if k.startswith('ids'))
+                    assert values['code'].count('API.users.get') == len(parts)
+                    return [[{'id': u, 'first_name': f"Name{u}", 'last_name': "X"} for u in values[k]] for k in parts]
+                if method == 'users.get':
+                    return [{'id': u, 'first_name': f"Name{u}", 'last_name': "X", 'city': {'id': 1, 'title': 'Omsk'}}
+                            for u in values['user_ids']]
+                sent[values['peer_id']] = values['message']
+                return 1
+
+        api = ProfileApi(total=0)
+        manager = make_manager(api)
+        user_ids = list(range(1, 30_001))
+        await manager.mailing_loop(
+            user_ids, "Hi, {first_name}! {{promo}}", 0, lambda *args: None,
+            batch_size=100, concurrency=50, personalize=True
+        )
+        assert api.calls.count('execute') == 2  # 30 chunks of 1000 ids, 25 per execute
+        assert api.calls.count('users.get') == 0
+        assert api.calls.count('messages.send') == 30_000
+        assert sent[12345] == "Hi, Name12345! {promo}"
+
+        # Cached profiles are reused; extra fields trigger a lookup only once
+        api.calls.clear()
+        profiles = await manager.get_user_info([1, 2, 3])
+        assert api.calls == [] and profiles[2]['first_name'] == "Name2"
+        template = MessageTemplate("{first_name} from {city}")
+        assert template.profile_fields == ['city']
+        profiles = await manager.get_user_info([1, 2], template.profile_fields)
+        await manager.get_user_info([1, 2], template.profile_fields)
+        assert api.calls == ['users.get']
+        assert template.render(profiles[1]) == "Name1 from Omsk"
+
+    asyncio.run(run())
+
+
+def test_personalized_prefetch_stays_ahead_of_a_small_cache(monkeypatch):
+    async def run():
+        class ProfileApi(FakeApi):
+            async def method(self, method, values=None, raw=False):
+                self.calls.append(method)
+                if method == 'users.get':
+                    return [{'id': u, 'first_name': f"Name{u}"} for u in values['user_ids']]
+                return 1
+
+        monkeypatch.setattr(vk_logic, "PROFILE_WINDOW", 1000)
+        api = ProfileApi(total=0)
+        manager = make_manager(api)
+        # Far smaller than the campaign, but holds two windows
+        manager.profiles = ProfileCache(max_size=2500)
+        await manager.mailing_loop(
+            list(range(1, 10_001)), "Hi, {first_name}!", 0, lambda *args: None, concurrency=20, personalize=True
+        )
+        # One lookup per window, no per-recipient fallbacks
+        assert api.calls.count('users.get') == 10
+        assert api.calls.count('messages.send') == 10_000
+
+    asyncio.run(run())
+
+
+def test_profile_cache_evicts_least_recently_used():
+    cache = ProfileCache(max_size=2)
+    cache.put({'id': 1})
+    cache.put({'id': 2})
+    cache.get(1)
+    cache.put({'id': 3})
+    assert cache.get(2) is None and cache.get(1) == {'id': 1} and len(cache) == 2
+    cache.ttl = -1
+    assert cache.get(1) is None
+
+
+def test_upload_cache_skips_repeat_uploads_and_refreshes_stale_ones(tmp_path):
+    async def run():
+        class UploadApi(FakeApi):
+            uploads = 0
+            deleted = set()
+
+            async def method(self, method, values=None, raw=False):
+                self.calls.append(method)
+                if method == 'photos.getMessagesUploadServer':
+                    return {'upload_url': 'https://upload.example/'}
+                if method == 'photos.saveMessagesPhoto':
+                    return [{'owner_id': -1, 'id': self.uploads}]
+                if method == 'messages.send':
+                    if values['attachment'] in self.deleted:
+                        raise ApiError(None, method, values, False, {
+                            'error_code': 100, 'error_msg': "One of the parameters specified was missing or invalid: attachment"
+                        })
+                    return 1
+                raise AssertionError(f"unexpected method {method}")
+
+            async def upload(self, upload_url, field, file_path):
+                self.uploads += 1
+                return {'server': 1, 'photo': '[]', 'hash': 'h'}
+
+        api = UploadApi(total=0)
+        manager = make_manager(api)
+        manager.upload_cache = UploadCache(str(tmp_path / "upload_cache.json"))
+        banner = tmp_path / "banner.jpg"
+        banner.write_bytes(b"jpeg")
+        copy = tmp_path / "copy.jpg"
+        copy.write_bytes(b"jpeg")
+
+        assert await manager.upload_photo(str(banner)) == "photo-1_1"
+        api.calls.clear()
+        # Same content under another name is served from the (reloaded) cache
+        manager.upload_cache = UploadCache(str(tmp_path / "upload_cache.json"))
+        assert await manager.upload_photo(str(copy)) == "photo-1_1"
+        assert api.calls == [] and api.uploads == 1
+
+        # VK forgot the photo: it is uploaded again once and the send retried
+        api.deleted.add("photo-1_1")
+        progress = []
+        await manager.mailing_loop(
+            [1, 2, 3], "hi", 0, lambda *args: progress.append(args),
+            attachment="photo-1_1", concurrency=3, retry_policy=RetryPolicy(base_delay=0.01)
+        )
+        assert api.uploads == 2
+        assert [p[2] for p in progress[:3]] == [f"Пользователь {n}: Успешно" for n in (1, 2, 3)]
+        assert manager.upload_cache.get(next(iter(manager.upload_cache.entries))) == "photo-1_2"
+
+    asyncio.run(run())
+
+
+def test_upload_files_in_parallel_reusing_upload_servers(tmp_path):
+    async def run():
+        class UploadApi(FakeApi):
+            active = 0
+            peak = 0
+            next_id = 0
+
+            async def method(self, method, values=None, raw=False):
+                self.calls.append(method)
+                self.next_id += 1
+                if method == 'photos.getMessagesUploadServer':
+                    return {'upload_url': 'https://upload.example/photo'}
+                if method == 'docs.getMessagesUploadServer':
+                    return {'upload_url': 'https://upload.example/doc'}
+                if method == 'video.save':
+                    return {'upload_url': f'https://upload.example/video{self.next_id}', 'owner_id': -1, 'video_id': self.next_id}
+                if method == 'photos.saveMessagesPhoto':
+                    return [{'owner_id': -1, 'id': values['photo']}]
+                if method == 'docs.save':
+                    return {'type': 'doc', 'doc': {'owner_id': -1, 'id': values['file']}}
+                raise AssertionError(f"unexpected method {method}")
+
+            async def upload(self, upload_url, field, file_path):
+                self.active += 1
+                self.peak = max(self.peak, self.active)
+                await asyncio.sleep(0.01)
+                self.active -= 1
+                if 'video' in upload_url:
+                    assert field == 'video_file'
+                    return {'size': 1}
+                name = file_path.rsplit('/', 1)[-1].split('.')[0]
+                return {'photo': name, 'server': 1, 'hash': 'h'} if field == 'photo' else {'file': name}
+
+        files = []
+        for name in ["1.jpg", "2.png", "3.jpg", "4.pdf", "5.mp4", "6.txt"]:
+            path = tmp_path / name
+            path.write_bytes(name.encode())
+            files.append(str(path))
+
+        api = UploadApi(total=0)
+        manager = make_manager(api)
+        assert [attachment_kind(f) for f in files] == ['photo', 'photo', 'photo', 'doc', 'video', 'doc']
+        result = await manager.upload_files(files, concurrency=3)
+        assert result[:4] == ["photo-1_1", "photo-1_2", "photo-1_3", "doc-1_4"]
+        assert result[4].startswith("video-1_") and result[5] == "doc-1_6"
+        assert api.peak == 3
+        # One upload server per kind, however many files of that kind
+        assert api.calls.count('photos.getMessagesUploadServer') == 1
+        assert api.calls.count('docs.getMessagesUploadServer') == 1
+
+    asyncio.run(run())
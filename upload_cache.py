@@ -0,0 +1,64 @@
+import os
+import json
+import hashlib
+from typing import Any, Callable, Dict, Optional
+from metrics import log_to_stderr
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of a file, read in chunks so large videos never sit in memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadCache:
+    """Content-addressed map of uploaded files to their VK attachment strings.
+
+    Keys look like `photo:<group_id>:<sha256>`, so the same banner is uploaded
+    once per group no matter what it is called on disk. Every change is written
+    through to a small JSON file.
+    """
+
+    def __init__(self, path: str, log: Callable[[str], None] = log_to_stderr):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                log(f"Ошибка чтения кэша загрузок: {e}")
+
+    @staticmethod
+    def make_key(kind: str, group_id: int, digest: str) -> str:
+        return f"{kind}:{group_id}:{digest}"
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        return entry['attachment'] if entry else None
+
+    def put(self, key: str, attachment: str, file_path: str):
+        self.entries[key] = {'attachment': attachment, 'path': os.path.abspath(file_path)}
+        self.save()
+
+    def invalidate(self, attachment: str) -> Optional[str]:
+        """Forgets a cached attachment VK no longer accepts; returns its source file."""
+        for key, entry in list(self.entries.items()):
+            if entry['attachment'] == attachment:
+                del self.entries[key]
+                self.save()
+                return entry['path']
+        return None
+
+    def __contains__(self, attachment: str) -> bool:
+        return any(entry['attachment'] == attachment for entry in self.entries.values())
+
+    def save(self):
+        # Per-process temp file: shard processes share one cache file
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self.path)
@@ -1,50 +1,216 @@
-import vk_api
+import os
 import time
+import uuid
+import random
 import asyncio
-import requests
-from typing import List, Dict, Any, Callable
+from collections import Counter
+from typing import List, Dict, Any, Callable, Optional, Tuple, Union, Container, Iterable, AsyncIterable, AsyncIterator
+from vk_transport import AsyncVkApi, API_URL
+from rate_limiter import AdaptiveRateLimiter
+from campaign_journal import CampaignJournal, derive_random_id
+from retry import RetryPolicy, DeadLetterList, classify_error, is_stale_attachment
+from suppression import SuppressionList, SUPPRESS_ERROR_CODES
+from frequency_cap import SendHistory
+from profiles import ProfileCache, MessageTemplate
+from upload_cache import UploadCache, file_digest
+from metrics import Metrics, log_to_stderr
+from delivery_status import user_status
+from conversation_store import ConversationStore
+from conversation_table import ConversationTable, contains_text, date_range, id_in, id_not_in, select
+
+PAGE_SIZE = 200  # messages.getConversations maximum
+EXECUTE_PAGES = 25  # execute allows at most 25 API calls
+MAX_PEER_IDS = 100  # messages.send peer_ids limit
+USERS_GET_LIMIT = 1000  # users.get user_ids limit
+MAX_ATTACHMENTS = 10  # messages.send attachment limit
+PROFILE_WINDOW = EXECUTE_PAGES * USERS_GET_LIMIT  # personalized recipients prefetched per execute call
+
+PHOTO_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif"}
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mov", ".mkv", ".webm", ".wmv", ".flv", ".3gp", ".mpeg", ".mpg"}
+# Multipart field name each upload server expects
+UPLOAD_FIELDS = {'photo': 'photo', 'doc': 'file', 'video': 'video_file'}
+
+# VKScript that pulls several getConversations pages and returns only the
+# columns we need, keeping the execute response small.
+CONVERSATIONS_SCRIPT = """
+var offset = %(offset)d;
+var pages = [];
+var total = 0;
+var i = 0;
+while (i < %(pages)d) {
+    var r = API.messages.getConversations({"group_id": %(group_id)d, "offset": offset, "count": %(count)d, "filter": "all"});
+    total = r.count;
+    pages.push({
+        "ids": r.items@.conversation@.peer@.id,
+        "types": r.items@.conversation@.peer@.type,
+        "dates": r.items@.last_message@.date,
+        "texts": r.items@.last_message@.text
+    });
+    offset = offset + %(count)d;
+    i = i + 1;
+    if (offset >= total) {
+        i = %(pages)d;
+    }
+}
+return {"count": total, "pages": pages};
+"""
+
+def attachment_kind(file_path: str) -> str:
+    """'photo', 'video' or 'doc' judging by the file extension."""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in PHOTO_EXTENSIONS:
+        return 'photo'
+    if extension in VIDEO_EXTENSIONS:
+        return 'video'
+    return 'doc'
+
 
 class VKManager:
-    def __init__(self, token: str, group_id: int):
+    def __init__(
+        self,
+        token: str,
+        group_id: int,
+        rps: float = 15,
+        burst: int = 5,
+        api_url: str = API_URL,
+        metrics: Optional[Metrics] = None,
+        rate_limiter: Optional[AdaptiveRateLimiter] = None,
+        log: Callable[[str], None] = log_to_stderr
+    ):
         self.token = token
+        # Send, upload and fetch errors; CampaignRunner passes its own `log`
+        self.log = log
         self.group_id = group_id
-        self.vk_session = vk_api.VkApi(token=token)
-        self.vk = self.vk_session.get_api()
+        # Pass the limiter of another manager to share one token's budget
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter(rps=rps, burst=burst)
+        self.metrics = metrics or Metrics()
+        self.api = AsyncVkApi(token, api_url=api_url, rate_limiter=self.rate_limiter, metrics=self.metrics)
+        self.vk = self.api.get_api()
         self.is_running = False
+        self.workers: List[asyncio.Task] = []
+        self.dead_letters = DeadLetterList()
+        self.failure_stats: Counter = Counter()
+        self.suppression: Optional[SuppressionList] = None
+        self.send_history: Optional[SendHistory] = None
+        self.profiles = ProfileCache()
+        self.upload_cache: Optional[UploadCache] = None
+        self.fetch_retry = RetryPolicy()
+        self.upload_servers: Dict[str, str] = {}
+        self.upload_lock = asyncio.Lock()
 
-    async def upload_photo(self, file_path: str) -> str:
-        """Uploads a local photo to VK and returns its attachment ID."""
+    async def close(self):
+        """Closes the pooled HTTP session."""
+        await self.api.close()
+
+    async def get_upload_server(self, kind: str, peer_id: int = 0) -> str:
+        """Upload URL for photos/docs; fetched once and reused for later files."""
+        async with self.upload_lock:
+            url = self.upload_servers.get(kind)
+            if url is None:
+                if kind == 'photo':
+                    server = await self.vk.photos.getMessagesUploadServer(peer_id=peer_id, group_id=self.group_id)
+                else:
+                    server = await self.vk.docs.getMessagesUploadServer(type='doc', peer_id=peer_id)
+                url = self.upload_servers[kind] = server['upload_url']
+            return url
+
+    async def upload_to_server(self, kind: str, file_path: str) -> str:
+        """Posts one file to VK and saves it; returns the attachment ID."""
+        if kind == 'video':
+            # Every video gets its own upload URL from video.save
+            video = await self.vk.video.save(name=os.path.basename(file_path), group_id=self.group_id)
+            await self.api.upload(video['upload_url'], 'video_file', file_path)
+            return f"video{video['owner_id']}_{video['video_id']}"
+
+        upload_url = await self.get_upload_server(kind)
         try:
-            # 1. Get upload server
-            upload_server = self.vk.photos.getMessagesUploadServer(peer_id=0, group_id=self.group_id)
-            upload_url = upload_server['upload_url']
-            
-            # 2. Upload file
-            with open(file_path, 'rb') as f:
-                files = {'photo': f}
-                response = requests.post(upload_url, files=files).json()
-            
-            # 3. Save photo
-            saved_photo = self.vk.photos.saveMessagesPhoto(
+            response = await self.api.upload(upload_url, UPLOAD_FIELDS[kind], file_path)
+            if 'error' in response:
+                raise RuntimeError(response['error'])
+        except Exception:
+            # The reused URL may have expired: forget it and try once with a fresh one
+            if self.upload_servers.get(kind) == upload_url:
+                del self.upload_servers[kind]
+            response = await self.api.upload(await self.get_upload_server(kind), UPLOAD_FIELDS[kind], file_path)
+
+        if kind == 'photo':
+            saved = (await self.vk.photos.saveMessagesPhoto(
                 photo=response['photo'],
                 server=response['server'],
                 hash=response['hash']
-            )[0]
-            
-            return f"photo{saved_photo['owner_id']}_{saved_photo['id']}"
+            ))[0]
+        else:
+            saved = (await self.vk.docs.save(file=response['file']))['doc']
+        return f"{kind}{saved['owner_id']}_{saved['id']}"
+
+    async def upload_file(self, file_path: str, kind: Optional[str] = None) -> str:
+        """Uploads a local photo, document or video and returns its attachment ID.
+
+        With an upload cache, a file whose content was already uploaded for
+        this group is not uploaded again.
+        """
+        kind = kind or attachment_kind(file_path)
+        try:
+            cache_key = None
+            if self.upload_cache is not None:
+                digest = await asyncio.to_thread(file_digest, file_path)
+                cache_key = UploadCache.make_key(kind, self.group_id, digest)
+                cached = self.upload_cache.get(cache_key)
+                if cached:
+                    return cached
+
+            attachment = await self.upload_to_server(kind, file_path)
+            if cache_key:
+                self.upload_cache.put(cache_key, attachment, file_path)
+            return attachment
         except Exception as e:
-            print(f"Error uploading photo: {e}")
+            self.log(f"Ошибка загрузки {kind} {file_path}: {e}")
             return ""
 
-    async def fetch_conversations(self) -> List[Dict[str, Any]]:
-        """Fetches all conversations for the group."""
+    async def upload_photo(self, file_path: str) -> str:
+        """Uploads a local photo to VK and returns its attachment ID."""
+        return await self.upload_file(file_path, 'photo')
+
+    async def upload_files(self, file_paths: List[str], concurrency: int = 4) -> List[str]:
+        """Uploads several files at once; results keep the order of `file_paths`.
+
+        A file that failed to upload gives an empty string in its place.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def upload(path: str) -> str:
+            async with semaphore:
+                return await self.upload_file(path)
+
+        return list(await asyncio.gather(*(upload(path) for path in file_paths)))
+
+    async def refresh_attachments(self, attachment: str) -> str:
+        """Re-uploads cached attachments VK rejected; other parts are kept as is."""
+        parts = []
+        for part in attachment.split(","):
+            path = self.upload_cache.invalidate(part) if self.upload_cache is not None else None
+            if path and os.path.exists(path):
+                kind = next((k for k in UPLOAD_FIELDS if part.startswith(k)), None)
+                part = await self.upload_file(path, kind) or part
+            parts.append(part)
+        return ",".join(parts)
+
+    async def fetch_conversations(self, batched: bool = False, parallel: int = 1) -> List[Dict[str, Any]]:
+        """Fetches all conversations for the group.
+
+        With `batched=True` up to 25 pages are packed into one `execute` call
+        (5000 conversations per round trip) and `parallel` batches may be in flight at once.
+        """
+        if batched:
+            return await self.fetch_conversations_batched(parallel=parallel)
+
         conversations = []
         offset = 0
-        count = 200
+        count = PAGE_SIZE
         
         try:
             while True:
-                response = self.vk.messages.getConversations(
+                response = await self.vk.messages.getConversations(
                     group_id=self.group_id,
                     offset=offset,
                     count=count,
@@ -71,97 +237,593 @@ class VKManager:
             
             return conversations
         except Exception as e:
-            print(f"Error fetching conversations: {e}")
+            self.log(f"Ошибка получения диалогов: {e}")
             return []
 
-    async def get_user_info(self, user_ids: List[int]) -> Dict[int, Dict[str, Any]]:
-        """Fetches user info (name, etc.) for a list of user IDs."""
+    async def fetch_conversations_page_batch(self, offset: int, pages: int = EXECUTE_PAGES) -> Dict[str, Any]:
+        """Fetches `pages` consecutive getConversations pages with a single execute call."""
+        code = CONVERSATIONS_SCRIPT % {
+            'group_id': int(self.group_id),
+            'offset': int(offset),
+            'count': PAGE_SIZE,
+            'pages': int(pages)
+        }
+        attempt = 0
+        while True:
+            try:
+                response = await self.vk.execute(code=code)
+                break
+            except Exception as e:
+                # One flood-control hiccup should not throw away a million-dialog fetch
+                attempt += 1
+                if not self.fetch_retry.should_retry(classify_error(e)['code'], attempt):
+                    raise
+                await asyncio.sleep(self.fetch_retry.delay(attempt))
+        conversations = []
+        for page in response.get('pages', []):
+            for user_id, peer_type, date, text in zip(page['ids'], page['types'], page['dates'], page['texts']):
+                if peer_type == 'user':
+                    conversations.append({
+                        'id': user_id,
+                        'last_message_date': date,
+                        'last_message_text': text or ''
+                    })
+        return {'count': response.get('count', 0), 'items': conversations}
+
+    async def fetch_conversations_batched(self, parallel: int = 1) -> List[Dict[str, Any]]:
+        """Fetches all conversations using execute batches, optionally several at once."""
+        step = PAGE_SIZE * EXECUTE_PAGES
         try:
-            users = self.vk.users.get(user_ids=user_ids)
-            return {u['id']: u for u in users}
+            first = await self.fetch_conversations_page_batch(0)
+            total = first['count']
+            offsets = list(range(step, total, step))
+            semaphore = asyncio.Semaphore(max(1, parallel))
+
+            async def fetch(offset):
+                async with semaphore:
+                    return await self.fetch_conversations_page_batch(offset)
+
+            # gather keeps the batches in offset order, i.e. newest first
+            rest = await asyncio.gather(*(fetch(offset) for offset in offsets))
+            conversations = first['items']
+            for batch in rest:
+                conversations.extend(batch['items'])
+            return conversations
         except Exception as e:
-            print(f"Error fetching user info: {e}")
-            return {}
+            self.log(f"Ошибка получения диалогов: {e}")
+            return []
 
-    async def send_message(self, user_id: int, message: str, attachment: str = "") -> bool:
-        """Sends a message to a specific user with optional attachments."""
+    async def sync_conversations(
+        self,
+        store: ConversationStore,
+        parallel: int = 1,
+        as_table: bool = False
+    ) -> Union[List[Dict[str, Any]], ConversationTable]:
+        """Brings the on-disk conversation index up to date and returns its contents.
+
+        The first sync downloads everything; later ones page through the newest
+        dialogs only until they reach the previous sync watermark.
+        """
+        watermark = store.get_watermark()
         try:
-            params = {
-                "peer_id": user_id,
-                "message": message,
-                "random_id": int(time.time() * 1000),
-                "group_id": self.group_id
-            }
-            if attachment:
-                params["attachment"] = attachment
-                
-            self.vk.messages.send(**params)
-            return True
+            if watermark is None:
+                conversations = await self.fetch_conversations_batched(parallel=parallel)
+                newest = max((c['last_message_date'] for c in conversations), default=0)
+                await asyncio.to_thread(store.upsert_many, conversations)
+            else:
+                newest = watermark
+                offset = 0
+                while True:
+                    response = await self.vk.messages.getConversations(
+                        group_id=self.group_id,
+                        offset=offset,
+                        count=PAGE_SIZE,
+                        filter="all"
+                    )
+                    items = response.get('items', [])
+                    if not items:
+                        break
+
+                    changed = []
+                    reached_watermark = False
+                    for item in items:
+                        date = item['last_message']['date']
+                        newest = max(newest, date)
+                        # Results are sorted by recency, so everything after this is already stored
+                        if date < watermark:
+                            reached_watermark = True
+                            break
+                        peer = item['conversation']['peer']
+                        if peer['type'] == 'user':
+                            changed.append({
+                                'id': peer['id'],
+                                'last_message_date': date,
+                                'last_message_text': item['last_message'].get('text', '')
+                            })
+                    await asyncio.to_thread(store.upsert_many, changed)
+
+                    offset += PAGE_SIZE
+                    if reached_watermark or offset >= response.get('count', 0):
+                        break
+
+            if newest:
+                store.set_watermark(newest)
         except Exception as e:
-            print(f"Error sending message to {user_id}: {e}")
-            return False
+            self.log(f"Ошибка синхронизации диалогов: {e}")
+
+        return await asyncio.to_thread(store.load_table if as_table else store.load)
+
+    async def iter_conversation_pages(
+        self,
+        oldest_date: Optional[float] = None,
+        store: Optional[ConversationStore] = None
+    ) -> AsyncIterator[ConversationTable]:
+        """Yields user conversations page by page, newest first.
+
+        Stops early once a page reaches conversations older than `oldest_date`.
+        Pages are also written to `store` if one is given.
+        """
+        offset = 0
+        while True:
+            response = await self.vk.messages.getConversations(
+                group_id=self.group_id,
+                offset=offset,
+                count=PAGE_SIZE,
+                filter="all"
+            )
+            items = response.get('items', [])
+            if not items:
+                return
+
+            table = ConversationTable()
+            for item in items:
+                peer = item['conversation']['peer']
+                if peer['type'] == 'user':
+                    table.append(peer['id'], item['last_message']['date'], item['last_message'].get('text', ''))
+            if store is not None:
+                await asyncio.to_thread(store.upsert_many, table.rows())
+            yield table
+
+            offset += PAGE_SIZE
+            if offset >= response.get('count', 0):
+                return
+            if oldest_date is not None and items[-1]['last_message']['date'] < oldest_date:
+                return
+
+    async def stream_recipients(
+        self,
+        filter_type: str,
+        min_days: int = 0,
+        max_days: int = 365,
+        limit: int = 0,
+        store: Optional[ConversationStore] = None,
+        frequency_cap: Optional[Tuple[int, float]] = None,
+        **filters
+    ) -> AsyncIterator[List[int]]:
+        """Fetches, filters and yields recipient ids page by page.
+
+        Pagination stops as soon as `limit` recipients were produced or, for the
+        activity filter, once conversations get older than `max_days`.
+        `frequency_cap` is (max_sends, days), checked against `self.send_history`.
+        """
+        oldest_date = time.time() - max_days * 86400 if filter_type == "activity" else None
+        collected = 0
+        capped = frequency_cap is not None and self.send_history is not None
+        async for table in self.iter_conversation_pages(oldest_date=oldest_date, store=store):
+            remaining = limit - collected if limit else 0
+            user_ids = await self.filter_users(
+                table, filter_type,
+                min_days=min_days,
+                max_days=max_days,
+                limit=0 if capped else remaining,
+                **filters
+            )
+            if capped and user_ids:
+                user_ids = await asyncio.to_thread(
+                    self.send_history.allowed, user_ids, *frequency_cap, limit=remaining
+                )
+            if user_ids:
+                collected += len(user_ids)
+                yield user_ids
+            if limit and collected >= limit:
+                return
+
+    async def get_user_info(self, user_ids: List[int], fields: Iterable[str] = ()) -> Dict[int, Dict[str, Any]]:
+        """Fetches user info (name, etc.) for a list of user IDs.
+
+        Profiles are served from `self.profiles` when cached; the rest are
+        requested in 1000-id users.get chunks, up to 25 chunks per execute call.
+        """
+        fields = sorted(set(fields))
+        try:
+            missing = self.profiles.missing(dict.fromkeys(user_ids), fields)
+            chunks = [missing[i:i + USERS_GET_LIMIT] for i in range(0, len(missing), USERS_GET_LIMIT)]
+            for i in range(0, len(chunks), EXECUTE_PAGES):
+                group = chunks[i:i + EXECUTE_PAGES]
+                if len(group) == 1:
+                    users = await self.vk.users.get(user_ids=group[0], fields=fields or None)
+                else:
+                    # Ids travel as execute arguments to keep the script itself tiny
+                    calls = ",".join(
+                        f'API.users.get({{"user_ids": Args.ids{n}, "fields": Args.fields}})'
+                        for n in range(len(group))
+                    )
+                    args = {f"ids{n}": chunk for n, chunk in enumerate(group)}
+                    response = await self.vk.execute(code=f"return [{calls}];", fields=fields, **args)
+                    users = [user for part in response for user in (part or [])]
+                for user in users:
+                    self.profiles.put(user, fields)
+        except Exception as e:
+            self.log(f"Ошибка получения профилей: {e}")
+
+        profiles = {}
+        for user_id in user_ids:
+            profile = self.profiles.get(user_id)
+            if profile is not None:
+                profiles[user_id] = profile
+        return profiles
+
+    async def send_to_peers(
+        self,
+        user_ids: List[int],
+        message: str,
+        attachment: str = "",
+        random_id: Optional[int] = None
+    ) -> Dict[int, Optional[Dict[str, Any]]]:
+        """Sends a message to one user (`peer_id`) or up to 100 users (`peer_ids`).
+
+        Returns a failure record ({'code': ..., 'reason': ...}) per user, None if delivered.
+        """
+        params = {
+            "message": message,
+            "random_id": random_id or random.getrandbits(31),
+            "group_id": self.group_id
+        }
+        if attachment:
+            params["attachment"] = attachment
+
+        try:
+            if len(user_ids) == 1:
+                await self.vk.messages.send(peer_id=user_ids[0], **params)
+                return {user_ids[0]: None}
+            response = await self.vk.messages.send(peer_ids=user_ids, **params)
+        except Exception as e:
+            self.log(f"Ошибка отправки {', '.join(map(str, user_ids))}: {e}")
+            failure = classify_error(e)
+            return {user_id: failure for user_id in user_ids}
+
+        results = {user_id: {'code': "missing", 'reason': "No result in response"} for user_id in user_ids}
+        for item in response:
+            if 'error' in item:
+                self.log(f"Ошибка отправки {item['peer_id']}: {item['error']}")
+                results[item['peer_id']] = {
+                    'code': item['error'].get('code'),
+                    'reason': item['error'].get('description', '')
+                }
+            else:
+                results[item['peer_id']] = None
+        return results
+
+    async def send_message(
+        self,
+        user_id: int,
+        message: str,
+        attachment: str = "",
+        random_id: Optional[int] = None
+    ) -> bool:
+        """Sends a message to a specific user with optional attachments."""
+        results = await self.send_to_peers([user_id], message, attachment=attachment, random_id=random_id)
+        return results[user_id] is None
 
     async def mailing_loop(
         self, 
-        user_ids: List[int], 
+        user_ids: Union[List[int], AsyncIterable[List[int]]], 
         message: str, 
         interval: float, 
         on_progress: Callable[[int, int, str], None],
-        test_mode: bool = False,
-        attachment: str = ""
+        attachment: str = "",
+        batch_size: int = 1,
+        concurrency: int = 1,
+        journal: Optional[CampaignJournal] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        personalize: bool = False
     ):
-        """Main mailing loop with progress updates and test mode."""
+        """Main mailing loop with progress updates.
+
+        Requests are paced by the shared rate limiter; `interval` only caps the
+        rate at one send per `interval` seconds (0 = as fast as the limiter allows).
+        With `batch_size > 1` users are messaged in `peer_ids` chunks (max 100),
+        one request and one interval per chunk. `concurrency` workers keep that
+        many requests in flight; progress is still reported in recipient order.
+
+        With a `journal` every outcome is recorded, recipients it already marks
+        as delivered are skipped (resume) and random_id is derived from the
+        campaign id and the recipient's position, so VK deduplicates sends
+        repeated after a crash.
+
+        Transient failures are re-queued with jittered backoff while other
+        recipients keep going; permanent ones end up in `self.dead_letters`.
+        `self.failure_stats` counts failed attempts per error code. Users that
+        refuse messages (901 etc.) are added to `self.suppression` and skipped.
+        Deliveries are recorded in `self.send_history` for frequency caps.
+        Dry runs drive this same loop against a simulated API (see
+        `simulator.simulate`).
+
+        `user_ids` may also be an async iterable of id pages (see
+        `stream_recipients`): sending starts with the first page while later
+        ones are still being fetched, and `total` grows as pages arrive.
+
+        With `personalize` the message is a MessageTemplate (`{first_name}` etc.)
+        rendered per recipient from profiles prefetched in bulk, one window of
+        PROFILE_WINDOW recipients just ahead of the workers; such messages
+        differ per user, so they are never sent as peer_ids chunks.
+        """
         self.is_running = True
-        total = len(user_ids)
-        
-        for i, user_id in enumerate(user_ids):
-            if not self.is_running:
-                on_progress(i, total, f"Остановлено пользователем.")
-                break
-            
-            if test_mode:
-                success = True
-                status = "Тест ОК (сообщение не отправлено)"
-            else:
-                success = await self.send_message(user_id, message, attachment=attachment)
-                status = "Успешно" if success else "Ошибка"
-            
-            on_progress(i + 1, total, f"Пользователь {user_id}: {status}")
-            
-            if i < total - 1:
-                await asyncio.sleep(interval)
+        self.dead_letters = DeadLetterList()
+        self.failure_stats = Counter()
+        retry_policy = retry_policy or RetryPolicy()
+        template = MessageTemplate(message) if personalize else None
+        if template and template.fields:
+            batch_size = 1
+        else:
+            template = None
+        batch_size = max(1, min(batch_size, MAX_PEER_IDS))
+        campaign_id = journal.campaign_id if journal else uuid.uuid4().hex
+        delivered = journal.delivered if journal else set()
+        suppression = self.suppression if self.suppression is not None else ()
+        streaming = not isinstance(user_ids, list)
+        chunks: List[List[int]] = []
+        random_ids: List[int] = []
+        position = 0
+        total = 0
+        queue: asyncio.Queue = asyncio.Queue()
+        workers_count = max(1, concurrency)
+        outstanding = 0
+        producing = True
+        exhausted = False
+
+        def release_workers():
+            if outstanding == 0 and not producing:
+                for _ in range(workers_count):
+                    queue.put_nowait(None)
+
+        def enqueue(original: List[int]):
+            nonlocal total, outstanding, position
+            # Chunk the original list first so a resumed chunk keeps its position and random_id
+            chunk = [
+                user_id for user_id in original
+                if user_id not in delivered and user_id not in suppression
+            ]
+            if chunk:
+                queue.put_nowait((len(chunks), chunk, 0))
+                chunks.append(chunk)
+                random_ids.append(derive_random_id(campaign_id, position))
+                total += len(chunk)
+                outstanding += 1
+            position += len(original)
+
+        async def produce():
+            nonlocal producing, exhausted
+            buffer: List[int] = []
+            try:
+                if streaming:
+                    async for page in user_ids:
+                        if journal:
+                            journal.add_recipients(page)
+                        if template:
+                            await self.get_user_info(page, template.profile_fields)
+                        buffer.extend(page)
+                        while len(buffer) >= batch_size:
+                            enqueue(buffer[:batch_size])
+                            del buffer[:batch_size]
+                else:
+                    buffer = user_ids
+                for i in range(0, len(buffer), batch_size):
+                    enqueue(buffer[i:i + batch_size])
+                exhausted = True
+            finally:
+                # Let idle workers exit even if the source failed or was cancelled
+                producing = False
+                release_workers()
+
+        loop = asyncio.get_running_loop()
+        next_slot = loop.time()
+        retry_handles: List[asyncio.TimerHandle] = []
+        # A cached upload VK no longer accepts is re-uploaded once per campaign
+        refresh_lock = asyncio.Lock()
+        refreshed = False
+        partial: Dict[int, Dict[int, Any]] = {}
+        finished: Dict[int, Dict[int, Any]] = {}
+        reported = 0
+        done = 0
+        profile_windows: Dict[int, asyncio.Task] = {}
+
+        async def fetch_profiles(ids: List[int]):
+            # Only warms self.profiles, the task keeps no result around
+            await self.get_user_info(ids, template.profile_fields)
+
+        def prefetch(window: int):
+            start = window * PROFILE_WINDOW
+            if window not in profile_windows and start < len(chunks):
+                ids = [chunk[0] for chunk in chunks[start:start + PROFILE_WINDOW]]
+                profile_windows[window] = asyncio.create_task(fetch_profiles(ids))
+
+        async def profile_for(index: int, user_id: int) -> Dict[str, Any]:
+            if not streaming:
+                # Fetch the worker's window and the next one, so the cache only
+                # ever needs to hold about two windows, however long the list
+                window = index // PROFILE_WINDOW
+                prefetch(window)
+                prefetch(window + 1)
+                await asyncio.shield(profile_windows[window])
+            profile = self.profiles.get(user_id)
+            if profile is None:
+                # Evicted from the cache since the prefetch
+                profile = (await self.get_user_info([user_id], template.profile_fields)).get(user_id, {})
+            return profile
+
+        def report():
+            # Chunks may finish out of order, only flush the contiguous prefix
+            nonlocal reported, done
+            while reported in finished:
+                results = finished.pop(reported)
+                for user_id in chunks[reported]:
+                    done += 1
+                    on_progress(done, total, user_status(user_id, results[user_id]))
+                reported += 1
+
+        def settle(index: int, results: Dict[int, Any]):
+            partial.setdefault(index, {}).update(results)
+            if len(partial[index]) == len(chunks[index]):
+                finished[index] = partial.pop(index)
+                report()
+
+        async def worker():
+            nonlocal next_slot, outstanding, attachment, refreshed
+            while self.is_running:
+                item = await queue.get()
+                if item is None:
+                    return
+                index, chunk, attempt = item
+                self.metrics.set_gauge('send_queue_depth', queue.qsize())
+                # Reserve a send slot so that `interval` caps the overall rate
+                now = loop.time()
+                slot = max(now, next_slot)
+                next_slot = slot + interval
+                if slot > now:
+                    self.metrics.observe('send_slot_wait', slot - now)
+                    await asyncio.sleep(slot - now)
+                text = message
+                if template:
+                    text = template.render(await profile_for(index, chunk[0]))
+                sent_attachment = attachment
+                results = await self.send_to_peers(
+                    chunk, text, attachment=sent_attachment, random_id=random_ids[index]
+                )
+                attempt += 1
+
+                stale = [
+                    user_id for user_id, failure in results.items()
+                    if failure is not None and is_stale_attachment(failure)
+                ]
+                if stale and self.upload_cache is not None:
+                    async with refresh_lock:
+                        if not refreshed and attachment == sent_attachment:
+                            refreshed = True
+                            attachment = await self.refresh_attachments(attachment)
+                    if attachment != sent_attachment:
+                        # Retry these recipients with the fresh upload
+                        for user_id in stale:
+                            results[user_id] = {'code': 'stale_attachment', 'reason': 'Re-uploaded'}
+
+                final = {}
+                retry = []
+                for user_id, failure in results.items():
+                    if failure is None:
+                        final[user_id] = None
+                        continue
+                    self.failure_stats[failure['code']] += 1
+                    if retry_policy.should_retry(failure['code'], attempt):
+                        retry.append(user_id)
+                    else:
+                        final[user_id] = failure
+                        self.dead_letters.add(user_id, failure, attempt)
+                        if self.suppression is not None and failure['code'] in SUPPRESS_ERROR_CODES:
+                            self.suppression.add(user_id)
+
+                if journal and final:
+                    journal.record_results(final)
+                if self.send_history is not None:
+                    if self.send_history.record(user_id for user_id, failure in final.items() if failure is None):
+                        await asyncio.to_thread(self.send_history.flush)
+                if retry:
+                    # Put the retry back on the queue later instead of holding this worker
+                    outstanding += 1
+                    retry_handles.append(loop.call_later(
+                        retry_policy.delay(attempt), queue.put_nowait, (index, retry, attempt)
+                    ))
+                settle(index, final)
+
+                outstanding -= 1
+                release_workers()
+
+        if streaming:
+            self.workers = [asyncio.create_task(produce())]
+        else:
+            # A plain list is chunked up front so `total` is known from the start
+            await produce()
+        self.workers += [asyncio.create_task(worker()) for _ in range(workers_count)]
+        error = None
+        try:
+            # A task that raises (on_progress, journal or history I/O) never settles its
+            # chunk, so the others would wait for it forever: stop them all instead
+            done_tasks, _ = await asyncio.wait(self.workers, return_when=asyncio.FIRST_EXCEPTION)
+            error = next((t.exception() for t in done_tasks if not t.cancelled() and t.exception()), None)
+        finally:
+            for task in self.workers:
+                task.cancel()
+            await asyncio.gather(*self.workers, return_exceptions=True)
+            self.workers = []
+            for handle in retry_handles:
+                handle.cancel()
+            for task in profile_windows.values():
+                task.cancel()
+            if journal:
+                journal.flush()
+            if self.suppression is not None:
+                await asyncio.to_thread(self.suppression.save)
+            if self.send_history is not None:
+                await asyncio.to_thread(self.send_history.flush)
+        if error:
+            raise error
+
+        if not exhausted or reported < len(chunks):
+            on_progress(done, total, f"Остановлено пользователем.")
+        elif journal:
+            journal.finish()
         
         self.is_running = False
         on_progress(total, total, "Рассылка завершена.")
 
     async def filter_users(
         self, 
-        conversations: List[Dict[str, Any]], 
+        conversations: Union[List[Dict[str, Any]], ConversationTable], 
         filter_type: str, 
         min_days: int = 0,
         max_days: int = 365,
-        limit: int = 0
+        limit: int = 0,
+        text_contains: str = "",
+        include_ids: Optional[Container[int]] = None,
+        exclude_ids: Optional[Container[int]] = None
     ) -> List[int]:
-        """Filters users based on the selected category and range."""
-        filtered_ids = []
+        """Filters users based on the selected category and range.
+
+        Conversations may be a list of dicts or a ConversationTable; predicates
+        are evaluated column-wise in one pass that stops once `limit` is reached.
+        """
+        table = conversations
+        if not isinstance(table, ConversationTable):
+            table = ConversationTable.from_dicts(conversations)
         now = time.time()
-        
-        for conv in conversations:
-            user_id = conv['id']
-            last_date = conv['last_message_date']
-            days_ago = (now - last_date) / 86400
-            
-            if filter_type == "activity":
-                if min_days <= days_ago <= max_days:
-                    filtered_ids.append(user_id)
-            elif filter_type == "all":
-                filtered_ids.append(user_id)
-        
-        # Apply limit if specified
-        if limit > 0:
-            filtered_ids = filtered_ids[:limit]
-                
-        return filtered_ids
+
+        predicates = []
+        if filter_type == "activity":
+            predicates.append(date_range(now - max_days * 86400, now - min_days * 86400))
+        elif filter_type != "all":
+            return []
+        if text_contains:
+            predicates.append(contains_text(text_contains))
+        if include_ids is not None:
+            predicates.append(id_in(include_ids))
+        if exclude_ids:
+            predicates.append(id_not_in(exclude_ids))
+        if self.suppression is not None and len(self.suppression):
+            predicates.append(id_not_in(self.suppression))
+
+        return select(table, predicates, limit=limit)
 
     def stop(self):
         self.is_running = False
+        # Cancel in-flight requests instead of waiting for them
+        for task in self.workers:
+            task.cancel()
@@ -0,0 +1,259 @@
+"""Headless entry point: run campaigns without the Flet window.
+
+    python -m vk_sender send --message "Привет!" --filter activity --max-days 30
+    python -m vk_sender send --campaign spring.json --json
+    python -m vk_sender send --message "Привет!" --all-accounts --processes
+    python -m vk_sender resume
+    python -m vk_sender schedule --plan week.json --quiet-hours 22-9
+
+Progress goes to stdout, one line per event (JSON lines with --json).
+Flet is never imported, so this works on a server under cron or systemd.
+"""
+import os
+import sys
+import json
+import signal
+import asyncio
+import argparse
+import time
+from typing import Awaitable, Callable, List, Optional
+from campaign import CampaignRunner, CampaignSettings, FILTER_TYPES
+from coordinator import CampaignCoordinator
+from config_file import load_accounts, load_config
+from metrics import Metrics, dump_metrics, serve_metrics
+from scheduler import CampaignScheduler, QuietHours
+from simulator import ApiModel, parse_error_rates
+
+
+def build_parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--config", default="config.json", help="файл с vk_token и vk_group_id")
+    common.add_argument("--token", help="токен сообщества (вместо config)")
+    common.add_argument("--group-id", type=int, help="ID группы (вместо config)")
+    common.add_argument("--json", action="store_true", help="выводить события в формате JSON lines")
+    common.add_argument("--concurrency", type=int, help="параллельных запросов")
+    common.add_argument("--interval", type=float, help="мин. интервал между отправками, сек")
+    common.add_argument("--metrics-port", type=int, help="отдавать метрики Prometheus на этом порту (/metrics)")
+    common.add_argument("--metrics-host", default="127.0.0.1", help="адрес для метрик (0.0.0.0 = все интерфейсы)")
+    common.add_argument("--metrics-file", help="сохранять метрики в JSON-файл каждые 10 с")
+
+    parser = argparse.ArgumentParser(prog="vk_sender", description="Рассылка сообщений ВКонтакте без GUI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    send = commands.add_parser("send", parents=[common], help="новая рассылка")
+    send.add_argument("--campaign", help="JSON-файл с параметрами рассылки; флаги ниже переопределяют его")
+    text = send.add_mutually_exclusive_group()
+    text.add_argument("--message", help="текст сообщения")
+    text.add_argument("--message-file", help="файл с текстом сообщения")
+    send.add_argument("--attach", action="append", default=None, help="вложение из ВК, напр. photo-1_2 (можно несколько)")
+    send.add_argument("--file", action="append", dest="files", default=None, help="локальный файл для загрузки (можно несколько)")
+    send.add_argument("--filter", dest="filter_type", choices=FILTER_TYPES)
+    send.add_argument("--min-days", type=int)
+    send.add_argument("--max-days", type=int)
+    send.add_argument("--limit", type=int)
+    send.add_argument("--text-contains")
+    send.add_argument("--max-sends", type=int, help="пропускать получивших столько сообщений за --per-days")
+    send.add_argument("--per-days", type=float, help="период ограничения частоты, дней (по умолчанию 7)")
+    send.add_argument("--batch", action="store_true", default=None, help="до 100 получателей за запрос")
+    send.add_argument("--stream", action="store_true", default=None, help="отправлять во время загрузки диалогов")
+    send.add_argument("--personalize", action="store_true", default=None, help="подставлять поля профиля в {}")
+    send.add_argument("--test", "--dry-run", dest="test_mode", action="store_true", default=None,
+                      help="симуляция без отправки: прогноз длительности, запросов и ошибок")
+    send.add_argument("--sim-latency", type=float, help="с --test: задержка ответа API, сек")
+    send.add_argument("--sim-error", action="append", help="с --test: КОД=ДОЛЯ, напр. 901=0.02 (можно несколько)")
+    send.add_argument("--all-accounts", action="store_true", help="все группы из списка accounts в config")
+    send.add_argument("--processes", action="store_true", help="с --all-accounts: каждая группа в своём процессе")
+
+    resume = commands.add_parser("resume", parents=[common], help="продолжить прерванную рассылку")
+    resume.add_argument("--journal", help="журнал рассылки (по умолчанию последний незавершённый)")
+
+    schedule = commands.add_parser("schedule", parents=[common], help="несколько рассылок по расписанию")
+    schedule.add_argument("--plan", required=True, help="JSON-файл со списком рассылок (приоритет, время запуска)")
+    schedule.add_argument("--quiet-hours", help="часы без отправки, напр. 22-9")
+    return parser
+
+
+def settings_from_args(args: argparse.Namespace) -> CampaignSettings:
+    data = {}
+    if args.campaign:
+        with open(args.campaign, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    if args.message_file:
+        with open(args.message_file, "r", encoding="utf-8") as f:
+            data['message'] = f.read()
+    elif args.message is not None:
+        data['message'] = args.message
+    if args.attach:
+        data['attachment'] = ",".join(args.attach)
+    for name in ('files', 'filter_type', 'min_days', 'max_days', 'limit', 'text_contains', 'interval',
+                 'concurrency', 'batch', 'stream', 'personalize', 'test_mode', 'max_sends', 'per_days'):
+        value = getattr(args, name)
+        if value is not None:
+            data[name] = value
+    return CampaignSettings.from_dict(data)
+
+
+class ConsoleOutput:
+    """Prints log lines and progress events; in JSON mode every line is an object."""
+
+    def __init__(self, as_json: bool = False, stream=sys.stdout):
+        self.as_json = as_json
+        self.stream = stream
+
+    def emit(self, event: dict):
+        if self.as_json:
+            line = json.dumps(event, ensure_ascii=False)
+        else:
+            text = event['message'] if event['event'] == 'log' else (
+                f"[{event['current']}/{event['total']}] {event['status']}"
+            )
+            line = f"[{time.strftime('%H:%M:%S', time.localtime(event['time']))}] {text}"
+        self.stream.write(line + "\n")
+        self.stream.flush()
+
+    def log(self, message: str):
+        self.emit({'event': 'log', 'time': time.time(), 'message': message})
+
+    def on_progress(self, current: int, total: int, status: str):
+        self.emit({'event': 'progress', 'time': time.time(), 'current': current, 'total': total, 'status': status})
+
+
+async def start_metrics_export(args: argparse.Namespace, metrics: Metrics, output: "ConsoleOutput") -> Callable[[], Awaitable[None]]:
+    """Starts the endpoint / periodic dump asked for on the command line; returns their cleanup."""
+    server = None
+    dump = None
+    if args.metrics_port:
+        try:
+            server = await serve_metrics(metrics, args.metrics_host, args.metrics_port)
+            output.log(f"Метрики: http://{args.metrics_host}:{args.metrics_port}/metrics")
+        except OSError as e:
+            output.log(f"Ошибка: не удалось открыть порт метрик: {e}")
+    if args.metrics_file:
+        dump = asyncio.create_task(dump_metrics(metrics, args.metrics_file, log=output.log))
+
+    async def stop():
+        if dump:
+            dump.cancel()
+            await asyncio.gather(dump, return_exceptions=True)
+        if server:
+            await server.cleanup()
+    return stop
+
+
+def install_stop_handlers(stop: Callable[[], None]):
+    """SIGINT/SIGTERM stop the campaign gracefully so the journal can be resumed."""
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C still raises KeyboardInterrupt
+
+
+async def run_all_accounts(args: argparse.Namespace, output: ConsoleOutput, config: dict) -> int:
+    accounts = load_accounts(config)
+    if not accounts:
+        output.log("Ошибка: в config.json нет аккаунтов.")
+        return 2
+    try:
+        settings = settings_from_args(args)
+    except (OSError, ValueError, TypeError) as e:
+        output.log(f"Ошибка: {e}")
+        return 2
+    coordinator = CampaignCoordinator(accounts, os.path.dirname(os.path.abspath(args.config)), log=output.log)
+    install_stop_handlers(coordinator.stop)
+    stop_export = await start_metrics_export(args, coordinator.metrics, output)
+    try:
+        ok = await coordinator.run(settings, output.on_progress, processes=args.processes)
+    finally:
+        await stop_export()
+    return 0 if ok else 1
+
+
+def api_model_from_args(args: argparse.Namespace, config: dict) -> ApiModel:
+    """Dry-run model: the "simulation" section of config.json, then --sim-* flags."""
+    model = ApiModel.from_dict(config.get("simulation") or {})
+    if getattr(args, "sim_latency", None) is not None:
+        model.latency = args.sim_latency
+    if getattr(args, "sim_error", None):
+        model.error_rates.update(parse_error_rates(args.sim_error))
+    return model
+
+
+async def run_schedule(args: argparse.Namespace, runner: CampaignRunner, output: ConsoleOutput) -> int:
+    scheduler = CampaignScheduler(runner, log=output.log)
+    try:
+        with open(args.plan, "r", encoding="utf-8") as f:
+            plan = json.load(f)
+        campaigns = scheduler.add_plan(plan, os.path.dirname(os.path.abspath(args.plan)))
+        if args.quiet_hours:
+            scheduler.quiet_hours = QuietHours.parse(args.quiet_hours)
+    except (OSError, ValueError, TypeError) as e:
+        output.log(f"Ошибка: {e}")
+        return 2
+    if not campaigns:
+        output.log("Ошибка: в плане нет рассылок.")
+        return 2
+    for campaign in campaigns:
+        campaign.callback = lambda current, total, status, name=campaign.name: (
+            output.on_progress(current, total, f"{status} [{name}]")
+        )
+    install_stop_handlers(scheduler.stop)
+    await scheduler.run()
+    return 0 if all(c.state == "finished" for c in campaigns) else 1
+
+
+async def run(args: argparse.Namespace, output: ConsoleOutput) -> int:
+    config = load_config(args.config, log=output.log)
+    if args.command == "send" and args.all_accounts:
+        return await run_all_accounts(args, output, config)
+    token = args.token or config.get("vk_token")
+    group_id = args.group_id or config.get("vk_group_id")
+    if not token or not group_id:
+        output.log("Ошибка: Настройки API не заданы (--token/--group-id или config.json).")
+        return 2
+
+    data_dir = os.path.dirname(os.path.abspath(args.config))
+    runner = CampaignRunner(token, int(group_id), data_dir, log=output.log)
+    try:
+        runner.api_model = api_model_from_args(args, config)
+    except (ValueError, TypeError) as e:
+        output.log(f"Ошибка: {e}")
+        await runner.close()
+        return 2
+    install_stop_handlers(runner.stop)
+    stop_export = await start_metrics_export(args, runner.manager.metrics, output)
+    try:
+        if args.command == "send":
+            try:
+                settings = settings_from_args(args)
+            except (OSError, ValueError, TypeError) as e:
+                output.log(f"Ошибка: {e}")
+                return 2
+            ok = await runner.run(settings, output.on_progress)
+        elif args.command == "schedule":
+            return await run_schedule(args, runner, output)
+        else:
+            ok = await runner.resume(
+                output.on_progress,
+                interval=args.interval or 0,
+                concurrency=args.concurrency or 4,
+                path=args.journal
+            )
+    finally:
+        await stop_export()
+        await runner.close()
+    return 0 if ok else 1
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    output = ConsoleOutput(as_json=args.json)
+    try:
+        return asyncio.run(run(args, output))
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
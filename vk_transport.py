@@ -0,0 +1,160 @@
+import os
+import time
+import aiohttp
+from typing import Any, Dict, Optional
+from vk_api.exceptions import ApiError, ApiHttpError
+from rate_limiter import AdaptiveRateLimiter, THROTTLE_ERROR_CODES
+from retry import classify_error
+from metrics import Metrics
+
+API_URL = "https://api.vk.com/method/"
+API_VERSION = "5.199"
+UPLOAD_READ_TIMEOUT = 120  # seconds an upload server may stay silent (e.g. while processing a video)
+
+
+class HttpResponse:
+    """Minimal response snapshot so vk_api's ApiHttpError can render itself."""
+
+    def __init__(self, status_code: int, text: str):
+        self.status_code = status_code
+        self.text = text
+        self.ok = 200 <= status_code < 300
+
+
+class AsyncVkApi:
+    """Async counterpart of vk_api.VkApi backed by a pooled keep-alive aiohttp session.
+
+    Raises the same ApiError / ApiHttpError exceptions as vk_api, so callers can
+    keep handling `error.code` exactly as before. Every method call goes through
+    the shared rate limiter, which also learns from throttling errors.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        api_version: str = API_VERSION,
+        api_url: str = API_URL,
+        pool_size: int = 100,
+        timeout: float = 30,
+        upload_timeout: float = UPLOAD_READ_TIMEOUT,
+        rate_limiter: Optional[AdaptiveRateLimiter] = None,
+        metrics: Optional[Metrics] = None
+    ):
+        self.token = token
+        self.api_version = api_version
+        self.api_url = api_url
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.upload_timeout = upload_timeout
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter()
+        self.metrics = metrics
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Returns the shared HTTP session, creating it inside the running loop."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    @staticmethod
+    def encode_values(values: Dict[str, Any]) -> Dict[str, str]:
+        """Converts API params to form fields the way vk_api.VkApiMethod does."""
+        encoded = {}
+        for key, value in values.items():
+            if value is None:
+                continue
+            if isinstance(value, (list, tuple, set)):
+                value = ",".join(str(v) for v in value)
+            elif isinstance(value, bool):
+                value = int(value)
+            encoded[key] = str(value)
+        return encoded
+
+    async def method(self, method: str, values: Optional[Dict[str, Any]] = None, raw: bool = False) -> Any:
+        """Calls an API method without blocking the event loop."""
+        values = self.encode_values(values or {})
+        values.setdefault("v", self.api_version)
+        if self.token:
+            values.setdefault("access_token", self.token)
+
+        queued = time.perf_counter()
+        await self.rate_limiter.acquire()
+        started = time.perf_counter()
+        if self.metrics:
+            self.metrics.observe('rate_limiter_wait', started - queued)
+        try:
+            response = await self.request(method, values, raw)
+            if "error" in response:
+                error = ApiError(self, method, values, raw, response["error"])
+                if error.code in THROTTLE_ERROR_CODES:
+                    self.rate_limiter.on_throttled()
+                raise error
+        except Exception as e:
+            if self.metrics:
+                self.metrics.observe_call(method, time.perf_counter() - started, classify_error(e)['code'])
+            raise
+
+        if self.metrics:
+            self.metrics.observe_call(method, time.perf_counter() - started)
+        self.rate_limiter.on_success()
+        return response if raw else response["response"]
+
+    async def request(self, method: str, values: Dict[str, str], raw: bool = False) -> Dict[str, Any]:
+        """One HTTP round trip; returns the decoded JSON body (errors included)."""
+        session = await self.get_session()
+        async with session.post(self.api_url + method, data=values) as resp:
+            if resp.status != 200:
+                raise ApiHttpError(self, method, values, raw, HttpResponse(resp.status, await resp.text()))
+            return await resp.json(content_type=None)
+
+    async def upload(self, upload_url: str, field: str, file_path: str) -> Dict[str, Any]:
+        """Posts a file to an upload server, streaming it from disk.
+
+        The session's total `timeout` is meant for API calls; a big file may
+        take minutes, so uploads only time out when the connection stalls.
+        """
+        session = await self.get_session()
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.upload_timeout)
+        started = time.perf_counter()
+        try:
+            with open(file_path, "rb") as f:
+                form = aiohttp.FormData()
+                form.add_field(field, f, filename=os.path.basename(file_path))
+                async with session.post(upload_url, data=form, timeout=timeout) as resp:
+                    if resp.status != 200:
+                        raise ApiHttpError(self, upload_url, {}, False, HttpResponse(resp.status, await resp.text()))
+                    return await resp.json(content_type=None)
+        finally:
+            if self.metrics:
+                self.metrics.observe('upload', time.perf_counter() - started)
+
+    def get_api(self) -> "AsyncVkApiMethod":
+        return AsyncVkApiMethod(self)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+class AsyncVkApiMethod:
+    """Attribute-style access to API methods: `await api.messages.send(...)`."""
+
+    def __init__(self, vk: AsyncVkApi, method: Optional[str] = None):
+        self._vk = vk
+        self._method = method
+
+    def __getattr__(self, name: str) -> "AsyncVkApiMethod":
+        if "_" in name:
+            # Same snake_case -> camelCase conversion as vk_api
+            parts = name.split("_")
+            name = parts[0] + "".join(p.title() for p in parts[1:])
+        method = f"{self._method}.{name}" if self._method else name
+        return AsyncVkApiMethod(self._vk, method)
+
+    async def __call__(self, **kwargs) -> Any:
+        return await self._vk.method(self._method, kwargs)